@@ -0,0 +1,106 @@
+# Concurrent /chat throughput benchmark.
+#
+# Drives the FastAPI app in-process through httpx's ASGI transport, so every request shares one event loop
+# exactly like a single uvicorn worker. Run it twice to compare the two execution models:
+#
+#   python benchmarks/chat_throughput.py            # blocking work offloaded to the thread pool (current)
+#   python benchmarks/chat_throughput.py --inline   # blocking work run directly on the event loop (old behaviour)
+#
+# Besides requests/second and latency percentiles it reports the worst event-loop stall observed by a ticker
+# task, which is what every other connection on the worker would have experienced. Local disks (or tmpfs) make
+# commits almost free; use --commit-latency-ms to emulate the fsync cost of slower production storage.
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+CONVERSATION = ["hi", "Explorer", "student", "data scientist", "resources", "interview tips", "salary", "projects",
+                "help", "thanks"]
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def with_commit_latency(run_db, delay: float):
+    def run_db_with_latency(operation, commit: bool = False, pool=None):
+        result = run_db(operation, commit=commit, pool=pool)
+        if commit:
+            time.sleep(delay)
+        return result
+    return run_db_with_latency
+
+
+async def loop_lag_monitor(stop: asyncio.Event, interval: float, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def simulate_user(app, rounds: int, latencies: list):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        await client.get("/")
+        for _ in range(rounds):
+            for message in CONVERSATION:
+                started = time.perf_counter()
+                response = await client.post("/chat", data={"message": message})
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="coach-bench-")
+    os.chdir(workdir)
+    logging.disable(logging.CRITICAL)
+
+    import coach
+
+    if args.inline:
+        coach.run_blocking = run_inline
+    if args.commit_latency_ms:
+        coach.run_db = with_commit_latency(coach.run_db, args.commit_latency_ms / 1000)
+    coach.init_db()
+
+    latencies, lag_samples = [], []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(stop, 0.005, lag_samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(coach.app, args.rounds, latencies) for _ in range(args.users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    coach.shutdown_blocking_executor()
+    coach.WRITE_JOURNAL.close()
+    coach.DB_POOL.close_all()
+    coach.JOURNAL_DB_POOL.close_all()
+
+    latencies.sort()
+    mode = "inline (event loop)" if args.inline else "offloaded (thread pool)"
+    print(f"mode:              {mode}")
+    print(f"concurrent users:  {args.users}")
+    print(f"commit latency:    {args.commit_latency_ms:.1f} ms")
+    print(f"/chat requests:    {len(latencies)}")
+    print(f"throughput:        {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50:       {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"latency p95:       {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms")
+    print(f"max loop stall:    {max(lag_samples, default=0.0) * 1000:.2f} ms")
+    print(f"commits per turn:  {coach.WRITE_JOURNAL.batches_committed / len(latencies):.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent /chat throughput.")
+    parser.add_argument("--users", type=int, default=32, help="number of concurrent chat sessions")
+    parser.add_argument("--rounds", type=int, default=5, help="conversation repetitions per session")
+    parser.add_argument("--commit-latency-ms", type=float, default=0.0, help="extra delay added to every commit")
+    parser.add_argument("--inline", action="store_true", help="run blocking work on the event loop (pre-offload)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+# Keyword matcher equivalence check and benchmark.
+#
+# Scans generated messages with the catalog's Aho-Corasick intent matcher and with the original `keyword in
+# msg_lower` checks over INTENT_KEYWORDS and every role keyword and name, fails on the first message where the matched
+# intents differ, then times both:
+#
+#   python benchmarks/keyword_matching.py                  # 20000 generated messages
+#   python benchmarks/keyword_matching.py --generated 200000 --seed 7
+#
+# Messages are built from whole keywords, keyword prefixes and suffixes (partial matches that must not fire), words
+# that overlap several keywords, filler words and punctuation, so failure links and shared outputs are exercised.
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+FILLER = [" ", " ", "  ", "i", "want", "the", "a", "what", "to", "my", "for", "about", "is", "and", ",", ".", "?", "!",
+          "\t", "x", "s", "-", "'", "é", "data", "design", "manager", "specialist", "career"]
+
+
+def reference_patterns(coach, catalog) -> list:
+    patterns = [(keyword, intent) for intent, keywords in coach.INTENT_KEYWORDS.items() for keyword in keywords]
+    for path_data in catalog.paths.values():
+        patterns.extend((keyword, 'discuss_role') for keyword in path_data['keywords'] + [path_data['name'].lower()])
+    return patterns
+
+
+def reference_scan(patterns: list, text: str) -> set:
+    return {intent for keyword, intent in patterns if keyword in text}
+
+
+def build_messages(patterns: list, generated: int, seed: int) -> list:
+    keywords = [keyword for keyword, _ in patterns]
+    fragments = keywords + [keyword[:-1] for keyword in keywords if len(keyword) > 1] + \
+        [keyword[1:] for keyword in keywords if len(keyword) > 1] + FILLER
+    messages = keywords + [""]
+    rng = random.Random(seed)
+    for _ in range(generated):
+        pieces = [rng.choice(fragments) for _ in range(rng.randint(1, 12))]
+        messages.append((" " if rng.random() < 0.5 else "").join(pieces))
+    return messages
+
+
+def time_scan(scan, messages: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            scan(message)
+    return (time.perf_counter() - started) / (repeat * len(messages))
+
+
+def main(args):
+    os.chdir(tempfile.mkdtemp(prefix="coach-bench-"))
+    logging.disable(logging.CRITICAL)
+
+    import coach
+
+    catalog = coach.CATALOG
+    patterns = reference_patterns(coach, catalog)
+    messages = build_messages(patterns, args.generated, args.seed)
+    for message in messages:
+        expected = reference_scan(patterns, message)
+        actual = catalog.intent_matcher.scan(message)
+        if actual != expected:
+            print(f"MISMATCH for {message!r}\n  substring checks: {sorted(expected)}\n  automaton:        {sorted(actual)}")
+            sys.exit(1)
+    print(f"equivalence check: {len(messages)} messages match ({len(patterns)} keywords)")
+
+    sample = messages[:args.timed]
+    substring = time_scan(lambda message: reference_scan(patterns, message), sample, args.repeat)
+    automaton = time_scan(catalog.intent_matcher.scan, sample, args.repeat)
+    print(f"substring checks:  {substring * 1e6:.1f} us/message")
+    print(f"automaton:         {automaton * 1e6:.1f} us/message ({substring / automaton:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark the intent keyword matcher.")
+    parser.add_argument("--generated", type=int, default=20000, help="number of generated messages to check")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated messages")
+    parser.add_argument("--timed", type=int, default=2000, help="messages in the timing sample")
+    parser.add_argument("--repeat", type=int, default=10, help="timing repetitions over the sample")
+    main(parser.parse_args())
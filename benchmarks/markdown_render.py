@@ -0,0 +1,110 @@
+# Markdown renderer golden check and benchmark.
+#
+# Renders a corpus with both the single-pass renderer in coach.py and the original chain of re.sub passes (kept
+# below as the reference), fails on the first difference, then times both and the rendered-HTML cache:
+#
+#   python benchmarks/markdown_render.py                  # catalog replies plus 20000 generated messages
+#   python benchmarks/markdown_render.py --generated 200000 --seed 7
+#
+# The corpus is every precomputed role reply, the help reply, and generated messages that mix headings, bullets,
+# emphasis, links and code with the edge cases the reference handles oddly (blank lines before bullets, bare
+# bullets, unclosed markers, spans that cross lines).
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+FRAGMENTS = ["*", "**", "_", "__", "-", "+", " ", "  ", "\n", "\n\n", "\t", "a", "x1", "word", "Mr_X", "### ", "#",
+             "[", "]", "(", ")", "](", "`", "<", "&", "'", '"', ".", ",", "\r", "\xa0", "- ", "\n- ", "\n* ",
+             "**Research**", "[docs](https://example.com)", "`pip install`"]
+
+
+def reference_render_markdown(text: str, escape_html) -> str:
+    if not isinstance(text, str): return str(text)
+
+    html = escape_html(text)
+
+    html = re.sub(r'^### (.*)', r'<h3>\1</h3>', html, flags=re.MULTILINE)
+    html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', html)
+    html = re.sub(r'__(.*?)__', r'<strong>\1</strong>', html)
+
+    html = re.sub(r'(?<![a-zA-Z0-9*])\*(?!\s|\*)([^\*\n]+?)(?<!\s|\*)\*(?![a-zA-Z0-9*])', r'<em>\1</em>', html)
+    html = re.sub(r'(?<![a-zA-Z0-9_])_(?!\s|_)([^_\n]+?)(?<!\s|_)_(?![a-zA-Z0-9_])', r'<em>\1</em>', html)
+
+    html = re.sub(r'^\s*[-*+]\s+(.*)', r'<li>\1</li>', html, flags=re.MULTILINE)
+
+    def wrap_list_items_server(match_obj):
+        list_items_content = match_obj.group(0)
+        cleaned_content = re.sub(r'</li>\s*(?:<br\s*\/?>\s*)+\s*<li>', '</li><li>', list_items_content)
+        cleaned_content = re.sub(r'^\s*(<br\s*\/?>\s*)+', '', cleaned_content)
+        cleaned_content = re.sub(r'(<br\s*\/?>\s*)+\s*$', '', cleaned_content)
+        return f"<ul>{cleaned_content}</ul>"
+
+    html = re.sub(r'(?:<li>.*?</li>\s*(?:<br\s*\/?>\s*)*)+', wrap_list_items_server, html, flags=re.DOTALL)
+
+    html = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', html)
+    html = re.sub(r'`([^`]+)`', r'<code>\1</code>', html)
+    html = html.replace("\n", "<br>")
+
+    html = re.sub(r'<ul><br\s*\/?>', '<ul>', html)
+    html = re.sub(r'<br\s*\/?></ul>', '</ul>', html)
+    html = re.sub(r'<li><br\s*\/?>', '<li>', html)
+    html = re.sub(r'<br\s*\/?></li>', '</li>', html)
+
+    return html
+
+
+def build_corpus(coach, generated: int, seed: int) -> list:
+    corpus = [reply.reply for reply in coach.CATALOG.role_replies.values()]
+    corpus.append("Hi Sam, " + coach.HELP_REPLY_SUFFIX)
+    rng = random.Random(seed)
+    for _ in range(generated):
+        corpus.append("".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 60))))
+    return corpus
+
+
+def time_renderer(render, corpus: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            render(text)
+    return (time.perf_counter() - started) / (repeat * len(corpus))
+
+
+def main(args):
+    os.chdir(tempfile.mkdtemp(prefix="coach-bench-"))
+    logging.disable(logging.CRITICAL)
+
+    import coach
+
+    corpus = build_corpus(coach, args.generated, args.seed)
+    for text in corpus:
+        expected = reference_render_markdown(text, coach.escape_html)
+        actual = coach.render_markdown(text)
+        if actual != expected:
+            print(f"MISMATCH for {text!r}\n  reference: {expected!r}\n  renderer:  {actual!r}")
+            sys.exit(1)
+    print(f"golden check:      {len(corpus)} messages identical")
+
+    replies = corpus[:len(coach.CATALOG.role_replies) + 1]
+    reference = time_renderer(lambda text: reference_render_markdown(text, coach.escape_html), replies, args.repeat)
+    single_pass = time_renderer(coach.render_markdown, replies, args.repeat)
+    cache = coach.RenderedHtmlCache()
+    cached = time_renderer(cache.render, replies, args.repeat)
+    print(f"reference passes:  {reference * 1e6:.1f} us/reply")
+    print(f"single pass:       {single_pass * 1e6:.1f} us/reply ({reference / single_pass:.1f}x)")
+    print(f"cached:            {cached * 1e6:.1f} us/reply ({reference / cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark the Markdown renderer.")
+    parser.add_argument("--generated", type=int, default=20000, help="number of generated messages to check")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated messages")
+    parser.add_argument("--repeat", type=int, default=50, help="timing repetitions over the reply corpus")
+    main(parser.parse_args())
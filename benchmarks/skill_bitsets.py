@@ -0,0 +1,164 @@
+# Skill bitset equivalence check and benchmark.
+#
+# Two checks against the JSON/set logic the bitsets replaced, each failing on the first difference, then timings:
+#
+#   python benchmarks/skill_bitsets.py                     # 2000 random profiles, 5000 stored users
+#   python benchmarks/skill_bitsets.py --profiles 20000 --users 50000 --seed 7
+#
+# Skill gap: for every random profile and every role, the matching and missing lists decoded from the bitsets must
+# equal the sorted set intersection and difference of normalized skill names (kept below as the reference).
+# Cohort counts: a fresh database is filled with random users, some written with the bitset a profile write stores and
+# some left for sync_skill_bitsets() to backfill, and count_users_missing_skills() must equal a count over the parsed
+# JSON skills, for every role, for desired-role cohorts and for everyone.
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+OFF_VOCABULARY_SKILLS = ["Juggling", "Cobol", "knitting", "Underwater Basket Weaving", "Rust", "", "  "]
+
+
+def reference_normalize(skill: str) -> str:
+    return skill.lower().strip().replace("_", " ")
+
+
+def reference_target_skills(path_data: dict) -> set:
+    required_skills_normalized = set(reference_normalize(skill) for skill in path_data['required_skills'])
+    soft_skills_emphasis_normalized = set(
+        reference_normalize(skill) for skill in path_data.get('soft_skills_emphasis', []))
+    return required_skills_normalized.union(soft_skills_emphasis_normalized)
+
+
+def reference_skill_gap(path_data: dict, possessed_raw: list):
+    all_target_skills = reference_target_skills(path_data)
+    possessed_normalized = set(reference_normalize(skill) for skill in possessed_raw)
+    missing_skills = sorted(list(all_target_skills - possessed_normalized))
+    matching_skills = sorted(list(all_target_skills.intersection(possessed_normalized)))
+    return missing_skills, matching_skills
+
+
+def bitset_skill_gap(catalog, role_key: str, possessed_raw: list):
+    role = catalog.roles[role_key]
+    possessed_bits = catalog.skills.encode(possessed_raw)
+    return (catalog.skills.decode(role.target_skill_bits & ~possessed_bits),
+            catalog.skills.decode(role.target_skill_bits & possessed_bits))
+
+
+def random_skill(rng: random.Random, catalog_skills: list) -> str:
+    # Profiles store skills as typed, so vary case, spacing and underscores around catalog names.
+    if rng.random() < 0.15:
+        return rng.choice(OFF_VOCABULARY_SKILLS)
+    skill = rng.choice(catalog_skills)
+    skill = rng.choice([skill, skill.title(), skill.upper(), skill.replace(" ", "_")])
+    return rng.choice(["", " "]) + skill + rng.choice(["", " "])
+
+
+def random_profiles(catalog, count: int, rng: random.Random) -> list:
+    catalog_skills = [skill for path_data in catalog.paths.values()
+                      for skill in path_data['required_skills'] + path_data.get('soft_skills_emphasis', [])]
+    return [[random_skill(rng, catalog_skills) for _ in range(rng.randint(0, 15))] for _ in range(count)]
+
+
+def reference_cohort_counts(rows: list, path_data: dict, role_key: str, desired_only: bool) -> dict:
+    target_skills = reference_target_skills(path_data)
+    counts = dict.fromkeys(target_skills, 0)
+    for desired_role_key, skills_json in rows:
+        if desired_only and desired_role_key != role_key:
+            continue
+        possessed_normalized = set(reference_normalize(skill) for skill in json.loads(skills_json))
+        for skill in target_skills - possessed_normalized:
+            counts[skill] += 1
+    return counts
+
+
+def fill_users(coach, profiles: list, rng: random.Random):
+    role_keys = list(coach.CATALOG.role_keys) + [None]
+    rows = []
+    for index, skills in enumerate(profiles):
+        values = coach.profile_column_values({'skills': skills}, ['skills', coach.SKILL_BITSET_COLUMN])
+        # Roughly a third of the rows predate the column, as after migration 3, and are left for the backfill.
+        skills_bitset = values[coach.SKILL_BITSET_COLUMN] if rng.random() < 0.7 else None
+        rows.append((f"bench-{index}", rng.choice(role_keys), values['skills'], skills_bitset))
+    coach.run_db(lambda conn: conn.executemany(
+        "INSERT INTO users (session_id, desired_role_key, skills, skills_bitset) VALUES (?, ?, ?, ?)", rows),
+        commit=True)
+    coach.sync_skill_bitsets()
+    return [(desired_role_key, skills_json) for _, desired_role_key, skills_json, _ in rows]
+
+
+def timed(operation, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter() - started) / repeat
+
+
+def main(args):
+    os.chdir(tempfile.mkdtemp(prefix="coach-bench-"))
+    logging.disable(logging.CRITICAL)
+
+    import coach
+
+    coach.init_db()
+    catalog = coach.CATALOG
+    rng = random.Random(args.seed)
+
+    profiles = random_profiles(catalog, args.profiles, rng)
+    for skills in profiles:
+        for role_key, path_data in catalog.paths.items():
+            expected = reference_skill_gap(path_data, skills)
+            actual = bitset_skill_gap(catalog, role_key, skills)
+            if actual != expected:
+                print(f"MISMATCH for {role_key} with skills {skills!r}\n  sets:    {expected!r}\n  bitsets: {actual!r}")
+                sys.exit(1)
+    print(f"skill gap check:   {len(profiles)} profiles x {len(catalog.roles)} roles identical")
+
+    stored = fill_users(coach, random_profiles(catalog, args.users, rng), rng)
+    for role_key, path_data in catalog.paths.items():
+        for desired_only in (True, False):
+            expected = reference_cohort_counts(stored, path_data, role_key, desired_only)
+            actual = coach.count_users_missing_skills(role_key, desired_only)
+            if actual != expected:
+                print(f"MISMATCH for {role_key} (desired_only={desired_only})\n  JSON:    {expected}\n"
+                      f"  bitsets: {actual}")
+                sys.exit(1)
+    print(f"cohort count check: {len(stored)} users x {len(catalog.roles)} roles identical")
+
+    sample = profiles[:args.timed]
+    role_items = list(catalog.paths.items())
+    sets = timed(lambda: [reference_skill_gap(path_data, skills) for skills in sample for _, path_data in role_items],
+                 args.repeat) / (len(sample) * len(role_items))
+    bitsets = timed(lambda: [bitset_skill_gap(catalog, role_key, skills) for skills in sample
+                             for role_key, _ in role_items], args.repeat) / (len(sample) * len(role_items))
+    print(f"skill gap, sets:    {sets * 1e6:.1f} us/profile-role")
+    print(f"skill gap, bitsets: {bitsets * 1e6:.1f} us/profile-role ({sets / bitsets:.1f}x)")
+
+    role_key, path_data = role_items[0]
+
+    def json_count():
+        rows = coach.run_db(lambda conn: conn.execute("SELECT desired_role_key, skills FROM users").fetchall())
+        return reference_cohort_counts(rows, path_data, role_key, False)
+
+    json_time = timed(json_count, args.repeat)
+    bitset_time = timed(lambda: coach.count_users_missing_skills(role_key, False), args.repeat)
+    print(f"cohort count, JSON:    {json_time * 1e3:.1f} ms ({len(stored)} users)")
+    print(f"cohort count, bitsets: {bitset_time * 1e3:.1f} ms ({json_time / bitset_time:.1f}x)")
+    coach.WRITE_JOURNAL.close()
+    coach.DB_POOL.close_all()
+    coach.JOURNAL_DB_POOL.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check and benchmark the skill bitsets.")
+    parser.add_argument("--profiles", type=int, default=2000, help="random profiles for the skill gap check")
+    parser.add_argument("--users", type=int, default=5000, help="stored users for the cohort count check")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated profiles")
+    parser.add_argument("--timed", type=int, default=500, help="profiles in the skill gap timing sample")
+    parser.add_argument("--repeat", type=int, default=5, help="timing repetitions")
+    main(parser.parse_args())
@@ -1,6 +1,8 @@
 import uvicorn
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Form, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+import abc
 import sqlite3
 import json
 import secrets
@@ -8,8 +10,36 @@ import datetime
 import re
 import logging
 import random
-
-from numpy import var
+import math
+import threading
+import os
+import mmap
+import zlib
+import zipfile
+import gzip
+import hashlib
+import queue
+import time
+import asyncio
+import functools
+import itertools
+import types
+import heapq
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # optional: without it static assets are offered gzip-compressed only
+    brotli = None
+
+try:
+    import fcntl  # POSIX-only; needed to share session generations between worker processes
+except ImportError:
+    fcntl = None
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO)
@@ -17,327 +47,2103 @@ logger = logging.getLogger(__name__)
 
 # --- Database Setup ---
 DB_NAME = "career_coach.db"
-USER_CONTEXT = {}  # In-memory store for conversation context: session_id -> {'data': dict, 'history_summary': str}
-
-# Enhanced Career Data with Tech and Non-Tech Roles
-CAREER_PATHS = {
-    "software_engineer": {
-        "name": "Software Engineer",
-        "keywords": ["software engineer", "developer", "coder", "programmer", "swe", "backend developer",
-                     "frontend developer", "full stack developer"],
-        "responsibilities_summary": "Designs, develops, tests, and maintains software applications. Collaborates with teams to build scalable and efficient solutions across various platforms.",
-        "required_skills": ["python", "java", "javascript", "c++", "c#", "ruby", "go", "data_structures", "algorithms",
-                            "git", "problem_solving", "api_design", "testing", "debugging", "agile_methodologies",
-                            "system_design"],
-        "soft_skills_emphasis": ["teamwork", "communication", "analytical_thinking", "adaptability",
-                                 "continuous_learning"],
-        "avg_salary_range": "$90,000 - $170,000 USD",
-        "common_next_steps": ["senior_software_engineer", "tech_lead", "engineering_manager", "solutions_architect",
-                              "principal_engineer"],
-        "learning_resources": {
-            "foundational": "CS50 (Harvard), freeCodeCamp (Full Stack Path), The Odin Project",
-            "python": "Official Python Docs, Real Python, 'Python Crash Course' (book)",
-            "java": "Oracle Java Tutorials, Udemy: Java Programming Masterclass, 'Head First Java' (book)",
-            "javascript": "MDN Web Docs, Eloquent JavaScript (book), Traversy Media (YouTube), Frontend Masters",
-            "data_structures_algorithms": "LeetCode, HackerRank, 'Cracking the Coding Interview' (book), 'Introduction to Algorithms' (CLRS)",
-            "git": "Pro Git (book), Atlassian Git Tutorial, GitHub Learning Lab",
-            "api_design": "REST API Design Rulebook (O'Reilly), Google API Design Guide, Postman Learning Center",
-            "testing": "pytest docs, JUnit docs, Jest/Mocha docs, 'Software Testing' (Ron Patton), Kent C. Dodds (Testing JavaScript)",
-            "agile": "Scrum Guide, Atlassian Agile Coach, 'Agile Estimating and Planning' (Mike Cohn)"
-        },
-        "interview_focus": ["Live coding (algorithms, data structures)", "System design (scalability, trade-offs)",
-                            "Behavioral questions (STAR method)", "Debugging scenarios",
-                            "Knowledge of specific tech stack"],
-        "example_projects": ["Develop a full-stack web application (e.g., e-commerce site, social media clone)",
-                             "Build a mobile app (iOS or Android)", "Contribute to an open-source project",
-                             "Create a command-line tool with complex logic", "Develop a browser extension"]
-    },
-    "data_scientist": {
-        "name": "Data Scientist",
-        "keywords": ["data scientist", "data analyst", "machine learning engineer", "ai specialist",
-                     "quantitative analyst"],
-        "responsibilities_summary": "Collects, analyzes, and interprets large datasets to identify trends and insights. Develops machine learning models, designs experiments, and communicates findings to stakeholders to drive decision-making.",
-        "required_skills": ["python", "r", "sql", "machine_learning", "deep_learning", "statistics", "probability",
-                            "data_visualization", "pandas", "numpy", "scikit-learn", "tensorflow", "pytorch",
-                            "communication", "big_data_technologies", "experiment_design"],
-        "soft_skills_emphasis": ["critical_thinking", "problem_solving", "storytelling_with_data", "curiosity",
-                                 "business_acumen"],
-        "avg_salary_range": "$100,000 - $190,000 USD",
-        "common_next_steps": ["senior_data_scientist", "lead_data_scientist", "ml_ops_engineer", "ai_researcher",
-                              "analytics_manager", "head_of_data_science"],
-        "learning_resources": {
-            "foundational": "Coursera: Machine Learning (Andrew Ng), Kaggle Learn, DataCamp/DataQuest",
-            "python_for_ds": "'Python for Data Analysis' (Wes McKinney), 'Applied Text Analysis with Python' (Benjamin Bengfort et al.)",
-            "r": "R for Data Science (book/website), Swirl (interactive R package)",
-            "sql": "SQLZoo, Mode Analytics SQL Tutorial, LeetCode SQL, 'SQL for Data Scientists' (Renee Teate)",
-            "machine_learning": "fast.ai, 'Hands-On Machine Learning' (Aurélien Géron), Stanford CS229",
-            "statistics": "Khan Academy Statistics, StatQuest (YouTube), 'The Elements of Statistical Learning' (book), MIT OpenCourseware Statistics",
-            "data_visualization": "Tableau Public, Seaborn/Matplotlib docs, 'Storytelling with Data' (Cole Knaflic), D3.js tutorials"
-        },
-        "interview_focus": ["Statistical concepts and probability",
-                            "ML model intuition, implementation, and evaluation",
-                            "Data wrangling and cleaning (Python/R/SQL)", "Case studies and product sense",
-                            "Communicating complex results simply", "A/B testing and experimental design"],
-        "example_projects": ["Analyze a public dataset to uncover novel insights (e.g., Kaggle competition)",
-                             "Build a predictive model for a specific business problem (e.g., churn, fraud)",
-                             "Create an interactive data dashboard (e.g., using Plotly Dash, R Shiny, Tableau)",
-                             "Develop a recommendation system", "Perform causal inference analysis"]
-    },
-    "product_manager": {
-        "name": "Product Manager",
-        "keywords": ["product manager", "pm", "product owner", "technical product manager"],
-        "responsibilities_summary": "Defines product vision, strategy, and roadmap. Works with cross-functional teams (engineering, design, marketing, sales) to build, launch, and iterate on successful products that meet user needs and business goals.",
-        "required_skills": ["market_research", "user_research", "user_experience_design_principles",
-                            "agile_methodologies", "scrum", "communication", "leadership", "data_analysis",
-                            "product_strategy", "stakeholder_management", "prioritization", "roadmapping",
-                            "a_b_testing_analysis", "product_analytics_tools"],
-        "soft_skills_emphasis": ["empathy", "strategic_thinking", "influence_without_authority", "decisiveness",
-                                 "collaboration", "storytelling"],
-        "avg_salary_range": "$115,000 - $220,000 USD",
-        "common_next_steps": ["senior_product_manager", "group_product_manager", "director_of_product", "vp_of_product",
-                              "entrepreneur", "product_lead"],
-        "learning_resources": {
-            "foundational": "Product School, 'Inspired' (Marty Cagan), 'Cracking the PM Interview' (Gayle McDowell), 'The Lean Product Playbook' (Dan Olsen)",
-            "market_research": "HubSpot Market Research Guide, Nielsen Norman Group (user research articles)",
-            "ux_principles": "'Don't Make Me Think' (Steve Krug), Laws of UX (website), 'About Face' (Alan Cooper)",
-            "agile_pm": "Aha! Academy, 'User Story Mapping' (Jeff Patton), Scrum.org resources",
-            "data_analysis_for_pm": "Amplitude blog, Mixpanel resources, basic SQL/Excel skills, Reforge programs",
-            "strategy": "Stratechery (Ben Thompson blog), 'Good Strategy Bad Strategy' (Richard Rumelt), Harvard Business Review"
-        },
-        "interview_focus": ["Product sense (e.g., 'Design X for Y', 'Improve Z', 'Favorite product and why')",
-                            "Behavioral questions (leadership, collaboration, conflict resolution)",
-                            "Estimation and prioritization questions",
-                            "Analytical and strategic thinking (market sizing, competitive analysis)",
-                            "Technical understanding (for tech PM roles)"],
-        "example_projects": ["Develop a detailed product requirements document (PRD) or user stories for a new feature",
-                             "Conduct user interviews and synthesize findings into actionable insights",
-                             "Create a competitive analysis report for a product category",
-                             "Mockup a user flow and wireframes for a mobile app feature",
-                             "Define and track key product metrics (KPIs)"]
-    },
-    "ux_ui_designer": {
-        "name": "UX/UI Designer",
-        "keywords": ["ux designer", "ui designer", "product designer", "interaction designer", "visual designer",
-                     "user experience designer", "user interface designer"],
-        "responsibilities_summary": "Focuses on creating user-centered designs by understanding business requirements, user needs, and technical limitations. Develops wireframes, prototypes, and high-fidelity visual designs for websites, apps, and other digital products.",
-        "required_skills": ["user_research_methods", "wireframing", "prototyping", "information_architecture",
-                            "interaction_design", "visual_design", "typography", "color_theory", "figma", "sketch",
-                            "adobe_xd", "usability_testing", "user_personas_journey_mapping"],
-        "soft_skills_emphasis": ["empathy", "communication", "collaboration", "problem_solving", "attention_to_detail",
-                                 "creativity", "receptiveness_to_feedback"],
-        "avg_salary_range": "$70,000 - $150,000 USD",
-        "common_next_steps": ["senior_ux_ui_designer", "lead_product_designer", "design_manager", "ux_researcher",
-                              "creative_director"],
-        "learning_resources": {
-            "foundational": "Nielsen Norman Group articles, Interaction Design Foundation (IDF) courses, Google UX Design Professional Certificate (Coursera)",
-            "ux_principles": "'The Design of Everyday Things' (Don Norman), 'Don't Make Me Think' (Steve Krug)",
-            "ui_visual_design": "'Refactoring UI' (Adam Wathan & Steve Schoger), Material Design Guidelines, Apple Human Interface Guidelines, Dribbble/Behance for inspiration",
-            "tools": "Figma Learn, Sketch App Tutorials, Adobe XD Tutorials",
-            "portfolio_building": "Bestfolios.com, 'Steal Like an Artist' (Austin Kleon)"
-        },
-        "interview_focus": ["Portfolio review (showcasing process and impact)",
-                            "Design thinking and problem-solving approach", "Whiteboard design challenges",
-                            "Explaining design decisions and rationale", "Collaboration and communication skills"],
-        "example_projects": ["Redesign an existing website or app with a focus on usability improvements",
-                             "Design a new mobile application from concept to high-fidelity prototype",
-                             "Conduct user research and create user personas and journey maps for a product",
-                             "Develop a design system or UI kit",
-                             "Create a detailed case study for each portfolio piece explaining the problem, process, and solution."]
-    },
-    "digital_marketing_specialist": {
-        "name": "Digital Marketing Specialist",
-        "keywords": ["digital marketing", "seo specialist", "sem specialist", "social media manager",
-                     "content marketer", "ppc analyst", "email marketing specialist"],
-        "responsibilities_summary": "Develops, implements, and manages marketing campaigns that promote a company and its products or services. Enhances brand awareness, drives web traffic, and acquires leads/customers through various digital channels like SEO, SEM, social media, and email.",
-        "required_skills": ["seo_principles_tools", "sem_ppc_platforms", "social_media_marketing_strategy",
-                            "email_marketing_automation", "content_creation_strategy",
-                            "data_analysis_marketing_metrics", "google_analytics", "marketing_automation_software",
-                            "copywriting_for_web", "basic_graphic_design_video_editing"],
-        "soft_skills_emphasis": ["creativity", "analytical_thinking", "communication", "adaptability",
-                                 "project_management", "customer_empathy"],
-        "avg_salary_range": "$60,000 - $110,000 USD",
-        "common_next_steps": ["marketing_manager", "seo_manager", "digital_marketing_strategist", "head_of_marketing",
-                              "growth_hacker"],
-        "learning_resources": {
-            "foundational": "Google Digital Garage (Fundamentals of Digital Marketing), HubSpot Academy (Inbound Marketing, Content Marketing), Coursera/Udemy courses on Digital Marketing",
-            "seo": "Moz Blog, Ahrefs Blog, Google Search Central, Backlinko",
-            "sem_ppc": "Google Ads Certification, WordStream PPC University, SEMrush Academy",
-            "social_media": "Hootsuite Academy, Sprout Social Blog, Facebook Blueprint, Buffer Blog",
-            "analytics": "Google Analytics Academy, CXL Institute (courses), Supermetrics Blog",
-            "email_marketing": "Mailchimp Academy, Campaign Monitor Blog, Litmus Blog"
-        },
-        "interview_focus": ["Campaign strategy and execution examples",
-                            "Knowledge of digital marketing tools and platforms (e.g., Google Ads, Facebook Ads Manager, GA4)",
-                            "Analytical skills (interpreting data, ROI calculation, A/B testing)",
-                            "Case studies on improving specific metrics (e.g., conversion rate, traffic)",
-                            "Understanding of current digital marketing trends and algorithm changes"],
-        "example_projects": ["Develop a comprehensive SEO audit and strategy for a small business website",
-                             "Create and present a mock social media campaign strategy for a product launch",
-                             "Analyze a marketing dataset to provide actionable insights and recommendations",
-                             "Write sample ad copy for different platforms and target audiences",
-                             "Outline an email marketing nurture sequence"]
-    },
-    "human_resources_manager": {
-        "name": "Human Resources Manager",
-        "keywords": ["hr manager", "human resources generalist", "talent acquisition manager", "hr business partner",
-                     "people operations manager"],
-        "responsibilities_summary": "Oversees recruitment and onboarding, employee relations, performance management, compensation and benefits administration, training and development programs, and ensures compliance with labor laws and company policies.",
-        "required_skills": ["recruitment_and_staffing_strategies", "employee_relations_conflict_resolution",
-                            "performance_management_systems", "compensation_and_benefits_design_administration",
-                            "employment_law_compliance_knowledge", "hris_human_resources_information_systems",
-                            "training_and_development_program_design", "change_management"],
-        "soft_skills_emphasis": ["communication_active_listening", "interpersonal_skills_relationship_building",
-                                 "empathy_emotional_intelligence", "problem_solving_decision_making",
-                                 "confidentiality_discretion", "leadership_influence",
-                                 "organizational_skills_time_management"],
-        "avg_salary_range": "$75,000 - $150,000 USD",
-        "common_next_steps": ["senior_hr_manager", "hr_director", "vp_of_hr", "chief_people_officer", "hr_consultant",
-                              "organizational_development_specialist"],
-        "learning_resources": {
-            "foundational": "SHRM Certification (SHRM-CP, SHRM-SCP), HRCI Certifications (PHR, SPHR), University HR programs or degrees",
-            "employment_law": "SHRM resources on compliance, Department of Labor website (country-specific), Legal updates from HR publications",
-            "recruitment": "LinkedIn Talent Blog, ERE.net, SHRM Talent Acquisition resources",
-            "employee_relations": "Books on conflict resolution and workplace mediation, Courses on difficult conversations",
-            "hr_technology": "HR Technologist magazine, Reviews of HRIS platforms (e.g., BambooHR, Workday)"
-        },
-        "interview_focus": [
-            "Scenario-based questions (handling employee issues, ethical dilemmas, legal compliance challenges)",
-            "Experience with various HR processes and systems (e.g., ATS, performance review software)",
-            "Leadership philosophy and management style", "Knowledge of current labor laws and HR best practices",
-            "Behavioral questions focused on empathy, fairness, and strategic problem-solving"],
-        "example_projects": ["Develop a proposal for a new employee wellness program",
-                             "Outline a strategy to improve employee retention by X%",
-                             "Create a training module for new managers on performance feedback",
-                             "Draft an updated employee handbook section on remote work policies",
-                             "Analyze HR metrics (e.g., turnover rate, time-to-hire) and suggest improvements"]
-    },
-    "graphic_designer": {
-        "name": "Graphic Designer",
-        "keywords": ["graphic artist", "visual designer", "brand designer", "communication_designer"],
-        "responsibilities_summary": "Creates visual concepts using computer software or by hand to communicate ideas that inspire, inform, and captivate consumers. Develops layouts and production designs for advertisements, brochures, websites, corporate reports, and other media.",
-        "required_skills": ["adobe_creative_suite_photoshop_illustrator_indesign", "typography_principles_application",
-                            "color_theory_psychology", "layout_composition_hierarchy", "visual_communication_strategy",
-                            "branding_identity_design", "illustration_skills", "digital_design_for_web_social",
-                            "print_production_knowledge", "user_interface_design_basics_optional"],
-        "soft_skills_emphasis": ["creativity_innovation", "attention_to_detail_precision",
-                                 "communication_articulating_design_choices", "time_management_meeting_deadlines",
-                                 "ability_to_take_and_give_constructive_criticism", "problem_solving_visual_challenges",
-                                 "adaptability_to_different_styles_media"],
-        "avg_salary_range": "$50,000 - $95,000 USD",
-        "common_next_steps": ["senior_graphic_designer", "art_director", "creative_director",
-                              "ux_designer_with_visual_focus", "freelance_design_business_owner", "brand_strategist"],
-        "learning_resources": {
-            "foundational": "Design school programs (BFA/MFA), Coursera/Skillshare/Udemy courses on Graphic Design, Books like 'Thinking with Type' (Ellen Lupton), 'Grid Systems in Graphic Design' (Josef Müller-Brockmann)",
-            "adobe_suite": "Adobe Creative Cloud Learn & Support, YouTube channels (e.g., Phlearn, Dansky, Satori Graphics)",
-            "typography": "Typewolf website, Fonts In Use, 'The Elements of Typographic Style' (Robert Bringhurst)",
-            "design_principles_inspiration": "Smashing Magazine, Designmodo, Dribbble, Behance, Awwwards",
-            "branding": "'Designing Brand Identity' (Alina Wheeler), Marty Neumeier books ('The Brand Gap', 'Zag')"
-        },
-        "interview_focus": ["Portfolio review (demonstrating range, skill, and thought process - most critical part)",
-                            "Explanation of design process and rationale behind specific design choices",
-                            "Understanding of fundamental design principles (balance, contrast, hierarchy etc.)",
-                            "Software proficiency (Adobe CC, Figma etc.)",
-                            "Ability to articulate design decisions, collaborate, and respond to feedback constructively"],
-        "example_projects": [
-            "Complete branding package for a fictional company (logo, color palette, typography, mockups)",
-            "Website or mobile app UI design project (showcasing user flow and visual design)",
-            "Editorial design for a magazine spread or book cover", "Social media campaign visuals",
-            "Packaging design concept"]
-    },
-    "teacher_educator": {
-        "name": "Teacher / Educator",
-        "keywords": ["teacher", "educator", "instructor", "professor", "k-12 teacher", "higher education faculty",
-                     "corporate trainer", "instructional designer"],
-        "responsibilities_summary": "Plans, prepares, and delivers instructional activities that facilitate active learning experiences. Develops curriculum, assesses student performance, and creates a supportive and engaging learning environment across various settings (K-12, higher ed, corporate).",
-        "required_skills": ["curriculum_development", "instructional_design_models_addiem",
-                            "classroom_management_or_training_facilitation", "assessment_and_evaluation_methods",
-                            "subject_matter_expertise", "differentiated_instruction_or_adult_learning_principles",
-                            "educational_technology_integration_lms",
-                            "communication_with_students_parents_colleagues_stakeholders",
-                            "learning_theories_pedagogy_andragogy"],
-        "soft_skills_emphasis": ["patience", "empathy", "communication_public_speaking", "adaptability_flexibility",
-                                 "passion_for_learning_and_teaching", "organizational_skills_planning",
-                                 "leadership_facilitation_skills", "creativity_in_instruction"],
-        "avg_salary_range": "$45,000 - $95,000 USD (K-12/Corp Training, varies greatly), $60,000 - $150,000+ (Higher Ed)",
-        "common_next_steps": ["lead_teacher_trainer", "department_head", "instructional_coordinator_designer",
-                              "school_administrator_principal_training_manager", "curriculum_specialist_developer",
-                              "educational_consultant", "university_tenure_track_professor"],
-        "learning_resources": {
-            "foundational": "Teacher certification programs (state-specific for K-12), Master's/Doctorate in Education or specific subject area, ATD (Association for Talent Development) for corporate trainers.",
-            "pedagogy_andragogy": "Journals like 'Educational Leadership', Books by authors like Parker Palmer, Bell Hooks, Malcolm Knowles, 'Understanding by Design' (Wiggins & McTighe)",
-            "classroom_management_facilitation": "Resources from Edutopia, ASCD, 'The First Days of School' (Harry Wong), ATD resources on facilitation",
-            "instructional_design": "ADDIE model resources, Merrill's Principles of Instruction, Cathy Moore's blog (action mapping)",
-            "educational_technology": "ISTE Standards, Google for Education resources, Common Sense Education, Articulate 360/Adobe Captivate tutorials (for e-learning development)"
-        },
-        "interview_focus": ["Teaching/training philosophy and methodology",
-                            "Sample lesson plan presentation or training module delivery (demo)",
-                            "Classroom/session management strategies",
-                            "Experience with curriculum/course development and assessment/evaluation",
-                            "Behavioral questions about handling challenging learners or situations",
-                            "Knowledge of educational/training standards and current issues in the field"],
-        "example_projects": [
-            "Develop a unit plan for a specific grade level/subject or a training program for a corporate skill",
-            "Create a portfolio of lesson plans/training materials and participant feedback/student work samples",
-            "Design an innovative assessment method or evaluation strategy",
-            "Present research on an educational topic or training methodology",
-            "Volunteer or gain experience in classroom settings or delivering workshops"]
-    }
-}
+
+# Enhanced Career Data with Tech and Non-Tech Roles, kept in a data file so roles can change without a redeploy.
+# It is compiled into CATALOG (see Career Catalog Snapshot) and reloaded while running when the file changes.
+CATALOG_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "career_paths.json")
+CATALOG_REQUIRED_FIELDS = ('name', 'keywords', 'responsibilities_summary', 'required_skills', 'avg_salary_range',
+                           'learning_resources', 'interview_focus')
+
+
+# --- Compiled Role Catalog ---
+# Role data is compiled into immutable role objects carrying normalized skill sets, resource lookup pairs and
+# pre-joined display strings, so per-turn handlers only read attributes.
+SKILL_BITSET_TAG_BYTES = 4
+
+
+def normalize_skill_name(skill: str) -> str:
+    return skill.lower().strip().replace("_", " ")
+
+
+class SkillVocabulary:
+    # Every skill any role asks for gets one bit. The vocabulary is sorted, so walking set bits from the low end yields
+    # skill names in alphabetical order. Skills outside the vocabulary stay in the JSON list only.
+    def __init__(self, career_paths: dict):
+        self.skills = tuple(sorted({normalize_skill_name(skill) for path_data in career_paths.values()
+                                    for skill in path_data['required_skills'] + path_data.get('soft_skills_emphasis', [])}))
+        self.bit_index = {skill: bit for bit, skill in enumerate(self.skills)}
+        self.bitset_bytes = (len(self.skills) + 7) // 8
+        self.fingerprint = hashlib.sha1("\n".join(self.skills).encode()).hexdigest()
+        # Stored bitsets start with this tag, so rows encoded against another vocabulary can be told apart.
+        self.tag = bytes.fromhex(self.fingerprint[:SKILL_BITSET_TAG_BYTES * 2])
+
+    def __len__(self) -> int:
+        return len(self.skills)
+
+    def encode(self, skills) -> int:
+        bits = 0
+        for skill in skills:
+            bit = self.bit_index.get(normalize_skill_name(skill))
+            if bit is not None:
+                bits |= 1 << bit
+        return bits
+
+    def decode(self, bits: int) -> list:
+        skills = []
+        while bits:
+            lowest = bits & -bits
+            skills.append(self.skills[lowest.bit_length() - 1])
+            bits ^= lowest
+        return skills
+
+    def to_blob(self, bits: int) -> bytes:
+        # Tag, then little-endian bits: bit n lives in byte n // 8 at position n % 8, as np.unpackbits(bitorder='little')
+        # expects.
+        return self.tag + bits.to_bytes(self.bitset_bytes, 'little')
+
+    def from_blob(self, blob: bytes):
+        if blob is None or blob[:SKILL_BITSET_TAG_BYTES] != self.tag:
+            return None
+        return int.from_bytes(blob[SKILL_BITSET_TAG_BYTES:], 'little')
+
+    def blobs_to_matrix(self, blobs: list) -> np.ndarray:
+        # (profiles x skills) 0/1 matrix; every blob must carry this vocabulary's tag.
+        packed = np.frombuffer(b"".join(blob[SKILL_BITSET_TAG_BYTES:] for blob in blobs),
+                               dtype=np.uint8).reshape(len(blobs), self.bitset_bytes)
+        return np.unpackbits(packed, axis=1, count=len(self.skills), bitorder='little')
+
+
+class CompiledRole:
+    __slots__ = ('key', 'name', 'keywords', 'responsibilities_summary', 'avg_salary_range', 'required_skills',
+                 'required_skill_set', 'soft_skill_set', 'target_skill_set', 'target_skill_bits', 'key_skills_display',
+                 'learning_resources', 'resource_lookup', 'resource_overview', 'interview_focus_display',
+                 'example_projects', 'example_projects_display', 'project_type_term', 'common_next_steps')
+
+    def __init__(self, key: str, path_data: dict, skill_vocabulary: SkillVocabulary):
+        assign = functools.partial(object.__setattr__, self)
+        assign('key', key)
+        assign('name', path_data['name'])
+        assign('keywords', tuple(path_data['keywords']))
+        assign('responsibilities_summary', path_data['responsibilities_summary'])
+        assign('avg_salary_range', path_data['avg_salary_range'])
+        assign('required_skills', tuple(path_data['required_skills']))
+        assign('required_skill_set', frozenset(normalize_skill_name(skill) for skill in path_data['required_skills']))
+        assign('soft_skill_set', frozenset(
+            normalize_skill_name(skill) for skill in path_data.get('soft_skills_emphasis', [])))
+        assign('target_skill_set', self.required_skill_set | self.soft_skill_set)
+        assign('target_skill_bits', skill_vocabulary.encode(self.target_skill_set))
+        assign('key_skills_display', ', '.join(path_data['required_skills'][:5]))
+        assign('common_next_steps', tuple(path_data.get('common_next_steps', ())))
+
+        resources = dict(path_data['learning_resources'])
+        assign('learning_resources', types.MappingProxyType(resources))
+        assign('resource_lookup', tuple((category, category.replace("_", " ")) for category in resources))
+        resource_list = [f"### Learning Resources for **{self.name}**:\n"]
+        if 'foundational' in resources:
+            resource_list.append(f"- **Foundational**: {resources['foundational']}")
+        for category, resource_desc in resources.items():
+            if category != 'foundational' and len(resource_list) < 6:
+                resource_list.append(f"- **{category.replace('_', ' ').title()}**: {resource_desc}")
+        assign('resource_overview', "\n".join(resource_list))
+
+        assign('interview_focus_display', "- " + "\n- ".join(path_data['interview_focus']))
+        assign('example_projects', tuple(path_data.get('example_projects') or ()))
+        assign('example_projects_display', "- " + "\n- ".join(self.example_projects))
+        if "manager" in key or "hr" in key or "teacher" in key or "educator" in key:
+            assign('project_type_term', "accomplishments or key responsibilities")
+        elif "designer" in key:
+            assign('project_type_term', "portfolio items")
+        else:
+            assign('project_type_term', "projects")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CompiledRole '{self.key}' is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"CompiledRole '{self.key}' is immutable")
+
+    def find_resource_category(self, msg_lower: str):
+        for category, spaced_category in self.resource_lookup:
+            if spaced_category in msg_lower or category in msg_lower:
+                return category
+        return None
+
+
+# --- Database Connection Pool ---
+DB_POOL_SIZE = 8
+DB_BUSY_TIMEOUT_MS = 5000
+DB_LOCK_RETRIES = 5
+DB_LOCK_BACKOFF_SECONDS = 0.02
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # Safe with WAL: only the last commits can be lost on power failure
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",  # ~8 MB page cache per connection
+)
+# The journal acknowledges turns only after their writes commit, so its commits must survive power loss as well.
+JOURNAL_DB_PRAGMAS = DB_PRAGMAS + ("PRAGMA synchronous=FULL",)
+
+
+class SQLiteConnectionPool:
+    def __init__(self, db_name: str, size: int = DB_POOL_SIZE, pragmas: tuple = DB_PRAGMAS):
+        self.db_name = db_name
+        self.size = size
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        logger.info(f"Opened pooled SQLite connection #{self._created} to {self.db_name}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get()
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+DB_POOL = SQLiteConnectionPool(DB_NAME)
+JOURNAL_DB_POOL = SQLiteConnectionPool(DB_NAME, size=1, pragmas=JOURNAL_DB_PRAGMAS)  # only the writer thread uses it
+
+
+def is_db_locked_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def run_db(operation, commit: bool = False, pool: SQLiteConnectionPool = None):
+    # Runs operation(conn) on a pooled connection, retrying with exponential backoff while the DB is locked.
+    for attempt in range(DB_LOCK_RETRIES + 1):
+        try:
+            with (pool or DB_POOL).connection() as conn:
+                result = operation(conn)
+                if commit:
+                    conn.commit()
+                return result
+        except sqlite3.OperationalError as e:
+            if not is_db_locked_error(e) or attempt == DB_LOCK_RETRIES:
+                raise
+            delay = DB_LOCK_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"Database locked (attempt {attempt + 1}/{DB_LOCK_RETRIES}), retrying in {delay:.3f}s")
+            time.sleep(delay)
+
+
+# --- Blocking Work Executor ---
+# Sized to the connection pool so an offloaded call never queues twice (once for a thread, once for a connection).
+BLOCKING_EXECUTOR_WORKERS = DB_POOL_SIZE
+_blocking_executor = None
+_blocking_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    global _blocking_executor
+    with _blocking_executor_lock:
+        if _blocking_executor is None:
+            _blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS,
+                                                    thread_name_prefix="coach-blocking")
+        return _blocking_executor
+
+
+def shutdown_blocking_executor():
+    global _blocking_executor
+    with _blocking_executor_lock:
+        if _blocking_executor is not None:
+            _blocking_executor.shutdown(wait=True)
+            _blocking_executor = None
+
+
+async def run_blocking(func, *args, **kwargs):
+    # Keeps sqlite3 and response generation off the event loop so one slow commit doesn't stall the worker.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_executor(), functools.partial(func, *args, **kwargs))
+
+
+# --- Write-Behind Journal (Group Commit) ---
+JOURNAL_MAX_BATCH = 256
+JOURNAL_FLUSH_INTERVAL_SECONDS = 0.002
+# When True, a turn replies as soon as its writes are queued; a crash can lose the last flush window of writes.
+JOURNAL_RELAXED_DURABILITY = False
+
+
+class WriteBehindJournal:
+    def __init__(self, max_batch: int = JOURNAL_MAX_BATCH, flush_interval: float = JOURNAL_FLUSH_INTERVAL_SECONDS,
+                 relaxed: bool = JOURNAL_RELAXED_DURABILITY):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.relaxed = relaxed
+        self.batches_committed = 0
+        self.writes_committed = 0
+        self.batch_retries = 0
+        self.writes_failed = 0
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._scope = threading.local()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="coach-journal-writer", daemon=True)
+                self._writer.start()
+
+    def submit(self, sql: str, params: tuple, on_commit=None) -> Future:
+        # on_commit runs on the writer thread once the write is committed, before the write's future resolves.
+        future = Future()
+        self._ensure_writer()
+        self._queue.put((sql, params, on_commit, future))
+        pending = getattr(self._scope, 'pending', None)
+        if pending is not None:
+            pending.append(future)
+        return future
+
+    @contextmanager
+    def turn(self):
+        # Collects every write this thread submits; on exit waits for them to commit unless durability is relaxed.
+        outer = getattr(self._scope, 'pending', None)
+        self._scope.pending = []
+        try:
+            yield
+            pending = self._scope.pending
+        finally:
+            self._scope.pending = outer
+        if outer is not None:
+            outer.extend(pending)
+        elif not self.relaxed:
+            for future in pending:
+                future.result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._commit(batch)
+
+    def _commit(self, batch: list):
+        def write_batch(conn):
+            for sql, params, _, _ in batch:
+                conn.execute(sql, params)
+
+        try:
+            run_db(write_batch, commit=True, pool=JOURNAL_DB_POOL)
+        except Exception as e:
+            if len(batch) > 1:
+                # One bad write must not fail the unrelated turns batched with it: retry each in its own transaction.
+                logger.error(f"Write-behind batch of {len(batch)} writes failed ({e}); retrying them one by one")
+                self.batch_retries += 1
+                for entry in batch:
+                    self._commit([entry])
+                return
+            logger.error(f"Write-behind write failed: {e}")
+            self.writes_failed += 1
+            batch[0][3].set_exception(e)
+            return
+
+        self.batches_committed += 1
+        self.writes_committed += len(batch)
+        for _, _, on_commit, _ in batch:
+            if on_commit is not None:
+                try:
+                    on_commit()
+                except Exception as e:
+                    logger.error(f"Write-behind on_commit callback failed: {e}")
+        for _, _, _, future in batch:
+            future.set_result(None)
+
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join()
+        logger.info(f"Write-behind journal flushed: {self.writes_committed} writes in {self.batches_committed} commits "
+                    f"({self.writes_failed} failed, {self.batch_retries} batches retried one by one)")
+
+
+WRITE_JOURNAL = WriteBehindJournal()
+
+
+# --- Schema Migrations ---
+# PRAGMA user_version records the last applied migration. Migrations run in order at startup, serialized across
+# workers by a lock file, and must be idempotent so that an interrupted run can simply be repeated.
+SCHEMA_BACKFILL_BATCH_SIZE = 500
+SCHEMA_MIGRATION_LOCK_FILE = f"{DB_NAME}.migrate.lock"
+
+
+def create_base_schema():
+    def create_schema(conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT UNIQUE NOT NULL,
+            name TEXT,
+            current_role TEXT,
+            desired_role_key TEXT,
+            skills TEXT, -- JSON list of skills
+            goals TEXT, -- JSON list of goals
+            conversation_context TEXT, -- JSON blob for flexible state
+            profile_created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            sender TEXT NOT NULL, -- 'user' or 'ai'
+            message_type TEXT DEFAULT 'text', -- 'text', 'quick_reply_prompt', 'resource_list'
+            message_content TEXT NOT NULL, -- Can be Markdown or JSON for structured messages
+            metadata TEXT, -- JSON for extra data (e.g., quick reply options)
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES users (session_id) ON DELETE CASCADE
+        )
+        """)
+        # Keyset pagination walks a session's history by id; timestamps only have one-second resolution and tie
+        # for the user/AI messages of a single turn, so id is the stable ordering key.
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_history_session_id_id ON chat_history (session_id, id)")
+
+    run_db(create_schema, commit=True)
+
+
+def promote_context_columns():
+    # Moves the conversation stage and topic out of the conversation_context JSON into typed, indexable columns.
+    def add_columns(conn):
+        existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        for column in ('current_stage', 'chat_topic'):
+            if column not in existing_columns:
+                conn.execute(f"ALTER TABLE users ADD COLUMN {column} TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_users_current_stage ON users (current_stage)")
+
+    run_db(add_columns, commit=True)
+
+    last_id = 0
+    backfilled = 0
+    while True:
+        rows = run_db(lambda conn: conn.execute(
+            "SELECT id, current_stage, chat_topic, conversation_context FROM users WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, SCHEMA_BACKFILL_BATCH_SIZE)).fetchall())
+        if not rows:
+            break
+        updates = []
+        for row_id, current_stage, chat_topic, context_json in rows:
+            try:
+                context = json.loads(context_json) if context_json else {}
+            except json.JSONDecodeError:
+                logger.warning(f"Could not parse conversation_context for users.id {row_id}; leaving it in place")
+                continue
+            if 'current_stage' not in context and 'chat_topic' not in context:
+                continue
+            updates.append((context.pop('current_stage', current_stage), context.pop('chat_topic', chat_topic),
+                            json.dumps(context), row_id))
+        if updates:
+            run_db(lambda conn: conn.executemany(
+                "UPDATE users SET current_stage=?, chat_topic=?, conversation_context=? WHERE id=?", updates),
+                commit=True)
+            backfilled += len(updates)
+        last_id = rows[-1][0]
+    logger.info(f"Backfilled current_stage/chat_topic columns for {backfilled} users.")
+
+
+def add_skill_bitset_column():
+    # The column is filled by sync_skill_bitsets(), which also re-encodes it whenever the skill vocabulary changes.
+    def add_column(conn):
+        existing_columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if 'skills_bitset' not in existing_columns:
+            conn.execute("ALTER TABLE users ADD COLUMN skills_bitset BLOB")
+        conn.execute("CREATE TABLE IF NOT EXISTS app_metadata (key TEXT PRIMARY KEY, value TEXT)")
+
+    run_db(add_column, commit=True)
+
+
+SCHEMA_MIGRATIONS = [
+    (1, "base users/chat_history schema", create_base_schema),
+    (2, "promote current_stage/chat_topic from conversation_context to columns", promote_context_columns),
+    (3, "add users.skills_bitset and app_metadata", add_skill_bitset_column),
+    (4, "prefix skills_bitset with the skill vocabulary tag", lambda: sync_skill_bitsets(force=True)),
+]
+
+
+@contextmanager
+def schema_migration_lock(blocking: bool = True):
+    # Yields whether the lock is held; a non-blocking attempt yields False while another worker holds it.
+    if fcntl is None:
+        yield True
+        return
+    fd = os.open(SCHEMA_MIGRATION_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    acquired = False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except BlockingIOError:
+            pass
+        yield acquired
+    finally:
+        if acquired:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
 
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id TEXT UNIQUE NOT NULL,
-        name TEXT,
-        current_role TEXT,
-        desired_role_key TEXT,
-        skills TEXT, -- JSON list of skills
-        goals TEXT, -- JSON list of goals
-        conversation_context TEXT, -- JSON blob for flexible state
-        profile_created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS chat_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        session_id TEXT NOT NULL,
-        sender TEXT NOT NULL, -- 'user' or 'ai'
-        message_type TEXT DEFAULT 'text', -- 'text', 'quick_reply_prompt', 'resource_list'
-        message_content TEXT NOT NULL, -- Can be Markdown or JSON for structured messages
-        metadata TEXT, -- JSON for extra data (e.g., quick reply options)
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (session_id) REFERENCES users (session_id) ON DELETE CASCADE
-    )
-    """)
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully.")
+    with schema_migration_lock():
+        version = run_db(lambda conn: conn.execute("PRAGMA user_version").fetchone()[0])
+        for target_version, description, migrate in SCHEMA_MIGRATIONS:
+            if version >= target_version:
+                continue
+            logger.info(f"Applying schema migration {target_version}: {description}")
+            migrate()
+            run_db(lambda conn: conn.execute(f"PRAGMA user_version = {target_version}"), commit=True)
+            version = target_version
+        sync_skill_bitsets()
+    logger.info(f"Database initialized successfully (schema version {version}).")
+
+
+def sync_skill_bitsets(force: bool = False) -> int:
+    # Bit positions depend on the skill vocabulary, so rows whose bitset lacks the current vocabulary's tag (or every
+    # row, when forced) are re-encoded from the JSON skills. The tag is checked in SQL, so a pass over an up-to-date
+    # table reads no rows. A row is only updated if its skills are unchanged since it was read; a row whose skills
+    # changed in between keeps whatever tag that write stored, and the next pass checks it again.
+    vocabulary = CATALOG.skills
+    stale_filter = "" if force else " AND substr(skills_bitset, 1, ?) IS NOT ?"
+    stale_params = () if force else (SKILL_BITSET_TAG_BYTES, vocabulary.tag)
+    last_id = 0
+    reencoded = 0
+    while True:
+        rows = run_db(lambda conn: conn.execute(
+            f"SELECT id, skills FROM users WHERE id > ?{stale_filter} ORDER BY id LIMIT ?",
+            (last_id, *stale_params, SCHEMA_BACKFILL_BATCH_SIZE)).fetchall())
+        if not rows:
+            break
+        updates = []
+        for row_id, skills_json in rows:
+            try:
+                skills = json.loads(skills_json) if skills_json else []
+            except json.JSONDecodeError:
+                logger.warning(f"Could not parse skills for users.id {row_id}; encoding it as empty")
+                skills = []
+            updates.append((vocabulary.to_blob(vocabulary.encode(skills)), row_id, skills_json))
+        if updates:
+            reencoded += run_db(lambda conn: conn.executemany(
+                "UPDATE users SET skills_bitset=? WHERE id=? AND skills IS ?", updates).rowcount, commit=True)
+        last_id = rows[-1][0]
+
+    if reencoded:
+        logger.info(f"Encoded skills_bitset for {reencoded} users ({len(vocabulary)}-skill vocabulary).")
+    return reencoded
+
+
+# --- Skill Cohort Queries ---
+def count_users_missing_skills(role_key: str, desired_only: bool = True, catalog=None) -> dict:
+    # Cohort gap counts straight from the bitset column: {skill: number of users lacking it} for the role's target
+    # skills, over users aiming for the role (or everyone when desired_only is False). Rows still tagged for another
+    # vocabulary are skipped until sync_skill_bitsets() re-encodes them.
+    catalog = catalog or CATALOG
+    vocabulary = catalog.skills
+    role = catalog.roles[role_key]
+    query = "SELECT skills_bitset FROM users WHERE substr(skills_bitset, 1, ?) = ?"
+    params = (SKILL_BITSET_TAG_BYTES, vocabulary.tag)
+    if desired_only:
+        query += " AND desired_role_key = ?"
+        params += (role_key,)
+    rows = run_db(lambda conn: conn.execute(query, params).fetchall())
+    target_bits = np.array(sorted(vocabulary.bit_index[skill] for skill in role.target_skill_set), dtype=np.intp)
+    if not rows:
+        return {vocabulary.skills[bit]: 0 for bit in target_bits}
+
+    has_skill = vocabulary.blobs_to_matrix([row[0] for row in rows])
+    missing_counts = len(rows) - has_skill[:, target_bits].sum(axis=0)
+    return {vocabulary.skills[bit]: int(count) for bit, count in zip(target_bits, missing_counts)}
+
+
+# --- Role Fit Ranking ---
+# Scores profiles against every role at once: (profiles x skills) @ (skills x roles) gives the number of each role's
+# target skills a profile covers, divided by the role's skill count for a coverage fraction.
+ROLE_FIT_TOP_K = 3
+ROLE_FIT_BATCH_SIZE = 5000
+
+
+def build_role_skill_matrix(roles, skill_vocabulary: SkillVocabulary):
+    role_skill_matrix = np.zeros((len(skill_vocabulary), len(roles)), dtype=np.float32)
+    for role_column, role in enumerate(roles.values()):
+        role_skill_matrix[[skill_vocabulary.bit_index[skill] for skill in role.target_skill_set], role_column] = 1
+    return role_skill_matrix, role_skill_matrix.sum(axis=0)
+
+
+def rank_skill_matrix(skill_matrix: np.ndarray, skill_bitsets: list, top_k: int = ROLE_FIT_TOP_K,
+                      catalog=None) -> list:
+    # One list per profile of {role_key, name, match_percent, missing_skills}, best fit first. Ties keep catalog order.
+    catalog = catalog or CATALOG
+    coverage = (skill_matrix.astype(np.float32) @ catalog.role_skill_matrix) / catalog.role_skill_counts
+    ranked_columns = np.argsort(-coverage, axis=1, kind='stable')[:, :top_k]
+    rankings = []
+    for row, skill_bits in enumerate(skill_bitsets):
+        fits = []
+        for column in ranked_columns[row]:
+            role = catalog.roles[catalog.role_keys[column]]
+            fits.append({'role_key': role.key, 'name': role.name,
+                         'match_percent': round(float(coverage[row, column]) * 100, 1),
+                         'missing_skills': catalog.skills.decode(role.target_skill_bits & ~skill_bits)})
+        rankings.append(fits)
+    return rankings
+
+
+def rank_roles_by_fit(skill_lists: list, top_k: int = ROLE_FIT_TOP_K, catalog=None) -> list:
+    # skill_lists: one list of skill names per profile, as stored in the profile's 'skills' field.
+    if not skill_lists:
+        return []
+    catalog = catalog or CATALOG
+    skill_bitsets = [catalog.skills.encode(skills) for skills in skill_lists]
+    skill_matrix = catalog.skills.blobs_to_matrix([catalog.skills.to_blob(bits) for bits in skill_bitsets])
+    return rank_skill_matrix(skill_matrix, skill_bitsets, top_k, catalog)
+
+
+def rank_all_users_by_fit(top_k: int = ROLE_FIT_TOP_K, batch_size: int = ROLE_FIT_BATCH_SIZE):
+    # Offline bulk ranking over the users table, straight from skills_bitset; yields (session_id, fits) per user.
+    # The catalog is pinned for the whole run so every batch is ranked against the same roles.
+    catalog = CATALOG
+    vocabulary = catalog.skills
+    last_id = 0
+    while True:
+        rows = run_db(lambda conn: conn.execute(
+            "SELECT id, session_id, skills_bitset FROM users WHERE id > ? AND substr(skills_bitset, 1, ?) = ? "
+            "ORDER BY id LIMIT ?", (last_id, SKILL_BITSET_TAG_BYTES, vocabulary.tag, batch_size)).fetchall())
+        if not rows:
+            return
+        blobs = [row[2] for row in rows]
+        skill_bitsets = [vocabulary.from_blob(blob) for blob in blobs]
+        rankings = rank_skill_matrix(vocabulary.blobs_to_matrix(blobs), skill_bitsets, top_k, catalog)
+        for row, fits in zip(rows, rankings):
+            yield row[1], fits
+        last_id = rows[-1][0]
+
+
+# --- Career Progression Graph ---
+# Nodes are the catalog roles plus every key named in their common_next_steps (most of which, like tech_lead, have no
+# catalog entry). Edges are steps up a track and lateral moves between catalog roles that share skills, weighted by
+# skill delta: the number of the destination's target skills the source role does not already cover. All-pairs
+# cheapest and shortest (fewest hops) paths are computed once per catalog, so a roadmap query is a table walk.
+ROADMAP_PROMOTION_COST = 5  # next-step roles carry no skill data; a step up a track is assumed to cost this much
+ROADMAP_MIN_SHARED_SKILLS = 1  # lateral moves are only offered between roles sharing at least this many skills
+ROADMAP_HOP_WEIGHT = 1_000_000  # shortest paths minimize hops first and break ties on skill delta
+
+
+def all_pairs_shortest_paths(weights: np.ndarray):
+    # Vectorized Floyd-Warshall. next_hop[i, j] is the node after i on the best i -> j path, or -1 if unreachable.
+    distances = weights.copy()
+    node_count = len(distances)
+    next_hop = np.where(np.isfinite(distances), np.arange(node_count)[None, :], -1)
+    for via in range(node_count):
+        through_via = distances[:, via, None] + distances[None, via, :]
+        better = through_via < distances
+        distances = np.where(better, through_via, distances)
+        next_hop = np.where(better, next_hop[:, via, None], next_hop)
+    return distances, next_hop
+
+
+class CareerGraph:
+    SNAPSHOT_TABLES = ('cheapest_costs', 'cheapest_next', 'shortest_costs', 'shortest_next')
+
+    def __init__(self, roles, role_index, snapshot: dict = None):
+        self.role_index = role_index
+        self.role_names = {key: role.name for key, role in roles.items()}
+        self.role_skill_bits = [role.target_skill_bits for role in roles.values()]
+        nodes = list(roles)
+        for role in roles.values():
+            nodes.extend(step for step in role.common_next_steps if step not in nodes)
+        self.nodes = tuple(nodes)
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.role_indices = np.array([self.node_index[key] for key in roles], dtype=np.intp)
+
+        node_count = len(self.nodes)
+        self.edge_costs = np.full((node_count, node_count), np.inf)
+        for key, role in roles.items():
+            source = self.node_index[key]
+            for step in role.common_next_steps:
+                self.edge_costs[source, self.node_index[step]] = ROADMAP_PROMOTION_COST
+            for other_key, other in roles.items():
+                shared_skills = (role.target_skill_bits & other.target_skill_bits).bit_count()
+                if other_key != key and shared_skills >= ROADMAP_MIN_SHARED_SKILLS:
+                    self.edge_costs[source, self.node_index[other_key]] = (
+                        other.target_skill_bits & ~role.target_skill_bits).bit_count()
+
+        self._roadmaps = {}
+        if snapshot is not None:
+            for table in self.SNAPSHOT_TABLES:
+                setattr(self, table, snapshot[f'graph_{table}'])
+            return
+        hop_weights = np.where(np.isfinite(self.edge_costs), ROADMAP_HOP_WEIGHT + self.edge_costs, np.inf)
+        np.fill_diagonal(hop_weights, 0)
+        cost_weights = self.edge_costs.copy()
+        np.fill_diagonal(cost_weights, 0)
+        self.cheapest_costs, self.cheapest_next = all_pairs_shortest_paths(cost_weights)
+        self.shortest_costs, self.shortest_next = all_pairs_shortest_paths(hop_weights)
+
+    def snapshot_arrays(self) -> dict:
+        return {f'graph_{table}': getattr(self, table) for table in self.SNAPSHOT_TABLES}
+
+    def node_name(self, node_key: str) -> str:
+        return self.role_names.get(node_key) or node_key.replace('_', ' ').title()
+
+    def resolve_node(self, text: str):
+        # Accepts a node key, a catalog role name/keyword, or a next-step title such as "Tech Lead".
+        if not text:
+            return None
+        if text in self.node_index:
+            return text
+        node_key = "_".join(tokenize_role_text(text))
+        if node_key in self.node_index:
+            return node_key
+        candidates = self.role_index.best_matches(text.lower())
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _route(self, first_step: dict, start: int, target: int, next_hop: np.ndarray) -> dict:
+        steps = [first_step]
+        node = start
+        while node != target:
+            following = int(next_hop[node, target])
+            steps.append({'key': self.nodes[following], 'name': self.node_name(self.nodes[following]),
+                          'skill_delta': int(self.edge_costs[node, following])})
+            node = following
+        return {'steps': steps, 'hops': len(steps) - 1, 'skill_delta': sum(step['skill_delta'] for step in steps)}
+
+    def roadmap(self, source_key: str, target_key: str):
+        # Memoized per (source, target); None when the target cannot be reached from the source.
+        memo_key = (source_key, target_key)
+        if memo_key not in self._roadmaps:
+            source, target = self.node_index[source_key], self.node_index[target_key]
+            if self.cheapest_next[source, target] < 0:
+                self._roadmaps[memo_key] = None
+            else:
+                start = {'key': source_key, 'name': self.node_name(source_key), 'skill_delta': 0}
+                self._roadmaps[memo_key] = {
+                    'source': source_key, 'target': target_key,
+                    'cheapest': self._route(start, source, target, self.cheapest_next),
+                    'shortest': self._route(start, source, target, self.shortest_next)}
+        return self._roadmaps[memo_key]
+
+    def roadmap_from_skills(self, skill_bits: int, target_key: str):
+        # For a current role outside the graph: enter at the catalog role that minimizes (skill gap + remaining path).
+        target = self.node_index[target_key]
+        entry_gaps = np.array([(role_bits & ~skill_bits).bit_count() for role_bits in self.role_skill_bits])
+        routes = {}
+        for route_name, costs, next_hop, entry_costs in (
+                ('cheapest', self.cheapest_costs, self.cheapest_next, entry_gaps),
+                ('shortest', self.shortest_costs, self.shortest_next, ROADMAP_HOP_WEIGHT + entry_gaps)):
+            totals = entry_costs + costs[self.role_indices, target]
+            best = int(np.argmin(totals))
+            if not np.isfinite(totals[best]):
+                return None
+            entry = int(self.role_indices[best])
+            first_step = {'key': self.nodes[entry], 'name': self.node_name(self.nodes[entry]),
+                          'skill_delta': int(entry_gaps[best])}
+            route = self._route(first_step, entry, target, next_hop)
+            route['hops'] += 1
+            routes[route_name] = route
+        return {'source': None, 'target': target_key, **routes}
+
+
+def plan_career_roadmap(user_profile: dict, target_key: str, source_text: str = None, catalog=None):
+    # Routes from the stated (or profile's) current role when it is on the graph and connected; otherwise from the
+    # user's skills, plus the source role's skills when it is a catalog role without a path.
+    catalog = catalog or CATALOG
+    source_key = catalog.graph.resolve_node(source_text or user_profile.get('current_role'))
+    if source_key:
+        route = catalog.graph.roadmap(source_key, target_key)
+        if route:
+            return route
+    skill_bits = catalog.skills.encode(user_profile.get('skills', []))
+    if source_key in catalog.roles:
+        skill_bits |= catalog.roles[source_key].target_skill_bits
+    return catalog.graph.roadmap_from_skills(skill_bits, target_key)
 
 
 app = FastAPI() # THIS IS YOUR MAIN APP INSTANCE FOR VERCEL
 
 
+# --- Session Generation Store ---
+# Every committed profile write bumps a generation counter for its session. Each worker's SESSION_CACHE remembers
+# the generation it loaded and treats a hit as stale once the shared counter has moved on, so a session served by
+# several gunicorn workers never sees another worker's outdated cache entry. Counters live in hashed slots; a
+# collision only costs a spurious reload.
+SESSION_STORE_BACKEND = "shared_memory"  # "shared_memory" (cross-process) or "local" (single process)
+SESSION_GENERATION_FILE = f"{DB_NAME}.generations"
+SESSION_GENERATION_SLOTS = 1 << 16
+
+
+def map_shared_file(path: str, size: int):
+    # Returns (fd, mmap) for a zero-filled file of at least `size` bytes shared by every process that maps it.
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+    return fd, mmap.mmap(fd, size)
+
+
+def session_generation_slot(session_id: str, slots: int) -> int:
+    # crc32 rather than hash(): str hashes are salted per process and would differ between workers.
+    return zlib.crc32(session_id.encode("utf-8")) % slots
+
+
+class SessionGenerationStore(abc.ABC):
+    @abc.abstractmethod
+    def current(self, session_id: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    def bump(self, session_id: str) -> int:
+        ...
+
+    def close(self):
+        pass
+
+
+class LocalGenerationStore(SessionGenerationStore):
+    def __init__(self, slots: int = SESSION_GENERATION_SLOTS):
+        self.slots = slots
+        self._counters = [0] * slots
+        self._lock = threading.Lock()
+
+    def current(self, session_id: str) -> int:
+        return self._counters[session_generation_slot(session_id, self.slots)]
+
+    def bump(self, session_id: str) -> int:
+        slot = session_generation_slot(session_id, self.slots)
+        with self._lock:
+            self._counters[slot] += 1
+            return self._counters[slot]
+
+
+class SharedMemoryGenerationStore(SessionGenerationStore):
+    # A memory-mapped file of 64-bit counters shared by every worker on the host. Reads are lock-free; bumps take
+    # a POSIX record lock on the slot (and a thread lock, since record locks are per process).
+    def __init__(self, path: str = SESSION_GENERATION_FILE, slots: int = SESSION_GENERATION_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._fd = None
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # Opened lazily so that each forked worker maps the file itself.
+        with self._lock:
+            if self._map is None:
+                self._fd, self._map = map_shared_file(self.path, self.slots * 8)
+                logger.info(f"Mapped session generation store {self.path} ({self.slots} slots)")
+        return self._map
+
+    def current(self, session_id: str) -> int:
+        generations = self._map or self._open()
+        offset = session_generation_slot(session_id, self.slots) * 8
+        return int.from_bytes(generations[offset:offset + 8], "little")
+
+    def bump(self, session_id: str) -> int:
+        generations = self._map or self._open()
+        offset = session_generation_slot(session_id, self.slots) * 8
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 8, offset)
+            try:
+                generation = int.from_bytes(generations[offset:offset + 8], "little") + 1
+                generations[offset:offset + 8] = generation.to_bytes(8, "little")
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 8, offset)
+        return generation
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = None
+                self._fd = None
+
+
+def create_generation_store() -> SessionGenerationStore:
+    if SESSION_STORE_BACKEND == "shared_memory":
+        if fcntl is not None:
+            return SharedMemoryGenerationStore()
+        logger.warning("fcntl is unavailable; session cache coherence is limited to a single worker process.")
+    return LocalGenerationStore()
+
+
+SESSION_GENERATIONS = create_generation_store()
+
+
+# --- Session Profile Cache ---
+SESSION_CACHE_MAX_ENTRIES = 10000
+SESSION_CACHE_TTL_SECONDS = 30 * 60
+PROFILE_COLUMNS = ('name', 'current_role', 'desired_role_key', 'skills', 'goals', 'current_stage', 'chat_topic')
+PROFILE_JSON_COLUMNS = ('skills', 'goals')
+PROFILE_CONTEXT_COLUMN = 'conversation_context'  # every other profile field is kept in this JSON blob
+SKILL_BITSET_COLUMN = 'skills_bitset'  # derived from skills, never read back into the profile
+ALL_PROFILE_COLUMNS = PROFILE_COLUMNS + (PROFILE_CONTEXT_COLUMN, SKILL_BITSET_COLUMN)
+
+
+def default_user_profile() -> dict:
+    return {'name': None, 'current_role': None, 'desired_role_key': None, 'skills': [], 'goals': [],
+            'current_stage': 'greeting', 'chat_topic': None}
+
+
+class UserProfile(dict):
+    # A profile dict that records which fields were assigned since it was last persisted.
+    __slots__ = ('dirty_fields',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty_fields = set()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.dirty_fields.add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty_fields.add(key)
+
+    def update(self, *args, **kwargs):
+        changes = dict(*args, **kwargs)
+        super().update(changes)
+        self.dirty_fields.update(changes)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        self.dirty_fields.add(key)
+        return super().pop(key, *default)
+
+
+def profile_columns_for_fields(fields) -> set:
+    columns = {field if field in PROFILE_COLUMNS else PROFILE_CONTEXT_COLUMN for field in fields}
+    if 'skills' in columns:
+        columns.add(SKILL_BITSET_COLUMN)
+    return columns
+
+
+def profile_column_values(data: dict, columns=ALL_PROFILE_COLUMNS) -> dict:
+    values = {}
+    for column in columns:
+        if column == PROFILE_CONTEXT_COLUMN:
+            values[column] = json.dumps({k: v for k, v in data.items() if k not in PROFILE_COLUMNS})
+        elif column in PROFILE_JSON_COLUMNS:
+            values[column] = json.dumps(data.get(column, []))
+        elif column == SKILL_BITSET_COLUMN:
+            values[column] = CATALOG.skills.to_blob(CATALOG.skills.encode(data.get('skills', [])))
+        else:
+            values[column] = data.get(column)
+    return values
+
+
+def persist_profile_columns(session_id: str, changes: dict) -> Future:
+    assignments = ", ".join(f"{column}=?" for column in changes)
+    return WRITE_JOURNAL.submit(f"UPDATE users SET {assignments}, last_active=CURRENT_TIMESTAMP WHERE session_id=?",
+                         (*changes.values(), session_id),
+                         on_commit=lambda: SESSION_CACHE.profile_committed(session_id))
+
+
+class SessionCacheEntry:
+    __slots__ = ('data', 'persisted_columns', 'generation', 'last_access')
+
+    def __init__(self, data: UserProfile, persisted_columns: dict, generation: int):
+        self.data = data
+        self.persisted_columns = persisted_columns
+        self.generation = generation
+        self.last_access = time.monotonic()
+
+
+class SessionProfileCache:
+    # LRU + idle-TTL cache of UserProfile dicts. Each entry remembers the column values last persisted; a flush
+    # serializes only the columns behind dirty fields and writes only those whose value actually changed.
+    def __init__(self, generations: SessionGenerationStore, max_entries: int = SESSION_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = SESSION_CACHE_TTL_SECONDS):
+        self.generations = generations
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.write_backs = 0
+        self.profile_writes = 0
+        self.noop_flushes = 0
+        self.write_failures = 0
+        self._entries = OrderedDict()
+        self._pins = {}  # session_id -> number of open connections holding the profile in memory
+        self._lock = threading.RLock()
+        self._scope = threading.local()
+
+    def _is_expired(self, session_id: str, entry: SessionCacheEntry, now: float) -> bool:
+        return session_id not in self._pins and now - entry.last_access > self.ttl_seconds
+
+    def _flush_entry(self, session_id: str, entry: SessionCacheEntry, all_columns: bool = False) -> bool:
+        # all_columns also catches in-place mutations that bypassed dirty tracking (used on eviction and shutdown).
+        columns = ALL_PROFILE_COLUMNS if all_columns else profile_columns_for_fields(entry.data.dirty_fields)
+        changes = {column: value for column, value in profile_column_values(entry.data, columns).items()
+                   if column not in entry.persisted_columns or entry.persisted_columns[column] != value}
+        entry.data.dirty_fields.clear()
+        if not changes:
+            self.noop_flushes += 1
+            return False
+        # Recorded optimistically so later flushes write only newer changes; if the write fails the entry no longer
+        # mirrors the row and is dropped, so the next get() reloads what the DB actually holds.
+        entry.persisted_columns.update(changes)
+        persist_profile_columns(session_id, changes).add_done_callback(
+            lambda future: future.exception() is not None and self._write_failed(session_id, entry))
+        self.profile_writes += 1
+        return True
+
+    def _write_failed(self, session_id: str, entry: SessionCacheEntry):
+        with self._lock:
+            self.write_failures += 1
+            if self._entries.get(session_id) is entry:
+                del self._entries[session_id]
+
+    def _evict(self, session_id: str, expired: bool = False):
+        entry = self._entries.pop(session_id)
+        if expired:
+            self.expirations += 1
+        else:
+            self.evictions += 1
+        if self._flush_entry(session_id, entry, all_columns=True):
+            self.write_backs += 1
+
+    def _evict_stale(self, now: float):
+        # Entries are kept in access order, so expired ones are always at the front. Pinned entries are never
+        # evicted; an idle one is renewed and moved to the back so the scan can reach the entries behind it.
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_access <= self.ttl_seconds:
+                break
+            if session_id in self._pins:
+                entry.last_access = now
+                self._entries.move_to_end(session_id)
+            else:
+                self._evict(session_id, expired=True)
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            for session_id in list(itertools.islice(
+                    (session_id for session_id in self._entries if session_id not in self._pins), overflow)):
+                self._evict(session_id)
+
+    def _is_current(self, session_id: str, entry: SessionCacheEntry) -> bool:
+        return self.generations.current(session_id) == entry.generation
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return (entry is not None and not self._is_expired(session_id, entry, time.monotonic())
+                    and self._is_current(session_id, entry))
+
+    def get(self, session_id: str):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(session_id)
+            if entry is not None and self._is_expired(session_id, entry, now):
+                self._evict(session_id, expired=True)
+                entry = None
+            if entry is not None and not self._is_current(session_id, entry):
+                # Another worker committed a newer profile; this copy is stale and must not be written back.
+                del self._entries[session_id]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.last_access = now
+            self._entries.move_to_end(session_id)
+            return entry.data
+
+    def put(self, session_id: str, data: dict, generation: int = None) -> UserProfile:
+        # data must match the DB row as-is. Loaders should read the generation *before* reading the row, so a write
+        # that commits in between leaves the entry stale rather than silently current.
+        with self._lock:
+            profile = UserProfile(data)
+            if generation is None:
+                generation = self.generations.current(session_id)
+            self._entries[session_id] = SessionCacheEntry(profile, profile_column_values(profile), generation)
+            self._entries.move_to_end(session_id)
+            self._evict_stale(time.monotonic())
+            return profile
+
+    @contextmanager
+    def deferred_writes(self):
+        # Within this scope update() only marks sessions; each is flushed once, as a single partial UPDATE, on exit.
+        outer = getattr(self._scope, 'pending', None)
+        if outer is not None:
+            yield
+            return
+        self._scope.pending = set()
+        try:
+            yield
+        finally:
+            pending, self._scope.pending = self._scope.pending, None
+            for session_id in pending:
+                self.flush_session(session_id)
+
+    def update(self, session_id: str, data: dict) -> dict:
+        # Merges data into the cached profile and writes the changed columns through to the DB.
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = SessionCacheEntry(UserProfile(), {}, self.generations.current(session_id))
+                self._entries[session_id] = entry
+            if data is not entry.data:
+                entry.data.update(data)
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(session_id)
+            pending = getattr(self._scope, 'pending', None)
+            if pending is not None:
+                pending.add(session_id)
+            else:
+                self._flush_entry(session_id, entry)
+            self._evict_stale(entry.last_access)
+            return entry.data
+
+    @contextmanager
+    def pinned(self, session_id: str):
+        # Keeps the session's profile exempt from TTL and LRU eviction for the duration of the scope. Generation
+        # checks still apply, so a write from another worker is picked up on the next get().
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._pins.pop(session_id) - 1
+                if remaining:
+                    self._pins[session_id] = remaining
+
+    def flush_session(self, session_id: str):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._flush_entry(session_id, entry)
+
+    def profile_committed(self, session_id: str):
+        # Called on the journal writer thread after one of this worker's profile UPDATEs commits. The local entry
+        # is at least as new as that write, so it adopts the new generation unless another worker bumped in between,
+        # in which case the next get() reloads from the DB.
+        generation = self.generations.bump(session_id)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.generation == generation - 1:
+                entry.generation = generation
+
+    def flush(self):
+        with self._lock:
+            for session_id, entry in self._entries.items():
+                if self._flush_entry(session_id, entry, all_columns=True):
+                    self.write_backs += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'pinned': len(self._pins), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations,
+                    'invalidations': self.invalidations, 'write_backs': self.write_backs,
+                    'profile_writes': self.profile_writes, 'noop_flushes': self.noop_flushes,
+                    'write_failures': self.write_failures}
+
+
+SESSION_CACHE = SessionProfileCache(SESSION_GENERATIONS)
+
+
+# --- Intent Keyword Matching ---
+# Every intent keyword and every role keyword/name is compiled once into a single Aho-Corasick automaton, so a
+# message is scanned once, in time linear in its length, no matter how large the catalog grows. Matching keeps the
+# plain substring semantics of the original `k in msg_lower` checks.
+INTENT_KEYWORDS = {
+    'get_help': ["help", "options", "what can you do", "what do you do"],
+    'reset_conversation': ["reset", "start over"],
+    'provide_name': ["my name is", "call me"],
+    'skill_analysis': ["skill", "skills", "what should i learn", "gap analysis"],
+    'get_resources': ["resources", "learn", "courses", "books"],
+    'interview_prep': ["interview", "preparation", "tips"],
+    'salary_info': ["salary", "pay", "compensation"],
+    'project_ideas': ["projects", "portfolio", "examples", "accomplishments"],
+    'acknowledge': ["thank", "thanks", "cool", "ok", "got it"],
+    'best_fit_roles': ["best fit", "best match", "suits me", "suit me", "fits me", "fit me", "recommend a role"],
+    'career_roadmap': ["roadmap", "next career step", "career steps", "career progression", "get from", "path to",
+                       "move from", "switch from", "transition from"],
+    'explore_roles': ["explore roles", "explore career", "list roles", "list of careers", "career options"],
+}
+
+
+class KeywordAutomaton:
+    __slots__ = ('_transitions', '_failure', '_outputs')
+
+    def __init__(self, patterns):
+        # patterns: iterable of (keyword, label). A state's output holds the labels of every keyword ending there.
+        transitions = [{}]
+        outputs = [set()]
+        for keyword, label in patterns:
+            state = 0
+            for char in keyword:
+                next_state = transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][char] = next_state
+                    transitions.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(label)
+
+        # Breadth-first, so a state's failure target (always shallower) already has its complete output set.
+        failure = [0] * len(transitions)
+        pending = deque(transitions[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in transitions[state].items():
+                fallback = failure[state]
+                while fallback and char not in transitions[fallback]:
+                    fallback = failure[fallback]
+                failure[next_state] = transitions[fallback].get(char, 0) if state else 0
+                outputs[next_state] |= outputs[failure[next_state]]
+                pending.append(next_state)
+
+        self._transitions = transitions
+        self._failure = failure
+        self._outputs = [frozenset(labels) for labels in outputs]
+
+    def scan(self, text: str) -> set:
+        transitions = self._transitions
+        failure = self._failure
+        outputs = self._outputs
+        state = 0
+        labels = set()
+        for char in text:
+            while state and char not in transitions[state]:
+                state = failure[state]
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                labels |= outputs[state]
+        return labels
+
+
+def build_intent_matcher(career_paths: dict) -> KeywordAutomaton:
+    patterns = [(keyword, intent) for intent, keywords in INTENT_KEYWORDS.items() for keyword in keywords]
+    for role_key, path_data in career_paths.items():
+        for keyword in path_data['keywords'] + [path_data['name'].lower()]:
+            patterns.append((keyword, 'discuss_role'))
+    return KeywordAutomaton(patterns)
+
+
+# --- Intent Classifier ---
+# TF-IDF over word unigrams and bigrams. A batch of messages is a single (messages x vocabulary) @ (vocabulary x
+# phrases) cosine product, max-pooled per intent, so cost per message is fixed regardless of how many rules exist.
+# Max-pooling rather than one centroid per intent keeps broad intents like discuss_role from being averaged away.
+# A phrase only scores if it shares a content feature (one with a non-stopword token) with the message, so "what is
+# this" borrows nothing from "what is the pay". Predictions under INTENT_CLASSIFIER_MIN_SCORE defer to the keyword
+# rules.
+INTENT_CLASSIFIER_MIN_SCORE = 0.35
+INTENT_CLASSIFIER_MIN_MARGIN = 0.05  # best score must beat the runner-up by this much to count as confident
+INTENT_TOKEN_PATTERN = re.compile(r"[a-z0-9+#']+")
+INTENT_STOPWORDS = frozenset((
+    "a", "an", "the", "i", "i'm", "i'd", "me", "my", "you", "you're", "your", "we", "us", "our", "it", "it's", "its",
+    "they", "them", "their", "is", "are", "am", "be", "been", "was", "were", "do", "does", "did", "can", "could",
+    "would", "should", "will", "what", "what's", "which", "who", "how", "why", "when", "where", "this", "that", "these",
+    "those", "there", "here", "to", "of", "in", "on", "at", "by", "for", "from", "with", "about", "and", "or", "but",
+    "so", "then", "than", "too", "very", "just", "more", "some", "any", "all", "not", "no", "if", "tell", "think",
+    "know", "get", "got", "want", "let's", "thing", "one", "please",
+))
+
+INTENT_TRAINING_PHRASES = {
+    'get_help': ["help", "help me", "what are my options", "show me the options", "what can i ask you",
+                 "how does this work", "i need help", "list your features"],
+    'reset_conversation': ["reset", "start over", "let's start over", "reset the conversation", "begin again",
+                           "start from scratch", "clear everything and restart", "forget everything"],
+    'provide_name': ["my name is alex", "call me sam", "i am jordan", "i'm taylor", "my name's chris",
+                     "you can call me pat", "people call me jo", "name is morgan"],
+    'skill_analysis': ["skills", "skill gap analysis", "what should i learn", "analyze my skills",
+                       "what skills do i need", "which skills am i missing", "am i qualified",
+                       "what am i missing for this role", "check my skills", "compare my skills to the role",
+                       "what skills should i improve", "skill gap"],
+    'get_resources': ["resources", "learning resources", "recommend courses", "any good books",
+                      "where can i learn", "how do i learn this", "suggest some tutorials", "study material",
+                      "courses for this role", "resources for python", "what should i read", "learn"],
+    'interview_prep': ["interview tips", "interview", "how do i prepare for the interview", "interview preparation",
+                       "what do they ask in interviews", "help me prepare for interviews",
+                       "common interview questions", "tips for the job interview", "preparation", "tips"],
+    'salary_info': ["salary", "what is the pay", "how much does it pay", "how much can i earn",
+                    "compensation", "what's the salary range", "how much money", "average salary",
+                    "how much do they make", "is it well paid", "pay", "which role pays the most",
+                    "which role has the best salary"],
+    'project_ideas': ["projects", "project ideas", "portfolio ideas", "what should i build", "examples of projects",
+                      "accomplishments", "portfolio", "give me some project examples", "side project ideas",
+                      "what can i put in my portfolio"],
+    'acknowledge': ["thanks", "thank you", "ok", "okay", "cool", "great thanks", "sounds good",
+                    "perfect", "awesome thank you", "nice", "understood"],
+    'best_fit_roles': ["best fit roles", "which role fits me best", "what role suits me", "which career fits my skills",
+                       "recommend a role for me", "what jobs match my skills", "roles that match my skills",
+                       "find my best match", "which path is best for me"],
+    'career_roadmap': ["roadmap", "next career steps", "career roadmap", "how do i move from one role to another",
+                       "what is the path to get there", "career progression", "what comes after this role",
+                       "where can this role lead", "show me my roadmap", "what are the steps to get there"],
+    'explore_roles': ["explore roles", "explore careers", "what careers do you know about", "list the roles",
+                      "show me all the career paths", "what roles are there", "which careers can you tell me about",
+                      "what career options are there", "what are my career options", "browse roles",
+                      "list of careers"],
+}
+# Every quick reply the coach offers, with the intent it must route to. "{role}" is any role name and "{skill}" any
+# catalog skill. Clicked quick replies are routed by exact lookup; the role-level ones also train the classifier so
+# typed variants land in the same place, and load_catalog checks that every variant routes as listed.
+QUICK_REPLY_INTENTS = {
+    "Explore career paths": 'explore_roles',
+    "Skill gap analysis": 'skill_analysis',
+    "Analyze my skills for this role": 'skill_analysis',
+    "Tell me more about these skills": 'skill_analysis',
+    "Learning resources": 'get_resources',
+    "General resources": 'get_resources',
+    "More on foundational skills": 'get_resources',
+    "Resources for {skill}": 'get_resources',
+    "Interview tips": 'interview_prep',
+    "Interview prep": 'interview_prep',
+    "Common behavioral questions": 'interview_prep',
+    "Role-specific questions for {role}": 'interview_prep',
+    "Typical projects/accomplishments": 'project_ideas',
+    "Project ideas/accomplishments": 'project_ideas',
+    "Project ideas for {role}": 'project_ideas',
+    "Roles that fit me best": 'best_fit_roles',
+    "Next career steps": 'career_roadmap',
+    "More about {role}": 'discuss_role',
+    "Help": 'get_help',
+}
+# Typed phrasings that must keep routing as listed, checked with the quick replies whenever a catalog is compiled.
+# 'unknown' is the "try 'help'" fallback; most of these are built from stopwords and must not borrow an intent from a
+# training phrase that shares only "what", "is" or "you" with them.
+INTENT_ROUTING_CHECKS = {
+    "what is this": 'unknown',
+    "what's the best thing to do": 'unknown',
+    "can you": 'unknown',
+    "what do you think": 'unknown',
+    "tell me more": 'unknown',
+    "I know JavaScript": 'unknown',
+    "I want to get from teacher to {role}": 'career_roadmap',
+    "How can I move from HR manager to {role}": 'career_roadmap',
+}
+INTENT_ROLE_PHRASE_TEMPLATES = ["{}", "tell me about {}", "i want to be a {}", "what does a {} do",
+                                "i'm interested in {}", "how do i become a {}"]
+
+
+def intent_features(message: str) -> list:
+    tokens = INTENT_TOKEN_PATTERN.findall(message.lower())
+    return tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+
+
+def phrasing_variants(phrasings: dict, career_paths: dict, skills=()) -> list:
+    # (message, intended intent) for every phrasing, expanded over role names and the given skills.
+    variants = []
+    for phrasing, intent in phrasings.items():
+        if "{role}" in phrasing:
+            variants.extend((phrasing.format(role=path_data['name']), intent) for path_data in career_paths.values())
+        elif "{skill}" in phrasing:
+            variants.extend((phrasing.format(skill=skill.title()), intent) for skill in skills)
+        else:
+            variants.append((phrasing, intent))
+    return variants
+
+
+def quick_reply_variants(career_paths: dict, skills=()) -> list:
+    return phrasing_variants(QUICK_REPLY_INTENTS, career_paths, skills)
+
+
+def intent_training_examples(career_paths: dict) -> list:
+    examples = [(phrase, intent) for intent, phrases in INTENT_TRAINING_PHRASES.items() for phrase in phrases]
+    examples.extend((quick_reply.lower(), intent) for quick_reply, intent in quick_reply_variants(career_paths))
+    for path_data in career_paths.values():
+        for role_phrase in path_data['keywords'] + [path_data['name'].lower()]:
+            examples.extend((template.format(role_phrase), 'discuss_role') for template in INTENT_ROLE_PHRASE_TEMPLATES)
+    return examples
+
+
+class IntentClassifier:
+    def __init__(self, examples):
+        examples = sorted(examples, key=lambda example: example[1])
+        self.labels = sorted({intent for _, intent in examples})
+        # Examples are grouped by label, so each intent's phrases are one contiguous column range for reduceat.
+        self.label_starts = np.searchsorted([intent for _, intent in examples], self.labels)
+        example_features = [intent_features(phrase) for phrase, _ in examples]
+
+        self.vocabulary = {}
+        for features in example_features:
+            for feature in features:
+                self.vocabulary.setdefault(feature, len(self.vocabulary))
+
+        document_frequency = np.zeros(len(self.vocabulary))
+        for features in example_features:
+            document_frequency[[self.vocabulary[feature] for feature in set(features)]] += 1
+        self.idf = np.log((1 + len(examples)) / (1 + document_frequency)) + 1
+
+        self.weights = np.ascontiguousarray(self._vectorize(example_features).T)
+        self._index_content_features()
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        classifier = cls.__new__(cls)
+        classifier.labels = arrays['intent_labels'].tolist()
+        classifier.label_starts = arrays['intent_label_starts']
+        classifier.vocabulary = {feature: column for column, feature in enumerate(arrays['intent_vocabulary'].tolist())}
+        classifier.idf = arrays['intent_idf']
+        classifier.weights = arrays['intent_weights']
+        classifier._index_content_features()
+        return classifier
+
+    def _index_content_features(self):
+        # Derived from the vocabulary and weights, so snapshots need not carry it.
+        self.content_columns = np.array([any(token not in INTENT_STOPWORDS for token in feature.split())
+                                         for feature in self.vocabulary], dtype=bool)
+        self.content_phrases = (self.weights[self.content_columns] > 0).astype(np.float32)
+
+    def snapshot_arrays(self) -> dict:
+        # The vocabulary dict is filled in column order, so its keys alone record each feature's column.
+        return {'intent_labels': np.array(self.labels), 'intent_label_starts': self.label_starts,
+                'intent_vocabulary': np.array(list(self.vocabulary)), 'intent_idf': self.idf,
+                'intent_weights': self.weights}
+
+    def _vectorize(self, feature_lists: list) -> np.ndarray:
+        # Builds the (rows x vocabulary) matrix from COO triples; out-of-vocabulary features are dropped.
+        rows, columns = [], []
+        for row, features in enumerate(feature_lists):
+            for feature in features:
+                column = self.vocabulary.get(feature)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        matrix = np.zeros((len(feature_lists), len(self.vocabulary)))
+        np.add.at(matrix, (rows, columns), 1.0)
+        np.log1p(matrix, out=matrix)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    def classify(self, messages: list) -> list:
+        # Returns one (intent, score) per message; intent is None when the classifier is not confident.
+        if not messages:
+            return []
+        features = self._vectorize([intent_features(message) for message in messages])
+        similarities = features @ self.weights
+        shared_content = (features[:, self.content_columns] > 0).astype(np.float32) @ self.content_phrases
+        similarities[shared_content == 0] = 0
+        scores = np.maximum.reduceat(similarities, self.label_starts, axis=1)
+        order = np.argsort(scores, axis=1)
+        predictions = []
+        for row, ranked in enumerate(order):
+            best, runner_up = scores[row, ranked[-1]], scores[row, ranked[-2]]
+            confident = best >= INTENT_CLASSIFIER_MIN_SCORE and best - runner_up >= INTENT_CLASSIFIER_MIN_MARGIN
+            predictions.append((self.labels[ranked[-1]] if confident else None, float(best)))
+        return predictions
+
+
+# Keyword-rule intents ranked above discuss_role. Their messages tend to name roles ("get from teacher to data
+# scientist"), and role names outweigh everything else in the classifier's scores, so their keywords also override a
+# discuss_role prediction.
+ROLE_MENTIONING_INTENTS = ('explore_roles', 'best_fit_roles', 'career_roadmap')
+
+
+def keyword_rule_intent(msg_lower: str, user_profile: dict, catalog=None) -> str:
+    matched_intents = (catalog or CATALOG).intent_matcher.scan(msg_lower)
+    if 'get_help' in matched_intents:
+        return 'get_help'
+    if 'reset_conversation' in matched_intents:
+        return 'reset_conversation'
+    if 'provide_name' in matched_intents or (not user_profile.get('name') and len(msg_lower.split()) <= 3):
+        return 'provide_name'
+    for intent in ROLE_MENTIONING_INTENTS + ('discuss_role', 'skill_analysis', 'get_resources', 'interview_prep',
+                                             'salary_info', 'project_ideas', 'acknowledge'):
+        if intent in matched_intents:
+            return intent
+    return "unknown"
+
+
+def typed_intent(predicted, msg_lower: str, user_profile: dict, catalog=None) -> str:
+    # Combines the classifier's prediction (None when not confident) for a typed message with the keyword rules.
+    keyword_intent = keyword_rule_intent(msg_lower, user_profile, catalog)
+    if predicted is None or (predicted == 'discuss_role' and keyword_intent in ROLE_MENTIONING_INTENTS):
+        return keyword_intent
+    return predicted
+
+
+def route_intent(msg_lower: str, user_profile: dict, catalog=None) -> str:
+    catalog = catalog or CATALOG
+    return (catalog.quick_reply_intents.get(msg_lower)
+            or typed_intent(catalog.intent_classifier.classify([msg_lower])[0][0], msg_lower, user_profile, catalog))
+
+
+# --- Fuzzy Term Matching ---
+# Character-trigram index over catalog vocabulary for typo-tolerant lookups ("pyhton", "UX desiner"). The trigram
+# postings shortlist at most FUZZY_MAX_CANDIDATES terms, and only those are verified with a bounded edit distance, so
+# a lookup never pays for an edit-distance scan over the whole catalog.
+FUZZY_MATCH_THRESHOLD = 0.8
+FUZZY_MAX_CANDIDATES = 5
+FUZZY_MIN_TRIGRAM_SIMILARITY = 0.2  # Jaccard overlap a term needs to be shortlisted at all
+FUZZY_MIN_TERM_LENGTH = 4  # shorter inputs share too few trigrams to correct reliably
+
+
+def normalize_catalog_term(term: str) -> str:
+    return " ".join(term.lower().replace("_", " ").split())
+
+
+def term_trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, max_distance: int):
+    # Optimal string alignment distance (adjacent transpositions count as one edit), or None once it exceeds max_distance.
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before_previous_row, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous_row[j - 2] + 1)
+        if min(row) > max_distance:
+            return None
+    return row[-1] if row[-1] <= max_distance else None
+
+
+class TrigramIndex:
+    def __init__(self, terms):
+        self.terms = sorted(set(terms))
+        self.term_set = frozenset(self.terms)
+        self.trigram_counts = []
+        self.postings = {}  # trigram -> [term id]
+        for term_id, term in enumerate(self.terms):
+            trigrams = term_trigrams(term)
+            self.trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self.postings.setdefault(trigram, []).append(term_id)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.term_set
+
+    def lookup(self, text: str, limit: int = FUZZY_MAX_CANDIDATES, threshold: float = FUZZY_MATCH_THRESHOLD) -> list:
+        # Returns [(term, similarity)] best first, only for terms at or above the threshold.
+        if text in self.term_set:
+            return [(text, 1.0)]
+        if len(text) < FUZZY_MIN_TERM_LENGTH:
+            return []
+
+        query_trigrams = term_trigrams(text)
+        shared = {}
+        for trigram in query_trigrams:
+            for term_id in self.postings.get(trigram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        overlaps = []
+        for term_id, shared_count in shared.items():
+            overlap = shared_count / (len(query_trigrams) + self.trigram_counts[term_id] - shared_count)
+            if overlap >= FUZZY_MIN_TRIGRAM_SIMILARITY:
+                overlaps.append((overlap, term_id))
+
+        matches = []
+        for _, term_id in heapq.nlargest(limit, overlaps):
+            term = self.terms[term_id]
+            longest = max(len(text), len(term))
+            distance = bounded_edit_distance(text, term, int(longest * (1 - threshold)))
+            if distance is not None:
+                matches.append((term, 1 - distance / longest))
+        return sorted(matches, key=lambda item: item[1], reverse=True)
+
+    def correct(self, text: str):
+        matches = self.lookup(text, limit=FUZZY_MAX_CANDIDATES)
+        return matches[0][0] if matches else None
+
+
+def build_skill_index(career_paths: dict) -> TrigramIndex:
+    terms = []
+    for path_data in career_paths.values():
+        terms.extend(path_data['required_skills'])
+        terms.extend(path_data.get('soft_skills_emphasis', []))
+        terms.extend(path_data['learning_resources'].keys())
+    return TrigramIndex(normalize_catalog_term(term) for term in terms)
+
+
+def canonicalize_skill(skill: str, catalog=None) -> str:
+    # Snap a user-typed skill onto the catalog spelling when it is a near miss; unknown skills are kept as typed.
+    return (catalog or CATALOG).skill_index.correct(normalize_catalog_term(skill)) or skill
+
+
+# --- Role Resolution ---
+# A token-level inverted index over every role's name and keywords. One pass over the message's tokens collects
+# exact matches, whole-phrase matches and IDF-weighted token overlap for all roles at once, and returns candidates
+# ranked by score instead of the first hit in dict order.
+ROLE_EXACT_MATCH_SCORE = 1000.0
+ROLE_PHRASE_TOKEN_SCORE = 10.0
+ROLE_NAME_PHRASE_BONUS = 5.0
+ROLE_AMBIGUITY_RATIO = 0.8  # candidates scoring within this fraction of the best one are treated as a tie
+ROLE_MAX_CLARIFY_OPTIONS = 4
+ROLE_TOKEN_PATTERN = re.compile(r"[a-z0-9+#]+")
+
+
+def tokenize_role_text(text: str) -> tuple:
+    return tuple(ROLE_TOKEN_PATTERN.findall(text.lower()))
+
+
+class RoleIndex:
+    def __init__(self, career_paths: dict):
+        self.exact_phrases = {}  # token tuple -> {role_key}
+        self.phrases_by_first_token = {}  # token -> [(token tuple, role_key, phrase score)]
+        self.postings = {}  # token -> {role_key: idf}
+
+        role_tokens = {}
+        for role_key, path_data in career_paths.items():
+            phrases = [(tokenize_role_text(path_data['name']), ROLE_NAME_PHRASE_BONUS)]
+            phrases += [(tokenize_role_text(keyword), 0.0) for keyword in path_data['keywords']]
+            for tokens, bonus in phrases:
+                if not tokens:
+                    continue
+                self.exact_phrases.setdefault(tokens, set()).add(role_key)
+                self.phrases_by_first_token.setdefault(tokens[0], []).append(
+                    (tokens, role_key, ROLE_PHRASE_TOKEN_SCORE * len(tokens) + bonus))
+                role_tokens.setdefault(role_key, set()).update(tokens)
+        self.vocabulary = TrigramIndex(token for tokens in role_tokens.values() for token in tokens)
+
+        document_frequency = {}
+        for tokens in role_tokens.values():
+            for token in tokens:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        role_count = max(len(role_tokens), 1)
+        for role_key, tokens in role_tokens.items():
+            for token in tokens:
+                idf = math.log(1 + role_count / document_frequency[token])
+                self.postings.setdefault(token, {})[role_key] = idf
+
+    def resolve(self, message: str) -> list:
+        # Returns [(role_key, score)] best first; empty when no token of the message belongs to any role.
+        tokens = tokenize_role_text(message)
+        scores = {}
+        for role_key in self.exact_phrases.get(tokens, ()):
+            scores[role_key] = ROLE_EXACT_MATCH_SCORE
+
+        best_phrase = {}
+        for position, token in enumerate(tokens):
+            for phrase_tokens, role_key, phrase_score in self.phrases_by_first_token.get(token, ()):
+                if tokens[position:position + len(phrase_tokens)] == phrase_tokens:
+                    best_phrase[role_key] = max(best_phrase.get(role_key, 0.0), phrase_score)
+        for role_key, phrase_score in best_phrase.items():
+            scores[role_key] = scores.get(role_key, 0.0) + phrase_score
+
+        for token in set(tokens):
+            for role_key, idf in self.postings.get(token, {}).items():
+                scores[role_key] = scores.get(role_key, 0.0) + idf
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def correct_typos(self, message: str) -> str:
+        corrected = [token if token in self.vocabulary else (self.vocabulary.correct(token) or token)
+                     for token in tokenize_role_text(message)]
+        return " ".join(corrected)
+
+    def best_matches(self, message: str) -> list:
+        # The top candidate alone, or every candidate close enough to it to be ambiguous (e.g. "designer").
+        # Unknown tokens are snapped to the role vocabulary first, so "data scince" resolves like "data science".
+        candidates = self.resolve(self.correct_typos(message))
+        if not candidates:
+            return []
+        top_score = candidates[0][1]
+        return [role_key for role_key, score in candidates[:ROLE_MAX_CLARIFY_OPTIONS]
+                if score >= top_score * ROLE_AMBIGUITY_RATIO]
+
+
+# --- Markdown Rendering ---
+# One walk over the lines renders headings, emphasis, list items and list wrapping; links and inline code, which may
+# span lines, are then applied to the joined text. The output matches the older chain of whole-text re.sub passes
+# exactly, quirks included: blank lines before a list item are dropped, and whitespace after a list's last item
+# (up to the next line's text) stays inside the closing </ul>.
+MARKDOWN_HEADING_PREFIX = "### "
+MARKDOWN_BULLETS = "-*+"
+MARKDOWN_STRONG_STAR = re.compile(r'\*\*(.*?)\*\*')
+MARKDOWN_STRONG_UNDERSCORE = re.compile(r'__(.*?)__')
+MARKDOWN_EM_STAR = re.compile(r'(?<![a-zA-Z0-9*])\*(?!\s|\*)([^\*\n]+?)(?<!\s|\*)\*(?![a-zA-Z0-9*])')
+MARKDOWN_EM_UNDERSCORE = re.compile(r'(?<![a-zA-Z0-9_])_(?!\s|_)([^_\n]+?)(?<!\s|_)_(?![a-zA-Z0-9_])')
+MARKDOWN_LINK = re.compile(r'\[([^\]]+)\]\(([^\)]+)\)')
+MARKDOWN_CODE = re.compile(r'`([^`]+)`')
+RENDERED_HTML_CACHE_MAX_ENTRIES = 4096
+
+
+def render_inline_markdown(line: str) -> str:
+    # Emphasis never crosses a line break, so rendering line by line matches rendering the whole text.
+    if '**' in line:
+        line = MARKDOWN_STRONG_STAR.sub(r'<strong>\1</strong>', line)
+    if '__' in line:
+        line = MARKDOWN_STRONG_UNDERSCORE.sub(r'<strong>\1</strong>', line)
+    if '*' in line:
+        line = MARKDOWN_EM_STAR.sub(r'<em>\1</em>', line)
+    if '_' in line:
+        line = MARKDOWN_EM_UNDERSCORE.sub(r'<em>\1</em>', line)
+    return line
+
+
+def next_text_line(lines: list, start: int) -> int:
+    # Index of the first line at or after start holding anything but whitespace, or len(lines).
+    while start < len(lines) and (not lines[start] or lines[start].isspace()):
+        start += 1
+    return start
+
+
+def render_list_items(lines: list) -> list:
+    # A bullet line becomes "<li>text</li>", swallowing the blank lines before it; a bullet with nothing after it
+    # takes its text from the next non-blank line.
+    rendered = []
+    i = 0
+    while i < len(lines):
+        j = next_text_line(lines, i)
+        if j == len(lines):
+            rendered.extend(lines[i:])
+            break
+        stripped = lines[j].lstrip()
+        after_bullet = stripped[1:]
+        if stripped[0] not in MARKDOWN_BULLETS or (after_bullet and not after_bullet[0].isspace()) or (
+                not after_bullet and j == len(lines) - 1):
+            rendered.extend(lines[i:j + 1])
+            i = j + 1
+            continue
+        item_text = after_bullet.lstrip()
+        if item_text:
+            i = j + 1
+        else:
+            k = next_text_line(lines, j + 1)
+            item_text = lines[k].lstrip() if k < len(lines) else ""
+            i = k + 1
+        rendered.append(f"<li>{item_text}</li>")
+    return rendered
+
+
+def render_markdown(text: str) -> str:
+    if not isinstance(text, str): return str(text)
+
+    lines = escape_html(text).split("\n")
+    for index, line in enumerate(lines):
+        if line.startswith(MARKDOWN_HEADING_PREFIX):
+            line = f"<h3>{line[len(MARKDOWN_HEADING_PREFIX):]}</h3>"
+        if '*' in line or '_' in line:
+            line = render_inline_markdown(line)
+        lines[index] = line
+    lines = render_list_items(lines)
+
+    # Line breaks become <br>. A run of list items is wrapped in <ul>, and the closing tag lands after the whitespace
+    # that follows the run; a <br> directly before </ul> is dropped.
+    segments = []
+    i = 0
+    while i < len(lines):
+        if not lines[i].startswith("<li>"):
+            segments.append(lines[i])
+            i += 1
+            continue
+        run_start = i
+        while i < len(lines) and lines[i].startswith("<li>"):
+            i += 1
+        segments.append("<ul>" + lines[run_start])
+        segments.extend(lines[run_start + 1:i])
+        if i == len(lines):
+            segments[-1] += "</ul>"
+            break
+        k = next_text_line(lines, i)
+        if k == len(lines):
+            k -= 1
+        segments.extend(lines[i:k])
+        closing_line = lines[k]
+        text_start = len(closing_line) - len(closing_line.lstrip())
+        closed = closing_line[:text_start] + "</ul>" + closing_line[text_start:]
+        if text_start:
+            segments.append(closed)
+        else:
+            segments[-1] += closed
+        i = k + 1
+    html = "<br>".join(segments)
+
+    if '](' in html:
+        html = MARKDOWN_LINK.sub(r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', html)
+    if '`' in html:
+        html = MARKDOWN_CODE.sub(r'<code>\1</code>', html)
+    return html
+
+
+def escape_html(unsafe_text: str) -> str:
+    if not isinstance(unsafe_text, str): return str(unsafe_text)
+    return unsafe_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace(
+        "'", "&#039;")
+
+
+class RenderedHtmlCache:
+    # LRU of rendered Markdown keyed by a digest of the source text, so history pages re-serve stored replies
+    # without re-rendering them.
+    def __init__(self, max_entries: int = RENDERED_HTML_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, text: str) -> str:
+        if not isinstance(text, str):
+            return render_markdown(text)
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+        html = render_markdown(text)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = html
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+RENDERED_HTML_CACHE = RenderedHtmlCache()
+
+
+# --- Precomputed Role Replies ---
+# Replies that depend only on the role (interview prep, resources, salary, project ideas) are built once per catalog,
+# keyed by (intent, role_key), or (intent, role_key, resource_category) for single-category resource answers. Each
+# carries its rendered HTML and serialized metadata, so serving one is a dictionary lookup.
+HELP_OPTIONS = (
+    "Explore career paths (e.g., 'Tell me about Software Engineering')",
+    "Get a skill gap analysis (e.g., 'Analyze my skills for Data Science')",
+    "Find the roles that best fit your skills (e.g., 'Which role fits me best?')",
+    "See a roadmap from your current role to your target (e.g., 'Show me my roadmap')",
+    "Find learning resources (e.g., 'Resources for Python')",
+    "Receive interview tips (e.g., 'Interview prep for Product Manager')",
+    "Discuss salary expectations",
+    "Get project ideas for a role",
+    "Update my skills (e.g., 'I know JavaScript')",
+    "Type 'reset' to start our conversation over."
+)
+HELP_REPLY_SUFFIX = "I can help you with:\n- " + "\n- ".join(HELP_OPTIONS)
+HELP_QUICK_REPLIES = ("Explore career paths", "Skill gap analysis", "Learning resources")
+GENERAL_INTERVIEW_TIPS = (
+    "### General Interview Best Practices:",
+    "- **Research**: Deeply understand the company, its products, and culture. Align your answers with their values.",
+    "- **STAR Method**: For behavioral questions (Situation, Task, Action, Result). Prepare specific examples.",
+    "- **Practice**: Conduct mock interviews. Record yourself to spot areas for improvement.",
+    "- **Questions for Interviewer**: Prepare 2-3 insightful questions about the role, team, or company challenges.",
+    "- **Logistics**: Test your tech for virtual interviews. For in-person, plan your route and arrive early.",
+    "- **Follow-Up**: Send a personalized thank-you email within 24 hours.",
+)
+
+
+class RoleReply:
+    __slots__ = ('reply', 'type', 'metadata', 'reply_html', 'metadata_json')
+
+    def __init__(self, reply: str, reply_type: str = "text", metadata: dict = None):
+        self.reply = reply
+        self.type = reply_type
+        self.metadata = metadata or {}  # shared by every turn that serves this reply; never mutate it
+        self.reply_html = render_markdown(reply)
+        self.metadata_json = json.dumps(self.metadata)
+
+
+def build_role_replies(roles) -> dict:
+    replies = {}
+    role_lines = ["### Career paths I can tell you about:"]
+    role_lines.extend(f"- **{role.name}**: {role.responsibilities_summary}" for role in roles.values())
+    role_lines.append("\nWhich one would you like to explore?")
+    replies[('explore_roles', None)] = RoleReply("\n".join(role_lines), "quick_reply_prompt",
+                                                 {'quick_replies': [role.name for role in roles.values()]})
+    for role in roles.values():
+        resource_quick_replies = ["More on foundational skills", "Interview prep", f"Project ideas for {role.name}"]
+        replies[('get_resources', role.key)] = RoleReply(
+            role.resource_overview + "\n\nIs there a specific skill or area within this role you'd like to focus on?",
+            "quick_reply_prompt", {'quick_replies': resource_quick_replies})
+        for category, resource_desc in role.learning_resources.items():
+            replies[('get_resources', role.key, category)] = RoleReply(
+                f"For **{category.replace('_', ' ').title()}** relevant to a **{role.name}**: {resource_desc}.",
+                "quick_reply_prompt", {'quick_replies': resource_quick_replies})
+
+        tips = GENERAL_INTERVIEW_TIPS + (f"\n### Specific Focus for **{role.name}** Interviews:",
+                                         role.interview_focus_display,
+                                         "\nWould you like common behavioral questions, or example technical/role-specific questions for this role?")
+        replies[('interview_prep', role.key)] = RoleReply(
+            "\n".join(tips), "quick_reply_prompt",
+            {'quick_replies': ["Common behavioral questions", f"Role-specific questions for {role.name}",
+                               "Resources for this role"]})
+
+        replies[('salary_info', role.key)] = RoleReply(
+            f"The typical salary range for a **{role.name}** in the US is approximately **{role.avg_salary_range}**. This can vary significantly based on location, experience, company size, and specific skill set. Sites like Glassdoor, Levels.fyi, and LinkedIn Salary can provide more localized data.")
+
+        project_type_term = role.project_type_term
+        if role.example_projects:
+            project_reply = (f"### Example {project_type_term.capitalize()} for a **{role.name}**:\n" + role.example_projects_display
+                             + f"\n\nBuilding relevant {project_type_term} is a great way to learn and showcase your skills!")
+        else:
+            project_reply = f"I don't have specific {project_type_term} for {role.name} right now, but generally, look for experiences that allow you to practice the core skills of the role and solve a real (even small) problem or demonstrate key competencies."
+        replies[('project_ideas', role.key)] = RoleReply(project_reply)
+    return replies
+
+
+# --- Career Catalog Snapshot ---
+# Everything derived from the role data (compiled roles, skill vocabulary, indexes, intent models, fit matrix and
+# career graph) lives on one CareerCatalog. Compiling it is the slow part of a cold start, and nearly all of that is
+# training the intent classifier and solving the career graph's shortest paths, so those arrays are saved next to the
+# database as an .npz archive, keyed by a hash of the data file and of this module. Later workers load them with
+# allow_pickle=False (the file can hold plain arrays only, never code) and rebuild the rest from the data file. A
+# background thread watches the data file and swaps in a freshly built catalog when it changes; each chat turn reads
+# CATALOG once, so a turn never mixes two versions.
+CATALOG_SNAPSHOT_FILE = f"{DB_NAME}.catalog"
+CATALOG_SNAPSHOT_MAGIC = b"CCATSNAP"
+CATALOG_RELOAD_INTERVAL_SECONDS = 2.0
+with open(os.path.abspath(__file__), 'rb') as module_file:
+    # Compiled objects mirror this module's classes, so a code change invalidates old snapshots too.
+    CATALOG_CODE_FINGERPRINT = hashlib.sha256(module_file.read()).digest()
+
+
+class CareerCatalog:
+    def __init__(self, career_paths: dict, source_hash: str, snapshot: dict = None):
+        # snapshot: arrays from snapshot_arrays() of a catalog built from the same data by the same code.
+        self.source_hash = source_hash
+        self.paths = career_paths
+        self.skills = SkillVocabulary(career_paths)
+        self.roles = types.MappingProxyType({key: CompiledRole(key, path_data, self.skills)
+                                             for key, path_data in career_paths.items()})
+        self.role_keys = tuple(self.roles)
+        self.skill_index = build_skill_index(career_paths)
+        self.role_index = RoleIndex(career_paths)
+        self.intent_matcher = build_intent_matcher(career_paths)
+        self.intent_classifier = (IntentClassifier.from_arrays(snapshot) if snapshot is not None
+                                  else IntentClassifier(intent_training_examples(career_paths)))
+        # Quick replies come back verbatim, so they are routed by lookup; skill names can collide with role keywords.
+        self.quick_reply_intents = {message.lower(): intent for message, intent
+                                    in quick_reply_variants(career_paths, self.skills.skills)}
+        self.role_skill_matrix, self.role_skill_counts = build_role_skill_matrix(self.roles, self.skills)
+        self.graph = CareerGraph(self.roles, self.role_index, snapshot)
+        self.role_replies = build_role_replies(self.roles)
+        self.reply_html = {reply.reply: reply.reply_html for reply in self.role_replies.values()}
+
+    def snapshot_arrays(self) -> dict:
+        return {**self.intent_classifier.snapshot_arrays(), **self.graph.snapshot_arrays()}
+
+
+def parse_career_paths(data: bytes) -> dict:
+    career_paths = json.loads(data)
+    for key, path_data in career_paths.items():
+        missing = [field for field in CATALOG_REQUIRED_FIELDS if field not in path_data]
+        if missing:
+            raise ValueError(f"Career path '{key}' is missing {', '.join(missing)}")
+    return career_paths
+
+
+def misrouted_phrasings(catalog: CareerCatalog) -> list:
+    # A clicked quick reply is routed by lookup, but the same words typed by hand go through the classifier and the
+    # keyword rules, which must agree with QUICK_REPLY_INTENTS too, as must INTENT_ROUTING_CHECKS. Skill variants are
+    # lookup-only.
+    profile = {'name': 'Explorer', 'current_stage': 'general_query'}
+    variants = quick_reply_variants(catalog.paths) + phrasing_variants(INTENT_ROUTING_CHECKS, catalog.paths)
+    predictions = catalog.intent_classifier.classify([message.lower() for message, _ in variants])
+    misrouted = []
+    for (message, intent), (predicted, _) in zip(variants, predictions):
+        routed = typed_intent(predicted, message.lower(), profile, catalog)
+        if routed != intent:
+            misrouted.append((message, intent, routed))
+    return misrouted
+
+
+def read_catalog_snapshot(path: str, header: bytes):
+    try:
+        with np.load(path, allow_pickle=False) as snapshot:
+            if snapshot['header'].tobytes() != header:
+                return None
+            return {name: snapshot[name] for name in snapshot.files if name != 'header'}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logger.warning(f"Ignoring unreadable catalog snapshot {path}: {e}")
+        return None
+
+
+def write_catalog_snapshot(path: str, header: bytes, catalog: CareerCatalog):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            np.savez(f, header=np.frombuffer(header, dtype=np.uint8), **catalog.snapshot_arrays())
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write catalog snapshot {path}: {e}")
+
+
+def load_catalog(data: bytes, snapshot_path: str = CATALOG_SNAPSHOT_FILE) -> CareerCatalog:
+    source_hash = hashlib.sha256(data).hexdigest()
+    header = CATALOG_SNAPSHOT_MAGIC + hashlib.sha256(data + CATALOG_CODE_FINGERPRINT).digest()
+    snapshot = read_catalog_snapshot(snapshot_path, header)
+    if snapshot is not None:
+        catalog = CareerCatalog(parse_career_paths(data), source_hash, snapshot)
+        logger.info(f"Loaded career catalog from snapshot {snapshot_path} ({len(catalog.roles)} roles).")
+        return catalog
+    catalog = CareerCatalog(parse_career_paths(data), source_hash)
+    for message, intent, routed in misrouted_phrasings(catalog):
+        logger.error(f"Typed '{message}' routes to '{routed}' instead of '{intent}'.")
+    write_catalog_snapshot(snapshot_path, header, catalog)
+    logger.info(f"Compiled career catalog ({len(catalog.roles)} roles, {len(catalog.skills)} skills).")
+    return catalog
+
+
+def swap_catalog(catalog: CareerCatalog) -> bool:
+    # Returns whether the skill vocabulary changed.
+    global CATALOG
+    previous, CATALOG = CATALOG, catalog
+    if previous.skills.fingerprint == catalog.skills.fingerprint:
+        return False
+    # Stored bitsets are tagged with the old vocabulary; bring them over before cohort queries skip them. Every worker
+    # reloads, but one re-encode is enough: workers that find the lock held leave it to its holder.
+    with schema_migration_lock(blocking=False) as acquired:
+        if acquired:
+            sync_skill_bitsets()
+    return True
+
+
+class CatalogReloader:
+    def __init__(self, path: str = CATALOG_DATA_FILE, interval: float = CATALOG_RELOAD_INTERVAL_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self._bitset_resync_due = False
+        self._signature = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _stat_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> CareerCatalog:
+        self._signature = self._stat_signature()
+        with open(self.path, 'rb') as f:
+            return load_catalog(f.read())
+
+    def check(self) -> bool:
+        # Cheap stat first; the file is only read and hashed once its mtime or size moves.
+        try:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return False
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            self._signature = signature
+            if hashlib.sha256(data).hexdigest() == CATALOG.source_hash:
+                return False
+            catalog = load_catalog(data)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Keeping the current career catalog; reloading {self.path} failed: {e}")
+            return False
+        self._bitset_resync_due = swap_catalog(catalog)
+        self.reloads += 1
+        logger.info(f"Reloaded career catalog from {self.path} ({len(catalog.roles)} roles).")
+        return True
+
+    def resync_skill_bitsets(self):
+        # Profile writes encoded against the old vocabulary (queued in this worker's journal at the swap, or from
+        # workers that had not reloaded yet) can commit after the swap's re-encode passed their rows. One interval
+        # later they have landed, and every worker runs this after its own swap, so the last one to reload sweeps up
+        # the rest. The lock is waited for here; a pass over already re-encoded rows reads nothing.
+        try:
+            with schema_migration_lock():
+                sync_skill_bitsets()
+            self._bitset_resync_due = False
+        except sqlite3.Error as e:
+            logger.error(f"Re-encoding skills_bitset after a catalog reload failed; retrying next interval: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._bitset_resync_due:
+                self.resync_skill_bitsets()
+            self.check()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="coach-catalog-reloader", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+
+CATALOG_RELOADER = CatalogReloader()
+CATALOG = CATALOG_RELOADER.load()
+
+
 # --- AI Response Logic ---
 def get_user_profile(session_id: str) -> dict:
-    # Consider if USER_CONTEXT is truly beneficial here if each request is isolated
-    # It might be simpler to always fetch from DB if instances don't share USER_CONTEXT
-    if session_id in USER_CONTEXT and USER_CONTEXT[session_id].get('data'): # Check if data exists
-        logger.info(f"Cache hit for session {session_id} in USER_CONTEXT")
-        return USER_CONTEXT[session_id]['data']
-    logger.info(f"Cache miss or no data for session {session_id} in USER_CONTEXT, fetching from DB.")
-
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT name, current_role, desired_role_key, skills, goals, conversation_context FROM users WHERE session_id = ?",
-        (session_id,))
-    row = cursor.fetchone()
-    conn.close()
+    cached_profile = SESSION_CACHE.get(session_id)
+    if cached_profile is not None:
+        logger.info(f"Cache hit for session {session_id} in SESSION_CACHE")
+        return cached_profile
+    logger.info(f"Cache miss for session {session_id} in SESSION_CACHE, fetching from DB.")
+
+    generation = SESSION_GENERATIONS.current(session_id)
+    row = run_db(lambda conn: conn.execute(
+        "SELECT name, current_role, desired_role_key, skills, goals, current_stage, chat_topic, conversation_context "
+        "FROM users WHERE session_id = ?",
+        (session_id,)).fetchone())
 
     if row:
         data = {
@@ -346,58 +2152,37 @@ def get_user_profile(session_id: str) -> dict:
             'desired_role_key': row[2],
             'skills': json.loads(row[3]) if row[3] else [],
             'goals': json.loads(row[4]) if row[4] else [],
-            'current_stage': 'general_query',
-            'chat_topic': None
+            'current_stage': row[5] or 'general_query',
+            'chat_topic': row[6]
         }
         try:
-            if row[5]:
-                context_from_db = json.loads(row[5])
+            if row[7]:
+                context_from_db = json.loads(row[7])
                 data.update(context_from_db)
         except json.JSONDecodeError:
             logger.warning(f"Could not parse conversation_context for session {session_id}")
 
-        USER_CONTEXT[session_id] = {'data': data, 'history_summary': ""}
-        return data
-    return {'name': None, 'current_role': None, 'desired_role_key': None, 'skills': [], 'goals': [],
-            'current_stage': 'greeting', 'chat_topic': None}
-    USER_CONTEXT[session_id] = {'data': default_data.copy(), 'history_summary': ""} # Populate cache with default
-    return default_data
+        return SESSION_CACHE.put(session_id, data, generation=generation)
+    return default_user_profile()
 
 
 def update_user_profile(session_id: str, data: dict):
-    USER_CONTEXT.setdefault(session_id, {'data': {}, 'history_summary': ""})['data'].update(data)
-    logger.info(f"Updated USER_CONTEXT for {session_id}")
-
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE users 
-        SET name=?, current_role=?, desired_role_key=?, skills=?, goals=?, conversation_context=?, last_active=CURRENT_TIMESTAMP
-        WHERE session_id=?
-    """, (
-        data.get('name'),
-        data.get('current_role'),
-        data.get('desired_role_key'),
-        json.dumps(data.get('skills', [])),
-        json.dumps(data.get('goals', [])),
-        json.dumps({k: v for k, v in data.items() if
-                    k not in ['name', 'current_role', 'desired_role_key', 'skills', 'goals']}),
-        session_id
-    ))
-    conn.commit()
-    conn.close()
-    logger.info(f"Updated user profile in DB for {session_id}")
-
+    SESSION_CACHE.update(session_id, data)
+    logger.info(f"Updated SESSION_CACHE for {session_id}")
 
 
 def generate_ai_response(session_id: str, user_message: str) -> dict:
     user_profile = get_user_profile(session_id)
+    catalog = CATALOG  # one catalog version for the whole turn, even if a reload lands midway
+    if user_profile.get('desired_role_key') and user_profile['desired_role_key'] not in catalog.roles:
+        logger.info(f"Session {session_id}: role '{user_profile['desired_role_key']}' left the catalog; clearing it.")
+        user_profile['desired_role_key'] = None
     response_content = "I'm exploring how best to assist you. Could you clarify or try a different question? Type 'help' for options."
     response_type = "text"
     response_metadata = {}
+    role_reply = None
     msg_lower = user_message.lower().strip()
 
-    intent = "unknown"
     if user_profile['current_stage'] == 'greeting':
         intent = 'provide_name'
     elif user_profile['current_stage'] == 'get_name':
@@ -405,31 +2190,17 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
     elif user_profile['current_stage'] == 'get_current_role':
         intent = 'provide_current_role'
     elif user_profile['current_stage'] == 'get_desired_role':
-        intent = 'provide_desired_role'
+        # "Which role fits me?" and "explore roles" are fair answers to "which role are you interested in?", so they
+        # are not read as roles.
+        intent = catalog.intent_classifier.classify([msg_lower])[0][0]
+        if intent not in ('best_fit_roles', 'explore_roles'):
+            intent = 'provide_desired_role'
     elif user_profile['current_stage'] == 'get_skills':
-        intent = 'provide_skills'
-    elif any(k in msg_lower for k in ["help", "options", "what can you do"]):
-        intent = 'get_help'
-    elif any(k in msg_lower for k in ["reset", "start over"]):
-        intent = 'reset_conversation'
-    elif any(k in msg_lower for k in ["my name is", "call me"]) or (
-            not user_profile.get('name') and len(msg_lower.split()) <= 3):
-        intent = 'provide_name'
-    elif any(k_word in msg_lower for path_data in CAREER_PATHS.values() for k_word in
-             path_data['keywords'] + [path_data['name'].lower()]):
-        intent = 'discuss_role'
-    elif any(k in msg_lower for k in ["skill", "skills", "what should i learn", "gap analysis"]):
-        intent = 'skill_analysis'
-    elif any(k in msg_lower for k in ["resources", "learn", "courses", "books"]):
-        intent = 'get_resources'
-    elif any(k in msg_lower for k in ["interview", "preparation", "tips"]):
-        intent = 'interview_prep'
-    elif any(k in msg_lower for k in ["salary", "pay", "compensation"]):
-        intent = 'salary_info'
-    elif any(k in msg_lower for k in ["projects", "portfolio", "examples", "accomplishments"]):
-        intent = 'project_ideas'
-    elif any(k in msg_lower for k in ["thank", "thanks", "cool", "ok", "got it"]):
-        intent = 'acknowledge'
+        # The "no skills matched" reply offers exploring roles instead of listing more skills.
+        intent = ('explore_roles' if catalog.intent_classifier.classify([msg_lower])[0][0] == 'explore_roles'
+                  else 'provide_skills')
+    else:
+        intent = route_intent(msg_lower, user_profile, catalog)
 
     logger.info(
         f"Session {session_id}: Intent '{intent}', Stage '{user_profile['current_stage']}', Message '{user_message}'")
@@ -463,9 +2234,9 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
         response_content = (
             f"Understood, {user_profile['current_role']}. Now, what career path are you most interested in exploring or pursuing? ")
 
-        all_role_keys = list(CAREER_PATHS.keys())
+        all_role_keys = list(catalog.role_keys)
         random.shuffle(all_role_keys)
-        quick_reply_options = [CAREER_PATHS[k]['name'] for k in all_role_keys[:3]]
+        quick_reply_options = [catalog.roles[k].name for k in all_role_keys[:3]]
         if len(all_role_keys) > 3 and "Something else..." not in quick_reply_options:
             quick_reply_options.append("Something else...")
 
@@ -480,32 +2251,63 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
         response_type = "quick_reply_prompt"
         update_user_profile(session_id, user_profile)
 
+    elif intent == 'best_fit_roles':
+        fits = rank_roles_by_fit([user_profile['skills']], catalog=catalog)[0] if user_profile.get('skills') else None
+        if not fits:
+            user_profile['current_stage'] = 'get_skills'
+            user_profile['chat_topic'] = 'best_fit_roles'
+            response_content = "I can rank every career path by how well it fits you. First, please list your current technical and soft skills, separated by commas (e.g., Python, Project Management, Communication)."
+        elif not fits[0]['match_percent']:
+            # Ranked by coverage, so a zero at the top means no role asks for any of these skills.
+            user_profile['current_stage'] = 'get_skills'
+            user_profile['chat_topic'] = 'best_fit_roles'
+            response_content = (f"None of the skills you've shared so far ({', '.join(user_profile['skills'])}) line up "
+                                f"with the roles I know, so I can't rank them yet. Please list a few more of your "
+                                f"technical and soft skills, separated by commas, or explore the career paths I cover.")
+            response_metadata = {'quick_replies': ["Explore career paths"]}
+            response_type = "quick_reply_prompt"
+        else:
+            fits = [fit for fit in fits if fit['match_percent']]
+            fit_lines = ["### Roles that best fit your skills:"]
+            for fit in fits:
+                fit_line = f"- **{fit['name']}**: {fit['match_percent']:.0f}% skill match"
+                if fit['missing_skills']:
+                    fit_line += f" (next to learn: {', '.join(skill.title() for skill in fit['missing_skills'][:3])})"
+                fit_lines.append(fit_line)
+            fit_lines.append("\nWould you like to explore one of these roles?")
+            response_content = "\n".join(fit_lines)
+            user_profile['chat_topic'] = 'best_fit_roles'
+            user_profile['current_stage'] = 'get_desired_role'
+            response_metadata = {'quick_replies': [fit['name'] for fit in fits]}
+            response_type = "quick_reply_prompt"
+        update_user_profile(session_id, user_profile)
+
+    elif intent == 'explore_roles':
+        role_reply = catalog.role_replies[('explore_roles', None)]
+        user_profile['current_stage'] = 'get_desired_role'
+        update_user_profile(session_id, user_profile)
+
     elif intent == 'provide_desired_role' or intent == 'discuss_role' or user_profile[
         'current_stage'] == 'get_desired_role':
-        matched_key = None
-        for key, path_data in CAREER_PATHS.items():
-            if msg_lower == path_data['name'].lower():
-                matched_key = key
-                break
-        if not matched_key:
-            for key, path_data in CAREER_PATHS.items():
-                if any(keyword in msg_lower for keyword in path_data['keywords']):
-                    matched_key = key
-                    break
-        if not matched_key:
-            for key, path_data in CAREER_PATHS.items():
-                if path_data['name'].lower() in msg_lower:
-                    matched_key = key
-                    break
-
-        if matched_key:
+        candidate_keys = catalog.role_index.best_matches(msg_lower)
+        matched_key = candidate_keys[0] if len(candidate_keys) == 1 else None
+
+        if len(candidate_keys) > 1:
+            candidate_names = [catalog.roles[key].name for key in candidate_keys]
+            response_content = (f"That could match a few roles I know about: "
+                                f"{', '.join(f'**{name}**' for name in candidate_names[:-1])} or **{candidate_names[-1]}**. "
+                                f"Which one did you have in mind?")
+            user_profile['current_stage'] = 'get_desired_role'
+            response_metadata = {'quick_replies': candidate_names}
+            response_type = "quick_reply_prompt"
+        elif matched_key:
             user_profile['desired_role_key'] = matched_key
-            role_name = CAREER_PATHS[matched_key]['name']
+            role = catalog.roles[matched_key]
             user_profile['chat_topic'] = 'role_overview'
-            response_content = (f"Excellent choice, **{role_name}** is a dynamic field! Here's a quick overview:\n"
-                                f"- **Summary**: {CAREER_PATHS[matched_key]['responsibilities_summary']}\n"
-                                f"- **Key Skills**: {', '.join(CAREER_PATHS[matched_key]['required_skills'][:5])}...\n"
-                                f"- **Salary Range (USD, approx.)**: {CAREER_PATHS[matched_key]['avg_salary_range']}\n\n"
+            response_content = (f"Excellent choice, **{role.name}** is a dynamic field! Here's a quick overview:\n"
+                                f"- **Summary**: {role.responsibilities_summary}\n"
+                                f"- **Key Skills**: {role.key_skills_display}...\n"
+                                f"- **Salary Range (USD, approx.)**: {role.avg_salary_range}\n\n"
                                 f"Would you like to dive deeper into required skills, get a skill gap analysis (if you share your skills), or explore learning resources for this role?")
             user_profile['current_stage'] = 'general_query'
             response_metadata = {
@@ -518,33 +2320,25 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
                 "You can also ask to 'explore roles' to see a list of careers I know about.")
         update_user_profile(session_id, user_profile)
 
-    elif intent == 'skill_analysis' or user_profile['current_stage'] == 'get_skills':
+    elif intent == 'skill_analysis':
         if not user_profile.get('desired_role_key'):
             response_content = "To perform a skill gap analysis, I first need to know your target career path. What role are you aiming for?"
             user_profile['current_stage'] = 'get_desired_role'
-            all_role_keys = list(CAREER_PATHS.keys())
+            all_role_keys = list(catalog.role_keys)
             random.shuffle(all_role_keys)
-            response_metadata = {'quick_replies': [CAREER_PATHS[k]['name'] for k in all_role_keys[:3]]}
+            response_metadata = {'quick_replies': [catalog.roles[k].name for k in all_role_keys[:3]]}
             response_type = "quick_reply_prompt"
         elif not user_profile.get('skills'):
             user_profile['current_stage'] = 'get_skills'
             response_content = "Sure, I can help with that! Please list your current technical and soft skills, separated by commas (e.g., Python, Project Management, Communication)."
         else:
-            role_key = user_profile['desired_role_key']
-            role_info = CAREER_PATHS[role_key]
-            role_name = role_info['name']
-
-            required_skills_normalized = set(
-                skill.lower().strip().replace("_", " ") for skill in role_info['required_skills'])
-            soft_skills_emphasis_normalized = set(
-                skill.lower().strip().replace("_", " ") for skill in role_info.get('soft_skills_emphasis', []))
-            all_target_skills = required_skills_normalized.union(soft_skills_emphasis_normalized)
-
+            role = catalog.roles[user_profile['desired_role_key']]
+            role_name = role.name
             possessed_raw = user_profile.get('skills', [])
-            possessed_normalized = set(skill.lower().strip().replace("_", " ") for skill in possessed_raw)
+            possessed_bits = catalog.skills.encode(possessed_raw)
 
-            missing_skills = sorted(list(all_target_skills - possessed_normalized))
-            matching_skills = sorted(list(all_target_skills.intersection(possessed_normalized)))
+            missing_skills = catalog.skills.decode(role.target_skill_bits & ~possessed_bits)
+            matching_skills = catalog.skills.decode(role.target_skill_bits & possessed_bits)
 
             analysis_parts = [
                 f"Okay, **{user_profile.get('name', 'Explorer')}**, here's a skill assessment for the **{role_name}** role based on your listed skills ({', '.join(possessed_raw)}):"]
@@ -578,20 +2372,23 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
         update_user_profile(session_id, user_profile)
 
     elif intent == 'provide_skills':
-        new_skills = [s.strip().lower() for s in user_message.split(',') if s.strip()]
+        new_skills = [canonicalize_skill(s.strip().lower(), catalog) for s in user_message.split(',') if s.strip()]
         existing_skills = set(user_profile.get('skills', []))
         updated_skills = sorted(list(existing_skills.union(set(new_skills))))
         user_profile['skills'] = updated_skills
+        user_profile['current_stage'] = 'general_query'
         update_user_profile(session_id, user_profile)
 
+        if user_profile.get('chat_topic') == 'best_fit_roles':
+            return generate_ai_response(session_id, "which role fits me best")
         if user_profile.get('desired_role_key'):
             return generate_ai_response(session_id, "skill gap analysis")
         else:
             response_content = f"Got it. Your skills: {', '.join(updated_skills)}. What's your target career path for a skill analysis?"
             user_profile['current_stage'] = 'get_desired_role'
-            all_role_keys = list(CAREER_PATHS.keys())
+            all_role_keys = list(catalog.role_keys)
             random.shuffle(all_role_keys)
-            response_metadata = {'quick_replies': [CAREER_PATHS[k]['name'] for k in all_role_keys[:3]]}
+            response_metadata = {'quick_replies': [catalog.roles[k].name for k in all_role_keys[:3]]}
             response_type = "quick_reply_prompt"
 
     elif intent == 'get_resources':
@@ -599,32 +2396,13 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
             response_content = "To suggest the most relevant resources, I need to know your target role. What are you aiming for?"
             user_profile['current_stage'] = 'get_desired_role'
         else:
-            role_key = user_profile['desired_role_key']
-            role_info = CAREER_PATHS[role_key]
-            role_name = role_info['name']
-            resources = role_info['learning_resources']
-
-            specific_skill_query = None
-            for res_category_key in resources.keys():
-                if res_category_key.replace("_", " ") in msg_lower or res_category_key in msg_lower:
-                    specific_skill_query = res_category_key
-                    break
-
-            if specific_skill_query and specific_skill_query in resources:
-                response_content = f"For **{specific_skill_query.replace('_', ' ').title()}** relevant to a **{role_name}**: {resources[specific_skill_query]}."
+            role = catalog.roles[user_profile['desired_role_key']]
+            specific_skill_query = role.find_resource_category(msg_lower)
+            if specific_skill_query:
+                role_reply = catalog.role_replies[('get_resources', role.key, specific_skill_query)]
             else:
-                resource_list = [f"### Learning Resources for **{role_name}**:\n"]
-                if 'foundational' in resources:
-                    resource_list.append(f"- **Foundational**: {resources['foundational']}")
-                for category, resource_desc in list(resources.items()):
-                    if category != 'foundational' and len(resource_list) < 6:
-                        resource_list.append(f"- **{category.replace('_', ' ').title()}**: {resource_desc}")
-                response_content = "\n".join(resource_list)
-                response_content += "\n\nIs there a specific skill or area within this role you'd like to focus on?"
+                role_reply = catalog.role_replies[('get_resources', role.key)]
             user_profile['chat_topic'] = 'resources_provided'
-            response_metadata = {
-                'quick_replies': ["More on foundational skills", "Interview prep", f"Project ideas for {role_name}"]}
-            response_type = "quick_reply_prompt"
         update_user_profile(session_id, user_profile)
 
     elif intent == 'interview_prep':
@@ -632,28 +2410,8 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
             response_content = "To give you tailored interview tips, what role are you preparing for?"
             user_profile['current_stage'] = 'get_desired_role'
         else:
-            role_key = user_profile['desired_role_key']
-            role_info = CAREER_PATHS[role_key]
-            role_name = role_info['name']
-
-            tips = [
-                "### General Interview Best Practices:",
-                "- **Research**: Deeply understand the company, its products, and culture. Align your answers with their values.",
-                "- **STAR Method**: For behavioral questions (Situation, Task, Action, Result). Prepare specific examples.",
-                "- **Practice**: Conduct mock interviews. Record yourself to spot areas for improvement.",
-                "- **Questions for Interviewer**: Prepare 2-3 insightful questions about the role, team, or company challenges.",
-                "- **Logistics**: Test your tech for virtual interviews. For in-person, plan your route and arrive early.",
-                "- **Follow-Up**: Send a personalized thank-you email within 24 hours.",
-                f"\n### Specific Focus for **{role_name}** Interviews:",
-                "- " + "\n- ".join(role_info['interview_focus']),
-                "\nWould you like common behavioral questions, or example technical/role-specific questions for this role?"
-            ]
-            response_content = "\n".join(tips)
+            role_reply = catalog.role_replies[('interview_prep', user_profile['desired_role_key'])]
             user_profile['chat_topic'] = 'interview_tips_provided'
-            response_metadata = {
-                'quick_replies': ["Common behavioral questions", f"Role-specific questions for {role_name}",
-                                  "Resources for this role"]}
-            response_type = "quick_reply_prompt"
         update_user_profile(session_id, user_profile)
 
     elif intent == 'salary_info':
@@ -661,9 +2419,7 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
             response_content = "To discuss salary, I need to know which role you're interested in."
             user_profile['current_stage'] = 'get_desired_role'
         else:
-            role_key = user_profile['desired_role_key']
-            role_info = CAREER_PATHS[role_key]
-            response_content = f"The typical salary range for a **{role_info['name']}** in the US is approximately **{role_info['avg_salary_range']}**. This can vary significantly based on location, experience, company size, and specific skill set. Sites like Glassdoor, Levels.fyi, and LinkedIn Salary can provide more localized data."
+            role_reply = catalog.role_replies[('salary_info', user_profile['desired_role_key'])]
         update_user_profile(session_id, user_profile)
 
     elif intent == 'project_ideas':
@@ -671,37 +2427,40 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
             response_content = "For project ideas or example accomplishments, which career path are you targeting?"
             user_profile['current_stage'] = 'get_desired_role'
         else:
-            role_key = user_profile['desired_role_key']
-            role_info = CAREER_PATHS[role_key]
-            project_type_term = "projects"
-            if "manager" in role_key or "hr" in role_key or "teacher" in role_key or "educator" in role_key:
-                project_type_term = "accomplishments or key responsibilities"
-            elif "designer" in role_key:
-                project_type_term = "portfolio items"
-
-            if 'example_projects' in role_info and role_info['example_projects']:
-                response_content = f"### Example {project_type_term.capitalize()} for a **{role_info['name']}**:\n- " + "\n- ".join(
-                    role_info['example_projects'])
-                response_content += f"\n\nBuilding relevant {project_type_term} is a great way to learn and showcase your skills!"
-            else:
-                response_content = f"I don't have specific {project_type_term} for {role_info['name']} right now, but generally, look for experiences that allow you to practice the core skills of the role and solve a real (even small) problem or demonstrate key competencies."
+            role_reply = catalog.role_replies[('project_ideas', user_profile['desired_role_key'])]
+        update_user_profile(session_id, user_profile)
+
+    elif intent == 'career_roadmap':
+        if not user_profile.get('desired_role_key'):
+            response_content = "To map out a roadmap, I need to know where you want to end up. Which role are you aiming for?"
+            user_profile['current_stage'] = 'get_desired_role'
+        else:
+            role = catalog.roles[user_profile['desired_role_key']]
+            roadmap = plan_career_roadmap(user_profile, role.key, catalog=catalog)
+            route = roadmap['cheapest']
+            roadmap_lines = [f"### Your roadmap to **{role.name}**:"]
+            if roadmap['source'] is None:
+                roadmap_lines.append("Starting from the skills you've shared so far:")
+            for step_number, step in enumerate(route['steps'], 1):
+                if step['skill_delta']:
+                    roadmap_lines.append(f"{step_number}. **{step['name']}** (about {step['skill_delta']} new skills to build)")
+                else:
+                    roadmap_lines.append(f"{step_number}. **{step['name']}** (where you are now)")
+            if role.common_next_steps:
+                roadmap_lines.append(f"\n### Where **{role.name}** can lead next:\n- " + "\n- ".join(
+                    catalog.graph.node_name(step) for step in role.common_next_steps))
+            response_content = "\n".join(roadmap_lines)
+            user_profile['chat_topic'] = 'roadmap_provided'
+            response_metadata = {'quick_replies': ["Analyze my skills for this role", "Learning resources",
+                                                   "Roles that fit me best"]}
+            response_type = "quick_reply_prompt"
         update_user_profile(session_id, user_profile)
 
     elif intent == 'get_help':
         name_clause = f"{user_profile['name']}, " if user_profile.get('name') and user_profile[
             'name'] != "Explorer" else ""
-        options = [
-            "Explore career paths (e.g., 'Tell me about Software Engineering')",
-            "Get a skill gap analysis (e.g., 'Analyze my skills for Data Science')",
-            "Find learning resources (e.g., 'Resources for Python')",
-            "Receive interview tips (e.g., 'Interview prep for Product Manager')",
-            "Discuss salary expectations",
-            "Get project ideas for a role",
-            "Update my skills (e.g., 'I know JavaScript')",
-            "Type 'reset' to start our conversation over."
-        ]
-        response_content = f"Hi {name_clause}I can help you with:\n- " + "\n- ".join(options)
-        response_metadata = {'quick_replies': ["Explore career paths", "Skill gap analysis", "Learning resources"]}
+        response_content = f"Hi {name_clause}" + HELP_REPLY_SUFFIX
+        response_metadata = {'quick_replies': list(HELP_QUICK_REPLIES)}
         response_type = "quick_reply_prompt"
 
     elif intent == 'acknowledge':
@@ -710,7 +2469,7 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
         response_type = "quick_reply_prompt"
         if user_profile.get('desired_role_key'):
             response_metadata['quick_replies'].insert(0,
-                                                      f"More about {CAREER_PATHS[user_profile['desired_role_key']]['name']}")
+                                                      f"More about {catalog.roles[user_profile['desired_role_key']].name}")
 
     elif user_profile['current_stage'] == 'general_query' and intent == 'unknown':
         name_clause = f"{user_profile.get('name', 'Explorer')}, " if user_profile.get('name') and user_profile[
@@ -719,58 +2478,282 @@ def generate_ai_response(session_id: str, user_message: str) -> dict:
         response_metadata = {'quick_replies': ["Help", "Explore career paths", "Skill gap analysis"]}
         response_type = "quick_reply_prompt"
 
+    if role_reply is not None:
+        response_content, response_type, response_metadata = role_reply.reply, role_reply.type, role_reply.metadata
+
     final_response = {
         "reply": response_content,
         "type": response_type,
         "metadata": response_metadata
     }
+    if role_reply is not None:
+        final_response["metadata_json"] = role_reply.metadata_json
     return final_response
 
 
-# --- HTML, CSS, JS Content ---
-def generate_html_content(session_id=None, itemsContent=None):
-    user_name = "Explorer"
-    initial_ai_message_obj = {
-        "reply": "Hello! I'm IntelliCoach, your AI Career Advisor. It's wonderful to connect with you! To personalize our chat, what's your first name?",
-        "type": "quick_reply_prompt", "metadata": {"quick_replies": ["I prefer to stay anonymous for now."]}}
+# --- Chat History Pagination ---
+HISTORY_PAGE_SIZE = 30
+HISTORY_MAX_PAGE_SIZE = 100
 
-    chat_history_html = ""
-    if session_id:
-        profile = get_user_profile(session_id)
-        if profile.get('name'): user_name = profile['name']
 
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT sender, message_content, message_type, metadata FROM chat_history WHERE session_id = ? ORDER BY timestamp ASC LIMIT 100",
-            (session_id,))
-        history = cursor.fetchall()
-        conn.close()
+def fetch_history_page(session_id: str, before_id: int = None, limit: int = HISTORY_PAGE_SIZE):
+    # Returns (rows oldest-first, has_more) for the newest `limit` messages older than before_id.
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    if before_id is None:
+        sql = ("SELECT id, sender, message_content, message_type, metadata FROM chat_history "
+               "WHERE session_id = ? ORDER BY id DESC LIMIT ?")
+        params = (session_id, limit + 1)
+    else:
+        sql = ("SELECT id, sender, message_content, message_type, metadata FROM chat_history "
+               "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?")
+        params = (session_id, before_id, limit + 1)
+    rows = run_db(lambda conn: conn.execute(sql, params).fetchall())
+    has_more = len(rows) > limit
+    return list(reversed(rows[:limit])), has_more
+
+
+def render_history_message(sender: str, message_content: str) -> str:
+    if sender == "user":
+        return escape_html(message_content)
+    return CATALOG.reply_html.get(message_content) or RENDERED_HTML_CACHE.render(message_content)
+
+
+def render_history_message_html(message_id: int, sender: str, message_content: str, message_type: str,
+                                metadata_json: str) -> str:
+    message_class = "user-message" if sender == "user" else "ai-message"
+    processed_message = render_history_message(sender, message_content)
 
-        if not history:
-            chat_history_html += f'<div class="message ai-message" data-type="{initial_ai_message_obj["type"]}" data-metadata=\'{json.dumps(initial_ai_message_obj["metadata"])}\'><div>{render_markdown(initial_ai_message_obj["reply"])}</div></div>'
+    metadata_attr = ""
+    if metadata_json:
+        try:
+            parsed_meta = json.loads(metadata_json)
+            metadata_attr = f"data-metadata='{escape_html(json.dumps(parsed_meta))}'"
+        except json.JSONDecodeError:
+            logger.error(f"Invalid metadata JSON in history: {metadata_json}")
+
+    return f'<div class="message {message_class}" data-id="{message_id}" data-type="{message_type}" {metadata_attr}><div>{processed_message}</div></div>'
+
+
+def get_history_payload(session_id: str, before_id: int = None, limit: int = HISTORY_PAGE_SIZE) -> dict:
+    rows, has_more = fetch_history_page(session_id, before_id, limit)
+    messages = []
+    for message_id, sender, message_content, message_type, metadata_json in rows:
+        metadata = {}
+        if metadata_json:
+            try:
+                metadata = json.loads(metadata_json)
+            except json.JSONDecodeError:
+                logger.error(f"Invalid metadata JSON in history: {metadata_json}")
+        messages.append({
+            "id": message_id,
+            "sender": sender,
+            "type": message_type,
+            "content": message_content,
+            "html": render_history_message(sender, message_content),
+            "metadata": metadata
+        })
+    return {
+        "messages": messages,
+        "has_more": has_more,
+        "next_before_id": messages[0]["id"] if messages and has_more else None
+    }
+
+
+# --- Static Assets ---
+# The page's stylesheet and script live in static/ and are served from content-hashed URLs (coach.<hash>.css), so
+# browsers may cache them for a year and an edited file simply gets a new URL. Compressed variants are built once at
+# startup; each representation carries its own strong ETag.
+STATIC_ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_ASSET_TYPES = {".css": "text/css; charset=utf-8", ".js": "text/javascript; charset=utf-8"}
+STATIC_ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STATIC_ASSET_GZIP_LEVEL = 9
+STATIC_ASSET_BROTLI_QUALITY = 11
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    # Content codings the client accepts (q > 0), lowercased; "*" is kept as-is.
+    encodings = set()
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            encodings.add(coding)
+    return encodings
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses weak comparison: W/"x" matches "x".
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+class StaticAsset:
+    def __init__(self, name: str, body: bytes):
+        stem, extension = os.path.splitext(name)
+        self.content_type = STATIC_ASSET_TYPES.get(extension, "application/octet-stream")
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.url_name = f"{stem}.{self.digest}{extension}"
+        self.url = f"/static/{self.url_name}"
+        self.variants = {"identity": (body, f'"{self.digest}"'),
+                         "gzip": (gzip.compress(body, STATIC_ASSET_GZIP_LEVEL, mtime=0), f'"{self.digest}-gzip"')}
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=STATIC_ASSET_BROTLI_QUALITY), f'"{self.digest}-br"')
+
+    def select_encoding(self, accept_encoding: str) -> str:
+        encodings = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in encodings or "*" in encodings):
+                return encoding
+        return "identity"
+
+
+def load_static_assets(directory: str = STATIC_ASSET_DIR) -> dict:
+    assets = {}
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1] in STATIC_ASSET_TYPES:
+            with open(os.path.join(directory, name), 'rb') as f:
+                assets[name] = StaticAsset(name, f.read())
+    logger.info(f"Loaded {len(assets)} static assets (brotli {'on' if brotli is not None else 'off'}).")
+    return assets
+
+
+STATIC_ASSETS = load_static_assets()
+STATIC_ASSETS_BY_URL_NAME = {asset.url_name: asset for asset in STATIC_ASSETS.values()}
+
+
+# --- Response Compression ---
+# Compresses dynamic responses (/chat JSON, history, the streamed page) for clients that accept it, preferring brotli.
+# Bodies under COMPRESSION_MIN_BYTES go out as-is: short acknowledgements gain nothing and cost a compressor. Streamed
+# bodies are compressed chunk by chunk with a sync flush, so the page head still reaches the browser immediately.
+# Responses that already carry a Content-Encoding (the precompressed static assets) pass through untouched.
+COMPRESSION_MIN_BYTES = 512
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5  # on-the-fly quality; static assets are compressed once at the maximum
+COMPRESSIBLE_CONTENT_TYPES = ("text/", "application/json", "application/javascript")
+COMPRESSION_STATS = {'compressed': 0, 'precompressed': 0, 'below_threshold': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+
+def negotiate_compression(accept_encoding: str):
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and ("br" in encodings or "*" in encodings):
+        return "br"
+    if "gzip" in encodings or "*" in encodings:
+        return "gzip"
+    return None
+
+
+def record_compression(bytes_before: int, bytes_after: int, precompressed: bool = False):
+    COMPRESSION_STATS['precompressed' if precompressed else 'compressed'] += 1
+    COMPRESSION_STATS['bytes_before'] += bytes_before
+    COMPRESSION_STATS['bytes_after'] += bytes_after
+
+
+class StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
         else:
-            for sender, message_content, message_type, metadata_json in history:
-                message_class = "user-message" if sender == "user" else "ai-message"
-                processed_message = escape_html(message_content) if sender == "user" else render_markdown(
-                    message_content)
-
-                metadata_attr = ""
-                if metadata_json:
-                    try:
-                        parsed_meta = json.loads(metadata_json)
-                        metadata_attr = f"data-metadata='{escape_html(json.dumps(parsed_meta))}'"
-                    except json.JSONDecodeError:
-                        logger.error(f"Invalid metadata JSON in history: {metadata_json}")
-
-                chat_history_html += f'<div class="message {message_class}" data-type="{message_type}" {metadata_attr}><div>{processed_message}</div></div>'
-    else:
-        chat_history_html += f'<div class="message ai-message" data-type="{initial_ai_message_obj["type"]}" data-metadata=\'{json.dumps(initial_ai_message_obj["metadata"])}\'><div>{render_markdown(initial_ai_message_obj["reply"])}</div></div>'
+            self._brotli = None
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + (self._brotli.finish() if finish else self._brotli.flush())
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http":
+            encoding = negotiate_compression(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        bytes_before = bytes_after = 0
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, bytes_before, bytes_after
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or (start_message is None and compressor is None):
+                await send(message)  # passed-through responses clear start_message without starting a compressor
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                start, start_message = start_message, None
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or start["status"] in (204, 304)
+                        or not content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)):
+                    await send(start)
+                    await send(message)
+                    return
+                if not more_body and len(body) < self.minimum_size:
+                    COMPRESSION_STATS['below_threshold'] += 1
+                    headers.add_vary_header("Accept-Encoding")
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = StreamCompressor(encoding)
+                compressed = compressor.compress(body, finish=not more_body)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag  # same content, different bytes: only weakly equal now
+                if more_body:
+                    if "content-length" in headers:
+                        del headers["content-length"]
+                else:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start)
+            else:
+                compressed = compressor.compress(body, finish=not more_body)
+            bytes_before += len(body)
+            bytes_after += len(compressed)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            if not more_body:
+                record_compression(bytes_before, bytes_after)
+
+        await self.app(scope, receive, send_compressed)
+
 
-    send_icon_svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor" width="24" height="24"><path d="M3.478 2.405a.75.75 0 00-.926.94l2.432 7.905H13.5a.75.75 0 010 1.5H4.984l-2.432 7.905a.75.75 0 00.926.94 60.519 60.519 0 0018.445-8.986.75.75 0 000-1.218A60.517 60.517 0 003.478 2.405z"/></svg>'
-    user_avatar_svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor" class="user-avatar-icon"><path fill-rule="evenodd" d="M18.685 19.097A9.723 9.723 0 0021.75 12c0-5.385-4.365-9.75-9.75-9.75S2.25 6.615 2.25 12a9.723 9.723 0 003.065 7.097A9.716 9.716 0 0012 21.75a9.716 9.716 0 006.685-2.653zm-12.54-1.285A7.486 7.486 0 0112 15a7.486 7.486 0 015.855 2.812A8.224 8.224 0 0112 20.25a8.224 8.224 0 01-5.855-2.438zM15.75 9a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" clip-rule="evenodd" /></svg>'
+app.add_middleware(CompressionMiddleware)
 
-    html_template = f"""
+
+# --- HTML, CSS, JS Content ---
+# GET / streams the page: the static head (asset links, header shell) goes out before any database work, then
+# the user's name and the history page, rendered in batches as they are read, then the static input area and script.
+CHAT_PAGE_STREAM_BATCH_SIZE = 10
+INITIAL_AI_MESSAGE = {
+    "reply": "Hello! I'm IntelliCoach, your AI Career Advisor. It's wonderful to connect with you! To personalize our chat, what's your first name?",
+    "type": "quick_reply_prompt", "metadata": {"quick_replies": ["I prefer to stay anonymous for now."]}}
+SEND_ICON_SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor" width="24" height="24"><path d="M3.478 2.405a.75.75 0 00-.926.94l2.432 7.905H13.5a.75.75 0 010 1.5H4.984l-2.432 7.905a.75.75 0 00.926.94 60.519 60.519 0 0018.445-8.986.75.75 0 000-1.218A60.517 60.517 0 003.478 2.405z"/></svg>'
+USER_AVATAR_SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="currentColor" class="user-avatar-icon"><path fill-rule="evenodd" d="M18.685 19.097A9.723 9.723 0 0021.75 12c0-5.385-4.365-9.75-9.75-9.75S2.25 6.615 2.25 12a9.723 9.723 0 003.065 7.097A9.716 9.716 0 0012 21.75a9.716 9.716 0 006.685-2.653zm-12.54-1.285A7.486 7.486 0 0112 15a7.486 7.486 0 015.855 2.812A8.224 8.224 0 0112 20.25a8.224 8.224 0 01-5.855-2.438zM15.75 9a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" clip-rule="evenodd" /></svg>'
+
+CHAT_PAGE_HEAD = f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -778,647 +2761,452 @@ def generate_html_content(session_id=None, itemsContent=None):
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>IntelliCoach Pro - Your AI Career Partner</title>
     <link href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&family=Lexend:wght@400;500;600&display=swap" rel="stylesheet">
-    <style>
-        :root {{
-            --primary-accent: #007AFF; 
-            --secondary-accent: #34C759; 
-            --background-main: #f8f9fa; 
-            --background-chat: #ffffff;
-            --text-primary: #1c1c1e;
-            --text-secondary: #636366;
-            --text-on-accent: #ffffff;
-            --border-light: #e5e5ea;
-            --user-msg-bg: var(--primary-accent);
-            --user-msg-text: var(--text-on-accent);
-            --ai-msg-bg: #e9ecef; 
-            --ai-msg-text: var(--text-primary);
-            --header-bg: linear-gradient(135deg, #007AFF, #0056b3);
-            --font-main: 'Inter', sans-serif;
-            --font-headings: 'Lexend', sans-serif;
-            --border-radius-main: 12px;
-            --border-radius-msg: 18px;
-            --shadow-light: 0 2px 8px rgba(0,0,0,0.06);
-            --shadow-medium: 0 6px 16px rgba(0,0,0,0.1);
-        }}
-        *, *::before, *::after {{ box-sizing: border-box; }}
-        body {{
-            font-family: var(--font-main);
-            margin: 0;
-            background-color: var(--background-main);
-            color: var(--text-primary);
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
-            padding: 1rem;
-            -webkit-font-smoothing: antialiased;
-            -moz-osx-font-smoothing: grayscale;
-        }}
-        .chat-app-container {{
-            width: 100%;
-            max-width: 800px;
-            height: clamp(500px, 90vh, 900px);
-            background-color: var(--background-chat);
-            border-radius: var(--border-radius-main);
-            box-shadow: var(--shadow-medium);
-            display: flex;
-            flex-direction: column;
-            overflow: hidden;
-        }}
-        .chat-header {{
-            background: var(--header-bg);
-            color: var(--text-on-accent);
-            padding: 1rem 1.5rem;
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            border-bottom: 1px solid transparent; 
-            z-index: 10;
-        }}
-        .chat-header-title {{
-            font-family: var(--font-headings);
-            font-size: 1.5rem;
-            font-weight: 600;
-        }}
-        .chat-header-user-info {{
-            display: flex;
-            align-items: center;
-            font-size: 0.9rem;
-            opacity: 0.9;
-        }}
-        .user-avatar-icon {{ width: 24px; height: 24px; margin-right: 0.5rem; }}
-
-        .chat-messages-area {{
-            flex-grow: 1;
-            padding: 1.5rem;
-            overflow-y: auto;
-            display: flex;
-            flex-direction: column;
-            gap: 1rem;
-            background-color: var(--background-main); 
-        }}
-        .message {{
-            display: flex;
-            max-width: 85%;
-            opacity: 0;
-            transform: translateY(10px);
-            animation: messageFadeIn 0.3s ease-out forwards;
-        }}
-        .message div {{ 
-            padding: 0.75rem 1.25rem;
-            border-radius: var(--border-radius-msg);
-            line-height: 1.6;
-            word-wrap: break-word;
-            font-size: 0.95rem;
-            box-shadow: var(--shadow-light);
-        }}
-        .user-message {{ align-self: flex-end; margin-left: auto; }}
-        .user-message div {{
-            background-color: var(--user-msg-bg);
-            color: var(--user-msg-text);
-            border-bottom-right-radius: 4px;
-        }}
-        .ai-message {{ align-self: flex-start; }}
-        .ai-message div {{
-            background-color: var(--ai-msg-bg);
-            color: var(--ai-msg-text);
-            border-bottom-left-radius: 4px;
-        }}
-        .ai-message strong {{ color: var(--primary-accent); font-weight: 600; }}
-        .ai-message em {{ font-style: italic; }}
-        .ai-message ul, .ai-message ol {{ margin-top: 0.5em; margin-bottom: 0.5em; padding-left: 1.5em; }}
-        .ai-message li {{ margin-bottom: 0.25em; }}
-        .ai-message h3 {{ font-family: var(--font-headings); font-size: 1.1em; margin-top:0.8em; margin-bottom:0.4em; color: var(--primary-accent); }}
-        .ai-message a {{ color: var(--primary-accent); text-decoration: none; font-weight: 500; }}
-        .ai-message a:hover {{ text-decoration: underline; }}
-        .ai-message code {{ background-color: #d1d5db; padding: 0.2em 0.4em; border-radius: 4px; font-family: monospace; font-size: 0.9em; }}
-
-        .quick-replies-container {{
-            padding: 0.5rem 0 0; 
-            display: flex;
-            flex-wrap: wrap;
-            gap: 0.5rem;
-            justify-content: flex-start; 
-            margin-top: 0.5rem; 
-            margin-left: 0; 
-        }}
-        .quick-reply-button {{
-            background-color: #fff;
-            color: var(--primary-accent);
-            border: 1px solid var(--primary-accent);
-            padding: 0.5rem 1rem;
-            border-radius: 20px;
-            cursor: pointer;
-            font-size: 0.85rem;
-            font-weight: 500;
-            transition: all 0.2s ease;
-        }}
-        .quick-reply-button:hover {{
-            background-color: var(--primary-accent);
-            color: #fff;
-            transform: translateY(-1px);
-            box-shadow: 0 2px 4px rgba(0,122,255,0.2);
-        }}
-
-        .chat-input-area {{
-            display: flex;
-            padding: 1rem 1.5rem;
-            border-top: 1px solid var(--border-light);
-            background-color: var(--background-chat); 
-        }}
-        .chat-input-area input[type="text"] {{
-            flex-grow: 1;
-            padding: 0.85rem 1.25rem;
-            border: 1px solid var(--border-light);
-            border-radius: 25px;
-            font-size: 1rem;
-            outline: none;
-            transition: border-color 0.2s, box-shadow 0.2s;
-        }}
-        .chat-input-area input[type="text"]:focus {{
-            border-color: var(--primary-accent);
-            box-shadow: 0 0 0 3px rgba(0, 122, 255, 0.15);
-        }}
-        .chat-input-area button#sendButton {{
-            background: var(--primary-accent);
-            color: var(--text-on-accent);
-            border: none;
-            width: 48px; 
-            height: 48px;
-            margin-left: 0.75rem;
-            border-radius: 50%; 
-            cursor: pointer;
-            font-size: 1.2rem;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: background-color 0.2s, transform 0.1s;
-        }}
-        .chat-input-area button#sendButton:hover {{ background-color: #0056b3; }}
-        .chat-input-area button#sendButton:active {{ transform: scale(0.95); }}
-        .chat-input-area button#sendButton:disabled {{ background-color: #cdd2d8; cursor: not-allowed; }}
-        .chat-input-area button#sendButton svg {{ width: 22px; height: 22px; }}
-
-        .typing-indicator {{ 
-        }}
-        .typing-indicator div {{ 
-            padding: 0.8rem 1.1rem; 
-            display: flex;
-            align-items: center;
-        }}
-        .typing-indicator span {{
-            display: inline-block;
-            width: 8px; height: 8px; margin: 0 3px; 
-            background-color: #adb5bd;
-            border-radius: 50%;
-            animation: typingAnimation 1.4s infinite both; 
-        }}
-        .typing-indicator span:nth-child(1) {{ animation-delay: 0s; }}
-        .typing-indicator span:nth-child(2) {{ animation-delay: 0.2s; }}
-        .typing-indicator span:nth-child(3) {{ animation-delay: 0.4s; }}
-
-        @keyframes messageFadeIn {{
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
-        @keyframes typingAnimation {{ 
-            0%, 80%, 100% {{ transform: scale(0); opacity: 0.5; }}
-            40% {{ transform: scale(1.0); opacity: 1; }}
-        }}
-        .chat-messages-area::-webkit-scrollbar {{ width: 8px; }}
-        .chat-messages-area::-webkit-scrollbar-track {{ background: transparent; }}
-        .chat-messages-area::-webkit-scrollbar-thumb {{ background: #ced4da; border-radius: 4px; }}
-        .chat-messages-area::-webkit-scrollbar-thumb:hover {{ background: #adb5bd; }}
-
-        @media (max-width: 768px) {{
-            body {{ padding: 0; }}
-            .chat-app-container {{ height: 100vh; max-height: none; border-radius: 0; }}
-            .chat-header-title {{ font-size: 1.25rem; }}
-            .chat-messages-area, .chat-input-area, .chat-header {{ padding-left: 1rem; padding-right: 1rem; }}
-            .message div {{ font-size: 0.9rem; }}
-        }}
-    </style>
+    <link rel="stylesheet" href="{STATIC_ASSETS['coach.css'].url}">
 </head>
 <body>
     <div class="chat-app-container">
         <div class="chat-header">
             <div class="chat-header-title">IntelliCoach Pro</div>
             <div class="chat-header-user-info">
-                {user_avatar_svg}
-                <span id="userNameDisplay">{user_name}</span>
-            </div>
-        </div>
-        <div class="chat-messages-area" id="chatMessagesArea">
-            {chat_history_html}
+                {USER_AVATAR_SVG}
+                """
+
+CHAT_PAGE_TAIL = f"""
         </div>
         <div class="chat-input-area">
             <input type="text" id="userInput" placeholder="Ask about careers, skills, or interviews..." autocomplete="off">
             <button id="sendButton" aria-label="Send Message">
-                {send_icon_svg}
+                {SEND_ICON_SVG}
             </button>
         </div>
     </div>
 
-    <script>
-        const chatMessagesArea = document.getElementById('chatMessagesArea');
-        const userInput = document.getElementById('userInput');
-        const sendButton = document.getElementById('sendButton');
-        const userNameDisplay = document.getElementById('userNameDisplay');
-        let typingIndicatorElement = null;
-
-        function escapeHtml(unsafe) {{
-            if (typeof unsafe !== 'string') return unsafe;
-            return unsafe
-                 .replace(/&/g, "&amp;")
-                 .replace(/</g, "&lt;")
-                 .replace(/>/g, "&gt;")
-                 .replace(/"/g, "&quot;")
-                 .replace(/'/g, "&#039;");
-        }}
-
-        function renderClientMarkdown(md) {{
-            if (typeof md !== 'string') return md;
-            let html = escapeHtml(md); 
-            // Bold
-            html = html.replace(/\\*\\*([^*]+)\\*\\*/g, '<strong>$1</strong>')
-                       .replace(/__([^_]+)__/g, '<strong>$1</strong>');
-            // Italics - carefully to avoid parts of bold
-            html = html.replace(/(?<![a-zA-Z0-9*])\\*(?!\\s|\\*)([^\\*\\n]+?)(?<!\\s|\\*)\\*(?![a-zA-Z0-9*])/g, '<em>$1</em>')
-                       .replace(/(?<![a-zA-Z0-9_])_(?!\\s|_)([^_\\n]+?)(?<!\\s|_)_(?![a-zA-Z0-9_])/g, '<em>$1</em>');
-
-            // Headers
-            html = html.replace(/^### (.*$)/gim, '<h3>$1</h3>');
-
-            // Lists
-            html = html.replace(/^[-*+]\s+(.*$)/gim, '<li>$1</li>');
-
-            // Function to wrap list items; Python's f-string requires {{ and }} for literal braces.
-            // For JavaScript template literals `${{var}}`, the dollar sign is literal, and {{var}} produces {var}.
-            function clientWrapListItems(match) {{
-                let itemsContent = match.replace(/<\\/li>\\s*(<br\\s*\\/?>\\s*)+\\s*<li>/gi, '</li><li>'); // Use escaped slash for Python f-string
-                itemsContent = itemsContent.replace(/^\\s*(<br\\s*\\/?>\\s*)+|(<br\\s*\\/?>\\s*)+\\s*$/g, '');
-                return `<ul>${{itemsContent}}</ul>`; // Corrected for Python f-string: ${{itemsContent}} -> ${itemsContent} in JS
-            }}
-            html = html.replace(/(?:<li>.*?<\\/li>\\s*(?:<br\\s*\\/?>\\s*)*)+/gs, clientWrapListItems); // Use escaped slash
-
-            // Links
-            html = html.replace(/\\[([^\\]]+)\\]\\(([^)]+)\\)/g, '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>'); // Escaped \ and ( )
-            // Code
-            html = html.replace(/`([^`]+)`/g, '<code>$1</code>');
-            // Newlines
-            html = html.replace(/\\n/g, '<br>'); // Escaped \
-
-            // Cleanup <br> tags
-            html = html.replace(/<ul>(<br\\s*\\/?>\\s*)+/g, '<ul>');
-            html = html.replace(/(<br\\s*\\/?>\\s*)+<\\/ul>/g, '</ul>'); // Escaped /
-            html = html.replace(/<li>(<br\\s*\\/?>\\s*)+/g, '<li>');
-            html = html.replace(/(<br\\s*\/?>\\s*)+<\\/li>/g, '</li>'); // Escaped /
-            return html;
-        }}
-
-        function showTypingIndicator() {{
-            if (!typingIndicatorElement) {{
-                typingIndicatorElement = document.createElement('div');
-                typingIndicatorElement.classList.add('message', 'ai-message', 'typing-indicator'); 
-                typingIndicatorElement.innerHTML = `<div><span></span><span></span><span></span></div>`;
-                chatMessagesArea.appendChild(typingIndicatorElement);
-            }}
-            typingIndicatorElement.style.display = 'flex'; 
-            scrollToBottom();
-        }}
-
-        function hideTypingIndicator() {{
-            if (typingIndicatorElement) {{
-                typingIndicatorElement.style.display = 'none';
-            }}
-        }}
-
-        function removeAllQuickReplies() {{
-             document.querySelectorAll('.quick-replies-container').forEach(el => el.remove());
-        }}
-
-        function addMessageToChat(content, sender, type = 'text', metadata = null) {{
-            if (sender === 'user' || (sender === 'ai' && (!metadata || !metadata.quick_replies))) {{
-                 removeAllQuickReplies(); 
-            }}
-
-            const messageWrapper = document.createElement('div');
-            messageWrapper.classList.add('message', sender + '-message');
-            messageWrapper.dataset.type = type;
-            if (metadata && typeof metadata === 'object') {{
-                 messageWrapper.dataset.metadata = JSON.stringify(metadata);
-            }}
-
-            const messageContentElement = document.createElement('div');
-            messageContentElement.innerHTML = (sender === 'user') ? escapeHtml(content) : renderClientMarkdown(content);
-
-            messageWrapper.appendChild(messageContentElement);
-            chatMessagesArea.appendChild(messageWrapper);
-
-            if (sender === 'ai' && type === 'quick_reply_prompt' && metadata && metadata.quick_replies && metadata.quick_replies.length > 0) {{
-                const quickRepliesContainer = document.createElement('div');
-                quickRepliesContainer.classList.add('quick-replies-container');
-                metadata.quick_replies.forEach(replyText => {{
-                    const button = document.createElement('button');
-                    button.classList.add('quick-reply-button');
-                    button.textContent = replyText;
-                    button.onclick = () => handleQuickReply(replyText);
-                    quickRepliesContainer.appendChild(button);
-                }});
-                chatMessagesArea.appendChild(quickRepliesContainer); 
-            }}
-            scrollToBottom();
-        }}
-
-        function scrollToBottom() {{
-            requestAnimationFrame(() => {{
-                 chatMessagesArea.scrollTop = chatMessagesArea.scrollHeight;
-            }});
-        }}
-
-        function handleQuickReply(replyText) {{
-            addMessageToChat(replyText, 'user'); 
-            userInput.value = ''; 
-            userInput.disabled = true;
-            sendButton.disabled = true;
-            showTypingIndicator();
-
-            removeAllQuickReplies();
-
-            fetch('/chat', {{
-                method: 'POST',
-                headers: {{ 'Content-Type': 'application/x-www-form-urlencoded' }},
-                body: new URLSearchParams({{ 'message': replyText }})
-            }})
-            .then(response => {{
-                if (!response.ok) throw new Error(`HTTP error! Status: ${{response.status}}`);
-                return response.json();
-            }})
-            .then(data => {{
-                addMessageToChat(data.reply, 'ai', data.type, data.metadata);
-                if (data.profile_update && data.profile_update.name) {{
-                    userNameDisplay.textContent = data.profile_update.name;
-                }}
-            }})
-            .catch(error => {{
-                console.error('Error sending quick reply:', error);
-                addMessageToChat('Sorry, I encountered an issue. Please try again.', 'ai');
-            }})
-            .finally(() => {{
-                hideTypingIndicator();
-                userInput.disabled = false;
-                sendButton.disabled = false;
-                userInput.focus();
-            }});
-        }}
-
-        async function handleSendMessage() {{
-            const messageText = userInput.value.trim();
-            if (messageText === '') return;
-
-            addMessageToChat(messageText, 'user');
-            userInput.value = '';
-            userInput.disabled = true;
-            sendButton.disabled = true;
-            showTypingIndicator();
-
-            removeAllQuickReplies();
-
-            try {{
-                const response = await fetch('/chat', {{
-                    method: 'POST',
-                    headers: {{ 'Content-Type': 'application/x-www-form-urlencoded' }},
-                    body: new URLSearchParams({{ 'message': messageText }})
-                }});
-
-                if (!response.ok) {{
-                    const errorData = await response.json().catch(() => ({{detail: "An unknown error occurred."}}));
-                    addMessageToChat(`Error: ${{response.status}} - ${{errorData.detail || "Could not reach advisor."}}`, 'ai');
-                    return;
-                }}
-
-                const data = await response.json();
-                addMessageToChat(data.reply, 'ai', data.type, data.metadata);
-                 if (data.profile_update && data.profile_update.name) {{
-                    userNameDisplay.textContent = data.profile_update.name;
-                }}
-
-            }} catch (error) {{
-                console.error('Error sending message:', error);
-                addMessageToChat('Oops! I seem to be having trouble connecting. Please check your connection or try again.', 'ai');
-            }} finally {{
-                hideTypingIndicator();
-                userInput.disabled = false;
-                sendButton.disabled = false;
-                userInput.focus();
-            }}
-        }}
-
-        sendButton.addEventListener('click', handleSendMessage);
-        userInput.addEventListener('keypress', (event) => {{
-            if (event.key === 'Enter' && !event.shiftKey) {{
-                event.preventDefault();
-                handleSendMessage();
-            }}
-        }});
-
-        function processInitialMessagesForQuickReplies() {{
-            const aiMessages = Array.from(chatMessagesArea.querySelectorAll('.message.ai-message'));
-            const lastAIMessage = aiMessages.pop(); 
-
-            if (lastAIMessage) {{
-                const type = lastAIMessage.dataset.type;
-                const metadataString = lastAIMessage.dataset.metadata;
-
-                if (type === 'quick_reply_prompt' && metadataString) {{
-                    try {{
-                        const metadata = JSON.parse(metadataString);
-                        if (metadata && metadata.quick_replies && metadata.quick_replies.length > 0) {{
-                            let nextSibling = lastAIMessage.nextElementSibling;
-                            if (!nextSibling || !nextSibling.classList.contains('quick-replies-container')) {{
-                                const quickRepliesContainer = document.createElement('div');
-                                quickRepliesContainer.classList.add('quick-replies-container');
-                                metadata.quick_replies.forEach(replyText => {{
-                                    const button = document.createElement('button');
-                                    button.classList.add('quick-reply-button');
-                                    button.textContent = replyText;
-                                    button.onclick = () => handleQuickReply(replyText);
-                                    quickRepliesContainer.appendChild(button);
-                                }});
-                                lastAIMessage.parentNode.insertBefore(quickRepliesContainer, lastAIMessage.nextSibling);
-                            }}
-                        }}
-                    }} catch (e) {{
-                        console.error("Error parsing metadata for quick replies on load:", e, metadataString);
-                    }}
-                }}
-            }}
-        }}
-
-        window.onload = () => {{
-            processInitialMessagesForQuickReplies(); 
-            scrollToBottom();
-            userInput.focus();
-        }};
-    </script>
+    <script src="{STATIC_ASSETS['coach.js'].url}"></script>
 </body>
 </html>
     """
-    return html_template
 
 
-def render_markdown(text: str) -> str:
-    if not isinstance(text, str): return str(text)
+def history_page_bounds(session_id: str, limit: int = HISTORY_PAGE_SIZE):
+    # (id of the oldest message on the newest history page, whether older messages exist); (None, False) if empty.
+    def read_bounds(conn):
+        row = conn.execute("SELECT id FROM chat_history WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                           (session_id, limit - 1)).fetchone()
+        if row is None:
+            row = conn.execute("SELECT id FROM chat_history WHERE session_id = ? ORDER BY id LIMIT 1",
+                               (session_id,)).fetchone()
+            return (row[0] if row else None), False
+        older = conn.execute("SELECT 1 FROM chat_history WHERE session_id = ? AND id < ? LIMIT 1",
+                             (session_id, row[0])).fetchone()
+        return row[0], older is not None
 
-    html = escape_html(text)
+    return run_db(read_bounds)
 
-    html = re.sub(r'^### (.*)', r'<h3>\1</h3>', html, flags=re.MULTILINE)
-    html = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', html)
-    html = re.sub(r'__(.*?)__', r'<strong>\1</strong>', html)
 
-    html = re.sub(r'(?<![a-zA-Z0-9*])\*(?!\s|\*)([^\*\n]+?)(?<!\s|\*)\*(?![a-zA-Z0-9*])', r'<em>\1</em>', html)
-    html = re.sub(r'(?<![a-zA-Z0-9_])_(?!\s|_)([^_\n]+?)(?<!\s|_)_(?![a-zA-Z0-9_])', r'<em>\1</em>', html)
+def render_chat_page_header(session_id: str):
+    # Returns (header and opening of the message area, id of the first history message to stream or None).
+    user_name = "Explorer"
+    profile = get_user_profile(session_id)
+    if profile.get('name'): user_name = profile['name']
 
-    html = re.sub(r'^\s*[-*+]\s+(.*)', r'<li>\1</li>', html, flags=re.MULTILINE)
+    first_message_id, has_more = history_page_bounds(session_id)
+    oldest_message_id = "" if first_message_id is None else first_message_id
+    has_more_history = "true" if has_more else "false"
+    header = f"""<span id="userNameDisplay">{user_name}</span>
+            </div>
+        </div>
+        <div class="chat-messages-area" id="chatMessagesArea" data-oldest-id="{oldest_message_id}" data-has-more="{has_more_history}">
+            """
+    if first_message_id is None:
+        header += f'<div class="message ai-message" data-type="{INITIAL_AI_MESSAGE["type"]}" data-metadata=\'{json.dumps(INITIAL_AI_MESSAGE["metadata"])}\'><div>{RENDERED_HTML_CACHE.render(INITIAL_AI_MESSAGE["reply"])}</div></div>'
+    return header, first_message_id
 
-    def wrap_list_items_server(match_obj):
-        list_items_content = match_obj.group(0)
-        cleaned_content = re.sub(r'</li>\s*(?:<br\s*\/?>\s*)+\s*<li>', '</li><li>', list_items_content)
-        cleaned_content = re.sub(r'^\s*(<br\s*\/?>\s*)+', '', cleaned_content)
-        cleaned_content = re.sub(r'(<br\s*\/?>\s*)+\s*$', '', cleaned_content)
-        return f"<ul>{cleaned_content}</ul>"
 
-    html = re.sub(r'(?:<li>.*?</li>\s*(?:<br\s*\/?>\s*)*)+', wrap_list_items_server, html, flags=re.DOTALL)
+def render_history_batch(session_id: str, from_id: int, limit: int = CHAT_PAGE_STREAM_BATCH_SIZE):
+    # Keyset read of the next batch, oldest first; returns (html, id to continue from or None when done).
+    rows = run_db(lambda conn: conn.execute(
+        "SELECT id, sender, message_content, message_type, metadata FROM chat_history "
+        "WHERE session_id = ? AND id >= ? ORDER BY id LIMIT ?", (session_id, from_id, limit)).fetchall())
+    html = "".join(render_history_message_html(*row) for row in rows)
+    return html, (rows[-1][0] + 1 if len(rows) == limit else None)
 
-    html = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2" target="_blank" rel="noopener noreferrer">\1</a>', html)
-    html = re.sub(r'`([^`]+)`', r'<code>\1</code>', html)
-    html = html.replace("\n", "<br>")
 
-    html = re.sub(r'<ul><br\s*\/?>', '<ul>', html)
-    html = re.sub(r'<br\s*\/?></ul>', '</ul>', html)
-    html = re.sub(r'<li><br\s*\/?>', '<li>', html)
-    html = re.sub(r'<br\s*\/?></li>', '</li>', html)
+async def stream_chat_page(session_id: str):
+    # Each batch holds a pooled connection only while it is read, never while the client drains the response.
+    yield CHAT_PAGE_HEAD
+    header, next_id = await run_blocking(render_chat_page_header, session_id)
+    yield header
+    while next_id is not None:
+        html, next_id = await run_blocking(render_history_batch, session_id, next_id)
+        yield html
+    yield CHAT_PAGE_TAIL
 
-    return html
 
+# A session's page is fully determined by its history rows and profile, so the newest history id plus the profile's
+# write generation (bumped on every committed profile write) identify a rendering. The fingerprint of this module and
+# the static shell covers code, template and asset changes. A matching If-None-Match is answered with 304 before any
+# profile load, history query or rendering.
+CHAT_PAGE_CACHE_CONTROL = "private, no-cache"
+CHAT_PAGE_FINGERPRINT = hashlib.sha256(
+    CATALOG_CODE_FINGERPRINT + (CHAT_PAGE_HEAD + CHAT_PAGE_TAIL).encode()).hexdigest()[:16]
+CHAT_PAGE_STATS = {'not_modified': 0, 'rendered': 0}
 
-def escape_html(unsafe_text: str) -> str:
-    if not isinstance(unsafe_text, str): return str(unsafe_text)
-    return unsafe_text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;").replace(
-        "'", "&#039;")
+
+def chat_page_etag(session_id: str) -> str:
+    row = run_db(lambda conn: conn.execute(
+        "SELECT MAX(id) FROM chat_history WHERE session_id = ?", (session_id,)).fetchone())
+    return f'"{CHAT_PAGE_FINGERPRINT}-{row[0] or 0}-{SESSION_GENERATIONS.current(session_id)}"'
+
+
+# --- WebSocket Chat Transport ---
+# One socket per open page. The session cookie is checked once, at the handshake, and the session's profile stays
+# pinned in SESSION_CACHE until the socket closes, so a message costs one JSON frame each way plus the turn itself.
+# Text frames in are {"id": n, "message": "..."}; frames out are the /chat payload plus the same id, or {"id", "error"}
+# for anything else, binary frames included.
+# Pages that cannot open the socket keep using POST /chat.
+WEBSOCKET_STATS = {'connections': 0, 'rejected': 0, 'messages': 0, 'bad_frames': 0, 'errors': 0}
+
+
+def websocket_frame(payload: dict) -> str:
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def parse_websocket_frame(frame):
+    try:
+        request = json.loads(frame)
+        return request.get('id'), request['message'].strip()
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None, None
+
+
+def websocket_origin_allowed(websocket: WebSocket) -> bool:
+    # Browsers do not apply CORS to WebSockets, so a cross-site page's handshake is refused here.
+    origin = websocket.headers.get("origin")
+    return origin is None or origin.split("://", 1)[-1] == websocket.headers.get("host")
 
 
 # --- FastAPI Endpoints ---
 @app.on_event("startup")
 async def startup_event():
-     logger.info("FastAPI application startup...")
+    logger.info("FastAPI application startup...")
     init_db()
+    warm_session_filter()
+    CATALOG_RELOADER.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    CATALOG_RELOADER.close()
+    shutdown_blocking_executor()
+    SESSION_CACHE.flush()
+    logger.info(f"Session cache stats at shutdown: {SESSION_CACHE.stats()}")
+    logger.info(f"Rendered HTML cache stats at shutdown: {RENDERED_HTML_CACHE.stats()}")
+    WRITE_JOURNAL.close()
+    SESSION_GENERATIONS.close()
+    SESSION_FILTER.close()
+    logger.info(f"Session membership stats at shutdown: {SESSION_MEMBERSHIP_STATS}")
+    logger.info(f"Chat page stats at shutdown: {CHAT_PAGE_STATS}")
+    logger.info(f"WebSocket stats at shutdown: {WEBSOCKET_STATS}")
+    logger.info(f"Compression stats at shutdown: {COMPRESSION_STATS}, "
+                f"saved {COMPRESSION_STATS['bytes_before'] - COMPRESSION_STATS['bytes_after']} bytes")
+    DB_POOL.close_all()
+    JOURNAL_DB_POOL.close_all()
+    logger.info("Closed pooled database connections.")
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_chat_page(request: Request):
     session_id = request.cookies.get("session_id")
-    response_html_content = ""
-
-    if not session_id or not UserSessionManager.session_exists_in_db(session_id):
+    if not session_id or not await run_blocking(UserSessionManager.session_exists_in_db, session_id):
         session_id = secrets.token_hex(24)
-        UserSessionManager.create_user_session_db(session_id)
-        USER_CONTEXT[session_id] = {
-            'data': {'name': None, 'current_role': None, 'desired_role_key': None, 'skills': [], 'goals': [],
-                     'current_stage': 'greeting', 'chat_topic': None}, 'history_summary': ""}
+        await run_blocking(UserSessionManager.create_user_session_db, session_id)
+        SESSION_CACHE.put(session_id, default_user_profile())
 
-        response_html_content = generate_html_content(session_id)
-        response = HTMLResponse(content=response_html_content)
+        CHAT_PAGE_STATS['rendered'] += 1
+        response = StreamingResponse(stream_chat_page(session_id), media_type="text/html",
+                                     headers={"Cache-Control": CHAT_PAGE_CACHE_CONTROL})
         response.set_cookie(key="session_id", value=session_id, httponly=True, samesite="Lax",
                             max_age=30 * 24 * 60 * 60, secure=False)
         return response
 
-    if session_id not in USER_CONTEXT:
-        profile_data = get_user_profile(session_id)
+    etag = await run_blocking(chat_page_etag, session_id)
+    headers = {"ETag": etag, "Cache-Control": CHAT_PAGE_CACHE_CONTROL, "Vary": "Cookie"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        CHAT_PAGE_STATS['not_modified'] += 1
+        return Response(status_code=304, headers=headers)
+
+    if session_id not in SESSION_CACHE:
+        profile_data = await run_blocking(get_user_profile, session_id)
         if not profile_data or profile_data.get('current_stage') is None:
-            USER_CONTEXT[session_id] = {
-                'data': {'name': None, 'current_role': None, 'desired_role_key': None, 'skills': [], 'goals': [],
-                         'current_stage': 'greeting', 'chat_topic': None}, 'history_summary': ""}
+            SESSION_CACHE.put(session_id, default_user_profile())
             logger.warning(f"Re-initialized empty context for existing session_id {session_id}")
 
-    response_html_content = generate_html_content(session_id)
-    return HTMLResponse(content=response_html_content)
-
+    CHAT_PAGE_STATS['rendered'] += 1
+    return StreamingResponse(stream_chat_page(session_id), media_type="text/html", headers=headers)
 
-@app.post("/chat")
-async def chat_endpoint(request: Request, message: str = Form(...)):
-    session_id = request.cookies.get("session_id")
-    if not session_id or not UserSessionManager.session_exists_in_db(session_id):
-        logger.warning(f"Chat attempt with invalid/missing session_id. Message: {message}")
-        raise HTTPException(status_code=400, detail="Invalid or expired session. Please refresh the page.")
 
-    if session_id not in USER_CONTEXT:
+def process_chat_turn(session_id: str, user_message_clean: str) -> dict:
+    if session_id not in SESSION_CACHE:
         get_user_profile(session_id)
-        if session_id not in USER_CONTEXT:
-            logger.error(f"CRITICAL: USER_CONTEXT not populated for session {session_id} after get_user_profile call.")
-            USER_CONTEXT[session_id] = {
-                'data': {'name': None, 'current_role': None, 'desired_role_key': None, 'skills': [], 'goals': [],
-                         'current_stage': 'greeting', 'chat_topic': None}, 'history_summary': ""}
-
-    user_message_clean = message.strip()
+        if session_id not in SESSION_CACHE:
+            logger.error(f"CRITICAL: SESSION_CACHE not populated for session {session_id} after get_user_profile call.")
+            SESSION_CACHE.put(session_id, default_user_profile())
 
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO chat_history (session_id, sender, message_type, message_content, metadata) VALUES (?, ?, ?, ?, ?)",
-        (session_id, 'user', 'text', user_message_clean, None))
-    conn.commit()
+    insert_history_sql = "INSERT INTO chat_history (session_id, sender, message_type, message_content, metadata) VALUES (?, ?, ?, ?, ?)"
+    with WRITE_JOURNAL.turn(), SESSION_CACHE.deferred_writes():
+        WRITE_JOURNAL.submit(insert_history_sql, (session_id, 'user', 'text', user_message_clean, None))
 
-    ai_response_obj = generate_ai_response(session_id, user_message_clean)
+        ai_response_obj = generate_ai_response(session_id, user_message_clean)
 
-    cursor.execute(
-        "INSERT INTO chat_history (session_id, sender, message_type, message_content, metadata) VALUES (?, ?, ?, ?, ?)",
-        (session_id, 'ai', ai_response_obj['type'], ai_response_obj['reply'], json.dumps(ai_response_obj['metadata'])))
-    conn.commit()
-    conn.close()
+        WRITE_JOURNAL.submit(
+            insert_history_sql,
+            (session_id, 'ai', ai_response_obj['type'], ai_response_obj['reply'],
+             ai_response_obj.get('metadata_json') or json.dumps(ai_response_obj['metadata'])))
 
     profile_update_info = {}
     current_profile = get_user_profile(session_id)
     if current_profile.get('name'):
         profile_update_info['name'] = current_profile['name']
 
-    return JSONResponse({
+    return {
         "reply": ai_response_obj['reply'],
         "type": ai_response_obj['type'],
         "metadata": ai_response_obj['metadata'],
         "profile_update": profile_update_info
-    })
+    }
+
+
+@app.get("/static/{asset_name}")
+async def static_asset_endpoint(request: Request, asset_name: str):
+    asset = STATIC_ASSETS_BY_URL_NAME.get(asset_name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Unknown static asset.")
+    encoding = asset.select_encoding(request.headers.get("accept-encoding", ""))
+    body, etag = asset.variants[encoding]
+    headers = {"Cache-Control": STATIC_ASSET_CACHE_CONTROL, "ETag": etag, "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        record_compression(len(asset.variants["identity"][0]), len(body), precompressed=True)
+    return Response(content=body, media_type=asset.content_type, headers=headers)
+
+
+@app.post("/chat")
+async def chat_endpoint(request: Request, message: str = Form(...)):
+    session_id = request.cookies.get("session_id")
+    if not session_id or not await run_blocking(UserSessionManager.session_exists_in_db, session_id):
+        logger.warning(f"Chat attempt with invalid/missing session_id. Message: {message}")
+        raise HTTPException(status_code=400, detail="Invalid or expired session. Please refresh the page.")
+
+    return JSONResponse(await run_blocking(process_chat_turn, session_id, message.strip()))
+
+
+@app.get("/history")
+async def chat_history_endpoint(request: Request, before_id: int = None, limit: int = HISTORY_PAGE_SIZE):
+    session_id = request.cookies.get("session_id")
+    if not session_id or not await run_blocking(UserSessionManager.session_exists_in_db, session_id):
+        raise HTTPException(status_code=400, detail="Invalid or expired session. Please refresh the page.")
+
+    return JSONResponse(await run_blocking(get_history_payload, session_id, before_id, limit))
+
+
+@app.get("/roadmap")
+async def roadmap_endpoint(request: Request, target: str, source: str = None):
+    session_id = request.cookies.get("session_id")
+    if not session_id or not await run_blocking(UserSessionManager.session_exists_in_db, session_id):
+        raise HTTPException(status_code=400, detail="Invalid or expired session. Please refresh the page.")
+
+    catalog = CATALOG
+    target_key = catalog.graph.resolve_node(target)
+    if not target_key:
+        raise HTTPException(status_code=404, detail=f"Unknown target role '{target}'.")
+    user_profile = await run_blocking(get_user_profile, session_id)
+    return JSONResponse(plan_career_roadmap(user_profile, target_key, source, catalog))
+
+
+@app.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    session_id = websocket.cookies.get("session_id")
+    if (not websocket_origin_allowed(websocket) or not session_id
+            or not await run_blocking(UserSessionManager.session_exists_in_db, session_id)):
+        WEBSOCKET_STATS['rejected'] += 1
+        logger.warning(f"Rejected WebSocket handshake: invalid session or origin {websocket.headers.get('origin')}.")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    WEBSOCKET_STATS['connections'] += 1
+    with SESSION_CACHE.pinned(session_id):
+        try:
+            await run_blocking(get_user_profile, session_id)
+            while True:
+                # receive() rather than receive_text(): a binary frame has no 'text' and gets an error reply.
+                frame = await websocket.receive()
+                if frame['type'] == 'websocket.disconnect':
+                    break
+                frame_id, message = parse_websocket_frame(frame.get('text'))
+                if not message:
+                    WEBSOCKET_STATS['bad_frames'] += 1
+                    await websocket.send_text(websocket_frame({"id": frame_id, "error": "Empty or malformed message."}))
+                    continue
+                try:
+                    response = await run_blocking(process_chat_turn, session_id, message)
+                except Exception as e:
+                    WEBSOCKET_STATS['errors'] += 1
+                    logger.error(f"WebSocket chat turn failed for session {session_id}: {e}")
+                    await websocket.send_text(websocket_frame({"id": frame_id, "error": "Could not reach advisor."}))
+                    continue
+                WEBSOCKET_STATS['messages'] += 1
+                response["id"] = frame_id
+                await websocket.send_text(websocket_frame(response))
+        except WebSocketDisconnect:
+            pass
+
+
+# --- Session Membership Filter ---
+# A Bloom filter of every session id in the users table, shared between workers through a memory-mapped file (or
+# held in process memory for the "local" backend). A negative answer means the cookie was never issued, so forged
+# or unknown ids are rejected without a query; ids this worker has already confirmed are remembered in a bounded
+# LRU set so the common case never touches the DB either.
+SESSION_FILTER_FILE = f"{DB_NAME}.sessions"
+SESSION_FILTER_BITS = 1 << 24  # 2 MB; ~1% false positives at 1.7M sessions
+SESSION_FILTER_HASHES = 7
+KNOWN_SESSIONS_MAX_ENTRIES = 50000
+
+
+class SessionBloomFilter:
+    def __init__(self, bits: int = SESSION_FILTER_BITS, hashes: int = SESSION_FILTER_HASHES, path: str = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.path = path  # None keeps the filter in process memory
+        self._fd = None
+        self._bitmap = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._bitmap is None:
+                if self.path is None:
+                    self._bitmap = bytearray(self.bits // 8)
+                else:
+                    self._fd, self._bitmap = map_shared_file(self.path, self.bits // 8)
+                    logger.info(f"Mapped session membership filter {self.path} ({self.bits} bits)")
+        return self._bitmap
+
+    def _positions(self, session_id: str):
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def might_contain(self, session_id: str) -> bool:
+        bitmap = self._bitmap or self._open()
+        return all(bitmap[position >> 3] & (1 << (position & 7)) for position in self._positions(session_id))
+
+    def add(self, session_id: str):
+        bitmap = self._bitmap or self._open()
+        positions = self._positions(session_id)
+        with self._lock:
+            # Setting a bit is a read-modify-write of its byte; lock the file so workers can't drop each other's bits.
+            if self._fd is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                for position in positions:
+                    bitmap[position >> 3] |= 1 << (position & 7)
+            finally:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._bitmap.close()
+                os.close(self._fd)
+                self._fd = None
+            self._bitmap = None
+
+
+class KnownSessionSet:
+    def __init__(self, max_entries: int = KNOWN_SESSIONS_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._session_ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._session_ids:
+                return False
+            self._session_ids.move_to_end(session_id)
+            return True
+
+    def add(self, session_id: str):
+        with self._lock:
+            self._session_ids[session_id] = None
+            self._session_ids.move_to_end(session_id)
+            while len(self._session_ids) > self.max_entries:
+                self._session_ids.popitem(last=False)
+
+
+def create_session_filter() -> SessionBloomFilter:
+    if SESSION_STORE_BACKEND == "shared_memory" and fcntl is not None:
+        return SessionBloomFilter(path=SESSION_FILTER_FILE)
+    return SessionBloomFilter()
+
+
+SESSION_FILTER = create_session_filter()
+KNOWN_SESSIONS = KnownSessionSet()
+SESSION_MEMBERSHIP_STATS = {'filter_rejections': 0, 'known_hits': 0, 'db_checks': 0}
+
+
+def warm_session_filter():
+    def load_session_ids(conn):
+        count = 0
+        for (session_id,) in conn.execute("SELECT session_id FROM users"):
+            SESSION_FILTER.add(session_id)
+            count += 1
+        return count
+
+    logger.info(f"Warmed session membership filter with {run_db(load_session_ids)} sessions.")
 
 
 # --- DB Helper Class for User Session Management ---
 class UserSessionManager:
     @staticmethod
     def create_user_session_db(session_id: str):
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
         try:
-            cursor.execute("INSERT INTO users (session_id, skills, goals, conversation_context) VALUES (?, ?, ?, ?)",
-                           (session_id, json.dumps([]), json.dumps([]), json.dumps({'current_stage': 'greeting'})))
-            conn.commit()
+            run_db(lambda conn: conn.execute(
+                "INSERT INTO users (session_id, skills, goals, skills_bitset, current_stage, conversation_context) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, json.dumps([]), json.dumps([]), CATALOG.skills.to_blob(0), 'greeting', json.dumps({}))),
+                commit=True)
             logger.info(f"Created new user session in DB: {session_id}")
         except sqlite3.IntegrityError:
             logger.warning(f"Session {session_id} already exists in DB, insert failed.")
-        finally:
-            conn.close()
+        SESSION_FILTER.add(session_id)
+        KNOWN_SESSIONS.add(session_id)
 
     @staticmethod
     def session_exists_in_db(session_id: str) -> bool:
         if not session_id: return False
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM users WHERE session_id = ?", (session_id,))
-        exists = cursor.fetchone() is not None
-        conn.close()
+        if not SESSION_FILTER.might_contain(session_id):
+            SESSION_MEMBERSHIP_STATS['filter_rejections'] += 1
+            return False
+        if session_id in KNOWN_SESSIONS:
+            SESSION_MEMBERSHIP_STATS['known_hits'] += 1
+            return True
+        SESSION_MEMBERSHIP_STATS['db_checks'] += 1
+        exists = run_db(lambda conn: conn.execute(
+            "SELECT 1 FROM users WHERE session_id = ?", (session_id,)).fetchone()) is not None
+        if exists:
+            KNOWN_SESSIONS.add(session_id)
         return exists
 
 
 # --- Main Execution ---
 if __name__ == "__main__":
-     logger.info("Initializing IntelliCoach Pro for LOCAL development...")
+    logger.info("Initializing IntelliCoach Pro for LOCAL development...")
     # Ensure local DB_NAME is set correctly if different from /tmp/
     # e.g., DB_NAME = "career_coach.db" # if you uncomment this at the top for local
     init_db()
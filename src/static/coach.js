@@ -0,0 +1,345 @@
+const chatMessagesArea = document.getElementById('chatMessagesArea');
+const userInput = document.getElementById('userInput');
+const sendButton = document.getElementById('sendButton');
+const userNameDisplay = document.getElementById('userNameDisplay');
+let typingIndicatorElement = null;
+
+function escapeHtml(unsafe) {
+    if (typeof unsafe !== 'string') return unsafe;
+    return unsafe
+         .replace(/&/g, "&amp;")
+         .replace(/</g, "&lt;")
+         .replace(/>/g, "&gt;")
+         .replace(/"/g, "&quot;")
+         .replace(/'/g, "&#039;");
+}
+
+function renderClientMarkdown(md) {
+    if (typeof md !== 'string') return md;
+    let html = escapeHtml(md); 
+    // Bold
+    html = html.replace(/\*\*([^*]+)\*\*/g, '<strong>$1</strong>')
+               .replace(/__([^_]+)__/g, '<strong>$1</strong>');
+    // Italics - carefully to avoid parts of bold
+    html = html.replace(/(?<![a-zA-Z0-9*])\*(?!\s|\*)([^\*\n]+?)(?<!\s|\*)\*(?![a-zA-Z0-9*])/g, '<em>$1</em>')
+               .replace(/(?<![a-zA-Z0-9_])_(?!\s|_)([^_\n]+?)(?<!\s|_)_(?![a-zA-Z0-9_])/g, '<em>$1</em>');
+
+    // Headers
+    html = html.replace(/^### (.*$)/gim, '<h3>$1</h3>');
+
+    // Lists
+    html = html.replace(/^[-*+]\s+(.*$)/gim, '<li>$1</li>');
+
+    // Function to wrap list items
+    function clientWrapListItems(match) {
+        let itemsContent = match.replace(/<\/li>\s*(<br\s*\/?>\s*)+\s*<li>/gi, '</li><li>');
+        itemsContent = itemsContent.replace(/^\s*(<br\s*\/?>\s*)+|(<br\s*\/?>\s*)+\s*$/g, '');
+        return `<ul>${itemsContent}</ul>`;
+    }
+    html = html.replace(/(?:<li>.*?<\/li>\s*(?:<br\s*\/?>\s*)*)+/gs, clientWrapListItems);
+
+    // Links
+    html = html.replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank" rel="noopener noreferrer">$1</a>');
+    // Code
+    html = html.replace(/`([^`]+)`/g, '<code>$1</code>');
+    // Newlines
+    html = html.replace(/\n/g, '<br>');
+    // Cleanup <br> tags
+    html = html.replace(/<ul>(<br\s*\/?>\s*)+/g, '<ul>');
+    html = html.replace(/(<br\s*\/?>\s*)+<\/ul>/g, '</ul>');
+    html = html.replace(/<li>(<br\s*\/?>\s*)+/g, '<li>');
+    html = html.replace(/(<br\s*\/?>\s*)+<\/li>/g, '</li>');
+    return html;
+}
+
+function showTypingIndicator() {
+    if (!typingIndicatorElement) {
+        typingIndicatorElement = document.createElement('div');
+        typingIndicatorElement.classList.add('message', 'ai-message', 'typing-indicator'); 
+        typingIndicatorElement.innerHTML = `<div><span></span><span></span><span></span></div>`;
+        chatMessagesArea.appendChild(typingIndicatorElement);
+    }
+    typingIndicatorElement.style.display = 'flex'; 
+    scrollToBottom();
+}
+
+function hideTypingIndicator() {
+    if (typingIndicatorElement) {
+        typingIndicatorElement.style.display = 'none';
+    }
+}
+
+function removeAllQuickReplies() {
+     document.querySelectorAll('.quick-replies-container').forEach(el => el.remove());
+}
+
+function addMessageToChat(content, sender, type = 'text', metadata = null) {
+    if (sender === 'user' || (sender === 'ai' && (!metadata || !metadata.quick_replies))) {
+         removeAllQuickReplies(); 
+    }
+
+    const messageWrapper = document.createElement('div');
+    messageWrapper.classList.add('message', sender + '-message');
+    messageWrapper.dataset.type = type;
+    if (metadata && typeof metadata === 'object') {
+         messageWrapper.dataset.metadata = JSON.stringify(metadata);
+    }
+
+    const messageContentElement = document.createElement('div');
+    messageContentElement.innerHTML = (sender === 'user') ? escapeHtml(content) : renderClientMarkdown(content);
+
+    messageWrapper.appendChild(messageContentElement);
+    chatMessagesArea.appendChild(messageWrapper);
+
+    if (sender === 'ai' && type === 'quick_reply_prompt' && metadata && metadata.quick_replies && metadata.quick_replies.length > 0) {
+        const quickRepliesContainer = document.createElement('div');
+        quickRepliesContainer.classList.add('quick-replies-container');
+        metadata.quick_replies.forEach(replyText => {
+            const button = document.createElement('button');
+            button.classList.add('quick-reply-button');
+            button.textContent = replyText;
+            button.onclick = () => handleQuickReply(replyText);
+            quickRepliesContainer.appendChild(button);
+        });
+        chatMessagesArea.appendChild(quickRepliesContainer); 
+    }
+    scrollToBottom();
+}
+
+function scrollToBottom() {
+    requestAnimationFrame(() => {
+         chatMessagesArea.scrollTop = chatMessagesArea.scrollHeight;
+    });
+}
+
+// Messages go over one WebSocket per page when it is open, and through POST /chat otherwise.
+const CHAT_SOCKET_MAX_RETRY_MS = 30000;
+const CHAT_SOCKET_REPLY_TIMEOUT_MS = 10000;
+let chatSocket = null;
+let chatSocketRetryMs = 1000;
+let nextChatFrameId = 1;
+const pendingChatFrames = new Map();
+
+function connectChatSocket() {
+    if (!('WebSocket' in window)) return;
+    const socket = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/ws`);
+    let opened = false;
+    socket.onopen = () => {
+        opened = true;
+        chatSocket = socket;
+        chatSocketRetryMs = 1000;
+    };
+    socket.onmessage = event => {
+        const data = JSON.parse(event.data);
+        const pending = pendingChatFrames.get(data.id);
+        if (!pending) return;
+        pendingChatFrames.delete(data.id);
+        if (data.error) pending.reject(new Error(data.error));
+        else pending.resolve(data);
+    };
+    socket.onclose = () => {
+        if (chatSocket === socket) chatSocket = null;
+        // A message in flight may or may not have been processed, so it is reported rather than resent.
+        pendingChatFrames.forEach(pending => pending.reject(new Error('Connection closed.')));
+        pendingChatFrames.clear();
+        // A refused handshake (e.g. an expired session) leaves the page on /chat, which reports the error itself.
+        if (!opened) return;
+        setTimeout(connectChatSocket, chatSocketRetryMs);
+        chatSocketRetryMs = Math.min(chatSocketRetryMs * 2, CHAT_SOCKET_MAX_RETRY_MS);
+    };
+}
+
+function sendChatFrame(socket, messageText) {
+    const id = nextChatFrameId++;
+    return new Promise((resolve, reject) => {
+        const timer = setTimeout(() => {
+            pendingChatFrames.delete(id);
+            const error = new Error('No reply over the chat socket.');
+            error.timedOut = true;
+            reject(error);
+            // A socket that stops answering is dropped; it reconnects with backoff, and /chat serves meanwhile.
+            socket.close();
+        }, CHAT_SOCKET_REPLY_TIMEOUT_MS);
+        pendingChatFrames.set(id, {
+            resolve: data => { clearTimeout(timer); resolve(data); },
+            reject: error => { clearTimeout(timer); reject(error); }
+        });
+        socket.send(JSON.stringify({ id: id, message: messageText }));
+    });
+}
+
+async function sendChatMessage(messageText) {
+    if (chatSocket && chatSocket.readyState === WebSocket.OPEN) {
+        try {
+            return await sendChatFrame(chatSocket, messageText);
+        } catch (error) {
+            if (!error.timedOut) throw error;
+            console.warn('Chat socket timed out; retrying over /chat.');
+        }
+    }
+
+    const response = await fetch('/chat', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
+        body: new URLSearchParams({ 'message': messageText })
+    });
+    if (!response.ok) {
+        const errorData = await response.json().catch(() => ({detail: "An unknown error occurred."}));
+        const error = new Error(`HTTP error! Status: ${response.status}`);
+        error.status = response.status;
+        error.detail = errorData.detail;
+        throw error;
+    }
+    return response.json();
+}
+
+function showChatReply(data) {
+    addMessageToChat(data.reply, 'ai', data.type, data.metadata);
+    if (data.profile_update && data.profile_update.name) {
+        userNameDisplay.textContent = data.profile_update.name;
+    }
+}
+
+function handleQuickReply(replyText) {
+    addMessageToChat(replyText, 'user'); 
+    userInput.value = ''; 
+    userInput.disabled = true;
+    sendButton.disabled = true;
+    showTypingIndicator();
+
+    removeAllQuickReplies();
+
+    sendChatMessage(replyText)
+    .then(showChatReply)
+    .catch(error => {
+        console.error('Error sending quick reply:', error);
+        addMessageToChat('Sorry, I encountered an issue. Please try again.', 'ai');
+    })
+    .finally(() => {
+        hideTypingIndicator();
+        userInput.disabled = false;
+        sendButton.disabled = false;
+        userInput.focus();
+    });
+}
+
+async function handleSendMessage() {
+    const messageText = userInput.value.trim();
+    if (messageText === '') return;
+
+    addMessageToChat(messageText, 'user');
+    userInput.value = '';
+    userInput.disabled = true;
+    sendButton.disabled = true;
+    showTypingIndicator();
+
+    removeAllQuickReplies();
+
+    try {
+        showChatReply(await sendChatMessage(messageText));
+    } catch (error) {
+        console.error('Error sending message:', error);
+        if (error.status) {
+            addMessageToChat(`Error: ${error.status} - ${error.detail || "Could not reach advisor."}`, 'ai');
+        } else {
+            addMessageToChat('Oops! I seem to be having trouble connecting. Please check your connection or try again.', 'ai');
+        }
+    } finally {
+        hideTypingIndicator();
+        userInput.disabled = false;
+        sendButton.disabled = false;
+        userInput.focus();
+    }
+}
+
+sendButton.addEventListener('click', handleSendMessage);
+userInput.addEventListener('keypress', (event) => {
+    if (event.key === 'Enter' && !event.shiftKey) {
+        event.preventDefault();
+        handleSendMessage();
+    }
+});
+
+let loadingOlderMessages = false;
+
+function createHistoryMessageElement(message) {
+    const messageWrapper = document.createElement('div');
+    messageWrapper.classList.add('message', message.sender === 'user' ? 'user-message' : 'ai-message');
+    messageWrapper.dataset.id = message.id;
+    messageWrapper.dataset.type = message.type;
+    if (message.metadata && Object.keys(message.metadata).length > 0) {
+        messageWrapper.dataset.metadata = JSON.stringify(message.metadata);
+    }
+    const messageContentElement = document.createElement('div');
+    messageContentElement.innerHTML = message.html;
+    messageWrapper.appendChild(messageContentElement);
+    return messageWrapper;
+}
+
+async function loadOlderMessages() {
+    if (loadingOlderMessages || chatMessagesArea.dataset.hasMore !== 'true') return;
+    loadingOlderMessages = true;
+    try {
+        const response = await fetch(`/history?before_id=${encodeURIComponent(chatMessagesArea.dataset.oldestId)}`);
+        if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
+        const data = await response.json();
+
+        // Keep the viewport anchored on the message the user was reading while older ones are prepended.
+        const previousScrollHeight = chatMessagesArea.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(message => fragment.appendChild(createHistoryMessageElement(message)));
+        chatMessagesArea.insertBefore(fragment, chatMessagesArea.firstChild);
+        chatMessagesArea.scrollTop += chatMessagesArea.scrollHeight - previousScrollHeight;
+
+        if (data.messages.length > 0) chatMessagesArea.dataset.oldestId = data.messages[0].id;
+        chatMessagesArea.dataset.hasMore = data.has_more ? 'true' : 'false';
+    } catch (error) {
+        console.error('Error loading older messages:', error);
+    } finally {
+        loadingOlderMessages = false;
+    }
+}
+
+chatMessagesArea.addEventListener('scroll', () => {
+    if (chatMessagesArea.scrollTop < 80) loadOlderMessages();
+});
+
+function processInitialMessagesForQuickReplies() {
+    const aiMessages = Array.from(chatMessagesArea.querySelectorAll('.message.ai-message'));
+    const lastAIMessage = aiMessages.pop(); 
+
+    if (lastAIMessage) {
+        const type = lastAIMessage.dataset.type;
+        const metadataString = lastAIMessage.dataset.metadata;
+
+        if (type === 'quick_reply_prompt' && metadataString) {
+            try {
+                const metadata = JSON.parse(metadataString);
+                if (metadata && metadata.quick_replies && metadata.quick_replies.length > 0) {
+                    let nextSibling = lastAIMessage.nextElementSibling;
+                    if (!nextSibling || !nextSibling.classList.contains('quick-replies-container')) {
+                        const quickRepliesContainer = document.createElement('div');
+                        quickRepliesContainer.classList.add('quick-replies-container');
+                        metadata.quick_replies.forEach(replyText => {
+                            const button = document.createElement('button');
+                            button.classList.add('quick-reply-button');
+                            button.textContent = replyText;
+                            button.onclick = () => handleQuickReply(replyText);
+                            quickRepliesContainer.appendChild(button);
+                        });
+                        lastAIMessage.parentNode.insertBefore(quickRepliesContainer, lastAIMessage.nextSibling);
+                    }
+                }
+            } catch (e) {
+                console.error("Error parsing metadata for quick replies on load:", e, metadataString);
+            }
+        }
+    }
+}
+
+window.onload = () => {
+    connectChatSocket();
+    processInitialMessagesForQuickReplies(); 
+    scrollToBottom();
+    userInput.focus();
+};